@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of every stage of face recognition. Run them with `python -m benchmarks run` from the repository root.
+"""
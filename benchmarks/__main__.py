@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from collections import OrderedDict
+
+import click
+
+from . import batching, detection, encodings, landmarks, matching, scaling
+from .harness import Settings, compare, environment_differences, load_results, save_results
+
+SUITES = OrderedDict((module.SUITE, module) for module in (detection, landmarks, encodings, batching, matching, scaling))
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 1e-3:
+        return "{:.1f}us".format(seconds * 1e6)
+    if seconds < 1:
+        return "{:.2f}ms".format(seconds * 1e3)
+    return "{:.3f}s".format(seconds)
+
+
+def print_comparison(baseline, current, threshold):
+    """
+    Prints how every benchmark changed since the baseline run.
+
+    :return: the number of regressions
+    """
+    differences = environment_differences(baseline, current)
+    if differences:
+        click.echo("WARNING: the runs were made in different environments ({}), timings may not be comparable".format(", ".join(differences)), err=True)
+
+    rows = compare(baseline, current, threshold)
+    for row in rows:
+        ratio = "{:.2f}x".format(row["ratio"]) if row["ratio"] is not None else "-"
+        click.echo("{:<12} {:<60} {:>10} -> {:<10} {}".format(
+            row["status"].upper(), row["name"], _format_seconds(row["baseline"]), _format_seconds(row["current"]), ratio))
+
+    regressions = sum(1 for row in rows if row["status"] == "regression")
+    improvements = sum(1 for row in rows if row["status"] == "improvement")
+    click.echo("{} regression(s), {} improvement(s) at a {:.0%} threshold".format(regressions, improvements, threshold))
+    return regressions
+
+
+@click.group()
+def main():
+    """
+    Face recognition benchmarks. Results are written as JSON and can be compared to a baseline run to find regressions.
+    """
+
+
+@main.command()
+@click.option('--suite', 'suites', multiple=True, type=click.Choice(list(SUITES)), help='Suite to run. Can be given several times. Default: all suites.')
+@click.option('--quick', is_flag=True, help='Only run the smaller configurations with fewer repeats.')
+@click.option('--repeat', default=None, type=int, help='How many timings to take of each benchmark.')
+@click.option('--min-time', default=None, type=float, help='The minimum number of seconds each timing should take.')
+@click.option('--output', '-o', default='benchmark_results.json', help='JSON file to write the results to, or - for stdout.')
+@click.option('--baseline', default=None, type=click.Path(exists=True, dir_okay=False), help='Earlier results to compare the run to.')
+@click.option('--threshold', default=0.1, help='How much slower a benchmark has to get to count as a regression. Default 0.1 (10%).')
+def run(suites, quick, repeat, min_time, output, baseline, threshold):
+    """
+    Runs the benchmarks and saves their results.
+    """
+    settings = Settings(quick=quick, repeat=repeat, min_time=min_time)
+    results = []
+
+    for suite in suites or SUITES:
+        click.echo("{}:".format(suite), err=True)
+        for record in SUITES[suite].run(settings):
+            click.echo("  {:<60} {:>10} ({:.2f} {}/s)".format(
+                record["name"], _format_seconds(record["median"]), record["per_second"], record["unit"]), err=True)
+            results.append(record)
+
+    current = save_results(output, results, settings)
+
+    if baseline:
+        if print_comparison(load_results(baseline), current, threshold):
+            sys.exit(1)
+
+
+@main.command(name="compare")
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('current', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', default=0.1, help='How much slower a benchmark has to get to count as a regression. Default 0.1 (10%).')
+def compare_command(baseline, current, threshold):
+    """
+    Compares two saved runs. Exits with status 1 if anything got slower.
+    """
+    if print_comparison(load_results(baseline), load_results(current), threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
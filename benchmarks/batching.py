@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import face_recognition
+
+from .harness import load_image, measure, result
+
+SUITE = "batching"
+
+
+def run(settings):
+    """
+    Batched versus one call per image: batch_face_encodings() against face_encodings() in a loop, and
+    batch_face_locations() against face_locations(model="cnn") in a loop, on a mix of image sizes.
+    """
+    image_count = 8 if settings.quick else 32
+    sizes = settings.image_sizes
+    images = [load_image(sizes[index % len(sizes)]) for index in range(image_count)]
+    locations = [face_recognition.face_locations(image) for image in images]
+
+    def unbatched_encodings():
+        return [face_recognition.face_encodings(image, image_locations) for image, image_locations in zip(images, locations)]
+
+    def batched_encodings():
+        return face_recognition.batch_face_encodings(images, locations)
+
+    timing = measure(unbatched_encodings, settings.repeat, settings.min_time)
+    yield result(SUITE, "encodings/unbatched/images={}".format(image_count), timing, items=image_count, unit="image")
+
+    timing = measure(batched_encodings, settings.repeat, settings.min_time)
+    yield result(SUITE, "encodings/batched/images={}".format(image_count), timing, items=image_count, unit="image")
+
+    # The cnn detector is slow without a GPU, so only the smallest images are used for it
+    cnn_images = [load_image(sizes[0])] * image_count
+
+    def unbatched_locations():
+        return [face_recognition.face_locations(image, 0, "cnn") for image in cnn_images]
+
+    def batched_locations():
+        return face_recognition.batch_face_locations(cnn_images, 0, batch_size=image_count)
+
+    timing = measure(unbatched_locations, settings.repeat, settings.min_time)
+    yield result(SUITE, "cnn_locations/unbatched/images={}".format(image_count), timing, items=image_count, unit="image")
+
+    timing = measure(batched_locations, settings.repeat, settings.min_time)
+    yield result(SUITE, "cnn_locations/batched/images={}".format(image_count), timing, items=image_count, unit="image")
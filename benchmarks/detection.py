@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import multiprocessing
+
+import face_recognition
+
+from .harness import load_image, measure, result
+
+SUITE = "detection"
+
+
+def run(settings):
+    """
+    Face detection with the HOG and CNN models at every image size and number of upsamples.
+
+    Detection time grows with the number of pixels searched, so it gets a lot slower with image size and upsampling
+    (every upsample doubles the width and height). The CNN model is much slower than HOG on a CPU.
+
+    The largest image is also detected in 2x4 tiles, one tile at a time and on one thread per CPU.
+    """
+    configurations = [("hog", upsample) for upsample in (0, 1, 2)] + [("cnn", upsample) for upsample in (0, 1)]
+
+    for size in settings.image_sizes:
+        image = load_image(size)
+        for model, upsample in configurations:
+            if settings.quick and model == "cnn" and size != settings.image_sizes[0]:
+                continue
+
+            timing = measure(lambda: face_recognition.face_locations(image, upsample, model), settings.repeat, settings.min_time)
+            faces = len(face_recognition.face_locations(image, upsample, model))
+            yield result(SUITE, "{}/upsample={}/{}".format(model, upsample, size), timing, unit="image", faces=faces)
+
+    size = settings.image_sizes[-1]
+    image = load_image(size)
+    with concurrent.futures.ThreadPoolExecutor(multiprocessing.cpu_count()) as pool:
+        for name, tile_pool in (("serial", None), ("threads", pool)):
+            timing = measure(lambda: face_recognition.face_locations(image, 1, tiles=(2, 4), pool=tile_pool), settings.repeat, settings.min_time)
+            faces = len(face_recognition.face_locations(image, 1, tiles=(2, 4), pool=tile_pool))
+            yield result(SUITE, "hog/upsample=1/tiles=2x4/{}/{}".format(name, size), timing, unit="image", faces=faces)
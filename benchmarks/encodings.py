@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import face_recognition
+
+from .harness import load_image, measure, result
+
+SUITE = "encodings"
+
+
+def run(settings):
+    """
+    Encoding already detected faces with different numbers of jitters (every jitter is one more pass through the
+    network), and end-to-end detection plus encoding of a whole image.
+    """
+    jitters = (1, 10) if settings.quick else (1, 10, 100)
+
+    for size in settings.image_sizes:
+        image = load_image(size)
+        locations = face_recognition.face_locations(image)
+
+        for num_jitters in jitters:
+            timing = measure(lambda: face_recognition.face_encodings(image, locations, num_jitters), settings.repeat, settings.min_time)
+            yield result(SUITE, "jitters={}/{}".format(num_jitters, size), timing, items=len(locations), unit="face")
+
+        timing = measure(lambda: face_recognition.face_encodings(image), settings.repeat, settings.min_time)
+        yield result(SUITE, "end_to_end/{}".format(size), timing, unit="image")
+
+        timing = measure(lambda: face_recognition.detect_and_encode(image), settings.repeat, settings.min_time)
+        yield result(SUITE, "detect_and_encode/{}".format(size), timing, unit="image")
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+IMAGES_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+IMAGE_SIZES = ["240p", "480p", "720p", "1080p"]
+
+
+def image_path(size):
+    """
+    Returns the path of the benchmark image of the given size, i.e. "480p".
+    """
+    return os.path.join(IMAGES_DIRECTORY, "obama-{}.jpg".format(size))
+
+
+_images = {}
+
+
+def load_image(size):
+    """
+    Loads the benchmark image of the given size, only reading it from disk the first time.
+    """
+    if size not in _images:
+        import face_recognition
+        _images[size] = face_recognition.load_image_file(image_path(size))
+    return _images[size]
+
+
+class Settings(object):
+    """
+    What a benchmark run should cover and how long each measurement should take.
+    """
+
+    def __init__(self, quick=False, repeat=None, min_time=None):
+        """
+        :param quick: only run the smaller configurations, i.e. to check nothing is broken before a full run
+        :param repeat: how many times to time each benchmark. The median is what gets compared.
+        :param min_time: each timing runs the benchmark as many times as needed to take at least this many seconds
+        """
+        self.quick = quick
+        self.repeat = repeat or (3 if quick else 7)
+        self.min_time = min_time if min_time is not None else (0.05 if quick else 0.2)
+
+    @property
+    def image_sizes(self):
+        return IMAGE_SIZES[:2] if self.quick else IMAGE_SIZES
+
+
+def measure(function, repeat=7, min_time=0.2):
+    """
+    Times a function like timeit does: the number of calls per timing is picked so that one timing takes at least
+    min_time seconds, then the timing is repeated.
+
+    :param function: the function to time, called without arguments
+    :param repeat: how many timings to take
+    :param min_time: the minimum number of seconds one timing should take
+    :return: a dict of the median, best, mean and standard deviation of the seconds per call, and how it was measured
+    """
+    # The first call also warms up whatever is loaded lazily (models, caches, ...), so it doesn't count
+    start = time.perf_counter()
+    function()
+    first_call = time.perf_counter() - start
+
+    number = max(1, int(math.ceil(min_time / first_call))) if first_call > 0 else 1000
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+
+    return {
+        "median": statistics.median(timings),
+        "best": min(timings),
+        "mean": statistics.mean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def result(suite, name, timing, items=1, unit="call", **extra):
+    """
+    Builds the record of one benchmark.
+
+    :param suite: the name of the suite the benchmark belongs to
+    :param name: a name identifying the benchmark within its suite, including its parameters (i.e. "hog/upsample=1/480p")
+    :param timing: the dict returned by measure()
+    :param items: how many units of work one call processes, to report a throughput
+    :param unit: what one unit of work is, i.e. "image" or "query"
+    :param extra: anything else worth recording, i.e. a recall or a speedup. Must be JSON serializable.
+    :return: a dict
+    """
+    record = {
+        "name": "{}/{}".format(suite, name),
+        "suite": suite,
+        "unit": unit,
+        "items": items,
+        "per_second": items / timing["median"] if timing["median"] > 0 else float("inf"),
+    }
+    record.update(timing)
+    if extra:
+        record["extra"] = extra
+    return record
+
+
+def _version(module_name):
+    try:
+        module = __import__(module_name)
+    except ImportError:
+        return None
+    return getattr(module, "__version__", None) or getattr(module, "DLIB_VERSION", None)
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(IMAGES_DIRECTORY), stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode("ascii").strip()
+
+
+def environment():
+    """
+    Describes the machine and library versions a run was made on, since timings are only comparable between runs made
+    on the same kind of machine.
+    """
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "dlib": _version("dlib"),
+        "face_recognition": _version("face_recognition"),
+    }
+
+
+def save_results(file, results, settings):
+    """
+    Writes the results of a run, and what it was run on, to a JSON file. Use - for stdout.
+
+    :return: the document that was written
+    """
+    document = {
+        "environment": environment(),
+        "settings": {"quick": settings.quick, "repeat": settings.repeat, "min_time": settings.min_time},
+        "results": results,
+    }
+
+    if file == "-":
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(file, "w") as f:
+            json.dump(document, f, indent=2)
+
+    return document
+
+
+def load_results(file):
+    with open(file) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares the median time of every benchmark in a run to a baseline run.
+
+    :param baseline: a run loaded with load_results()
+    :param current: a run loaded with load_results()
+    :param threshold: the fraction by which a benchmark has to get slower to count as a regression (or faster to
+                      count as an improvement). Differences within the noise of either run are never flagged.
+    :return: a list of dicts with the name, baseline and current median, ratio (current / baseline) and status of
+             every benchmark in either run. The status is "regression", "improvement", "unchanged", "new" or "missing".
+    """
+    baseline_results = dict((record["name"], record) for record in baseline["results"])
+    current_results = dict((record["name"], record) for record in current["results"])
+
+    rows = []
+    for name in list(baseline_results) + [name for name in current_results if name not in baseline_results]:
+        before = baseline_results.get(name)
+        after = current_results.get(name)
+        row = {
+            "name": name,
+            "baseline": before["median"] if before else None,
+            "current": after["median"] if after else None,
+            "ratio": None,
+        }
+
+        if before is None:
+            row["status"] = "new"
+        elif after is None:
+            row["status"] = "missing"
+        else:
+            row["ratio"] = after["median"] / before["median"] if before["median"] > 0 else float("inf")
+            noise = 2 * max(before.get("stdev", 0.0), after.get("stdev", 0.0))
+            difference = after["median"] - before["median"]
+
+            if abs(difference) <= noise:
+                row["status"] = "unchanged"
+            elif row["ratio"] > 1 + threshold:
+                row["status"] = "regression"
+            elif row["ratio"] < 1 - threshold:
+                row["status"] = "improvement"
+            else:
+                row["status"] = "unchanged"
+
+        rows.append(row)
+
+    return rows
+
+
+def environment_differences(baseline, current):
+    """
+    Returns the names of the environment fields (other than date and commit) that differ between two runs.
+    """
+    ignored = ("date", "git_commit")
+    before = baseline.get("environment", {})
+    after = current.get("environment", {})
+    return sorted(key for key in set(before) | set(after) if key not in ignored and before.get(key) != after.get(key))
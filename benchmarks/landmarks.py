@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import face_recognition
+
+from .harness import load_image, measure, result
+
+SUITE = "landmarks"
+
+
+def run(settings):
+    """
+    Finding the 5-point ("small") and 68-point ("large") landmarks of already detected faces, both as the dicts returned
+    by face_landmarks() and as the array returned by face_landmarks_array().
+    """
+    for size in settings.image_sizes:
+        image = load_image(size)
+        locations = face_recognition.face_locations(image)
+
+        for model in ("small", "large"):
+            timing = measure(lambda: face_recognition.face_landmarks(image, locations, model), settings.repeat, settings.min_time)
+            yield result(SUITE, "dict/{}/{}".format(model, size), timing, items=len(locations), unit="face")
+
+            timing = measure(lambda: face_recognition.face_landmarks_array(image, locations, model), settings.repeat, settings.min_time)
+            yield result(SUITE, "array/{}/{}".format(model, size), timing, items=len(locations), unit="face")
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import math
+import time
+
+import numpy as np
+
+import face_recognition
+
+from .harness import measure, result
+
+SUITE = "matching"
+QUERIES = 16
+
+
+def synthetic_gallery(size, dimensions=128, encodings_per_person=8, random_state=0):
+    """
+    Makes a gallery of random encodings that look like real ones to a nearest neighbor search: a few encodings per
+    person scattered around that person's own point, at roughly the distances real face encodings have.
+
+    :return: a float32 numpy array of shape (size, dimensions)
+    """
+    random = np.random.RandomState(random_state)
+    people = random.normal(0, 0.09, (int(math.ceil(size / float(encodings_per_person))), dimensions)).astype(np.float32)
+
+    gallery = np.repeat(people, encodings_per_person, axis=0)[:size]
+    gallery += random.normal(0, 0.02, gallery.shape).astype(np.float32)
+    return gallery
+
+
+def _queries(gallery, random_state=1):
+    random = np.random.RandomState(random_state)
+    rows = random.randint(0, len(gallery), QUERIES)
+    return gallery[rows] + random.normal(0, 0.02, (QUERIES, gallery.shape[1])).astype(np.float32)
+
+
+def _recall(rows, exact_rows):
+    return float(np.mean(rows[:, 0] == exact_rows[:, 0]))
+
+
+def run(settings):
+    """
+    Matching a batch of faces against galleries of 10 up to a million known encodings: face_distance() once per face,
+    face_distance_matrix() for the whole batch, FaceIndex, int8 QuantizedEncodings and, from 10,000 encodings on,
+    an IVFIndex. The recall of the approximate searches is recorded next to their timings.
+    """
+    gallery_sizes = [10 ** exponent for exponent in range(1, 5 if settings.quick else 7)]
+
+    for size in gallery_sizes:
+        gallery = synthetic_gallery(size)
+        queries = _queries(gallery)
+
+        def face_distance_per_query():
+            return [face_recognition.face_distance(gallery, query) for query in queries]
+
+        timing = measure(face_distance_per_query, settings.repeat, settings.min_time)
+        yield result(SUITE, "face_distance/size={}".format(size), timing, items=QUERIES, unit="query")
+
+        timing = measure(lambda: face_recognition.face_distance_matrix(queries, gallery), settings.repeat, settings.min_time)
+        yield result(SUITE, "face_distance_matrix/size={}".format(size), timing, items=QUERIES, unit="query")
+
+        index = face_recognition.FaceIndex(capacity=size)
+        for person, start in enumerate(range(0, size, 1000)):
+            index.add(person, gallery[start:start + 1000])
+        exact_rows, _ = index.search(queries)
+
+        timing = measure(lambda: index.search(queries), settings.repeat, settings.min_time)
+        yield result(SUITE, "face_index/size={}".format(size), timing, items=QUERIES, unit="query")
+
+        quantized = face_recognition.QuantizedEncodings.from_encodings(gallery, "int8")
+        rows, _ = quantized.search(queries)
+        timing = measure(lambda: quantized.search(queries), settings.repeat, settings.min_time)
+        yield result(SUITE, "int8/size={}".format(size), timing, items=QUERIES, unit="query",
+                     recall=_recall(rows, exact_rows), nbytes=quantized.nbytes)
+
+        if size >= 10000:
+            n_lists = int(math.sqrt(size))
+            ivf = face_recognition.IVFIndex(n_lists=n_lists, nprobe=8)
+            start = time.perf_counter()
+            ivf.train(gallery, iterations=10)
+            ivf.add(gallery)
+            ivf.search(queries[:1])
+            build_seconds = time.perf_counter() - start
+
+            rows, _ = ivf.search(queries)
+            timing = measure(lambda: ivf.search(queries), settings.repeat, settings.min_time)
+            yield result(SUITE, "ivf/nprobe=8/size={}".format(size), timing, items=QUERIES, unit="query",
+                         recall=_recall(rows, exact_rows), n_lists=n_lists, build_seconds=build_seconds)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import multiprocessing
+
+import face_recognition
+from face_recognition.parallel import imap_in_process_pool, process_pool
+
+from .harness import image_path, measure, result
+
+SUITE = "scaling"
+SIZE = "480p"
+
+
+def _encode_file(file):
+    # Runs in the worker processes, so it has to be a picklable module level function
+    image = face_recognition.load_image_file(file)
+    return len(face_recognition.face_encodings(image))
+
+
+def _worker_counts(maximum):
+    counts = [1]
+    while counts[-1] * 2 <= maximum:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != maximum:
+        counts.append(maximum)
+    return counts
+
+
+def run(settings):
+    """
+    How the throughput of end-to-end encoding (load, detect and encode an image) scales with the number of worker
+    processes used by the CLIs, and of detection and encoding with the number of threads calling the library at once
+    (i.e. one thread per camera). The speedup over a single worker is recorded next to each timing.
+    """
+    process_counts = _worker_counts(multiprocessing.cpu_count())
+    files = [image_path(SIZE)] * (4 * process_counts[-1])
+    single_process = None
+
+    for number_of_cpus in process_counts:
+        with process_pool(number_of_cpus) as pool:
+            if pool is None:
+                def work():
+                    return [_encode_file(file) for file in files]
+            else:
+                def work():
+                    return list(imap_in_process_pool(_encode_file, files, number_of_cpus, chunksize=1, pool=pool))
+
+            timing = measure(work, settings.repeat, settings.min_time)
+
+        single_process = single_process or timing["median"]
+        yield result(SUITE, "processes={}/end_to_end/{}".format(number_of_cpus, SIZE), timing, items=len(files),
+                     unit="image", speedup=single_process / timing["median"])
+
+    thread_counts = [1, 2] if settings.quick else [1, 2, 4, 8]
+    image = face_recognition.load_image_file(image_path(SIZE))
+    locations = face_recognition.face_locations(image)
+
+    # One instance of every model per thread, loaded up front so loading doesn't count against the first timing
+    face_recognition.preload(["face_detector", "pose_predictor_5_point", "face_encoder"], instances=thread_counts[-1])
+
+    tasks = [
+        ("face_locations", lambda: face_recognition.face_locations(image)),
+        ("encodings", lambda: face_recognition.face_encodings(image, locations)),
+    ]
+    for name, task in tasks:
+        single_thread = None
+        for thread_count in thread_counts:
+            calls = 2 * thread_counts[-1]
+            with concurrent.futures.ThreadPoolExecutor(thread_count) as executor:
+                timing = measure(lambda: list(executor.map(lambda _: task(), range(calls))), settings.repeat, settings.min_time)
+
+            single_thread = single_thread or timing["median"]
+            yield result(SUITE, "threads={}/{}/{}".format(thread_count, name, SIZE), timing, items=calls, unit="image",
+                         speedup=single_thread / timing["median"])
@@ -14,7 +14,7 @@
 import face_recognition
 import cv2
 import time
-from scipy.spatial import distance as dist
+import numpy as np
 
 EYES_CLOSED_SECONDS = 5
 
@@ -27,7 +27,6 @@ def main():
     small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
     rgb_small_frame = small_frame[:, :, ::-1]
 
-    face_landmarks_list = face_recognition.face_landmarks(rgb_small_frame)
     process = True
 
     while True:
@@ -42,24 +41,22 @@ def main():
         # get the correct face landmarks
         
         if process:
-            face_landmarks_list = face_recognition.face_landmarks(rgb_small_frame)
-
-            # get eyes
-            for face_landmark in face_landmarks_list:
-                left_eye = face_landmark['left_eye']
-                right_eye = face_landmark['right_eye']
+            face_points = face_recognition.face_landmarks_array(rgb_small_frame)
 
+            # get eyes of every face at once, as (faces, 6, 2) arrays
+            left_eyes = face_points[:, face_recognition.FACE_LANDMARKS_68_POINT['left_eye']]
+            right_eyes = face_points[:, face_recognition.FACE_LANDMARKS_68_POINT['right_eye']]
+            ears_left = get_ear(left_eyes)
+            ears_right = get_ear(right_eyes)
 
+            for left_eye, right_eye, ear_left, ear_right in zip(left_eyes, right_eyes, ears_left, ears_right):
                 color = (255,0,0)
                 thickness = 2
 
-                cv2.rectangle(small_frame, left_eye[0], right_eye[-1], color, thickness)
+                cv2.rectangle(small_frame, tuple(left_eye[0].tolist()), tuple(right_eye[-1].tolist()), color, thickness)
 
                 cv2.imshow('Video', small_frame)
 
-                ear_left = get_ear(left_eye)
-                ear_right = get_ear(right_eye)
-
                 closed = ear_left < 0.2 and ear_right < 0.2
 
                 if (closed):
@@ -83,16 +80,17 @@ def main():
         if key == ord("q"):
             break
 
-def get_ear(eye):
+def get_ear(eyes):
 
+	# eyes is an array of shape (faces, 6, 2), so the eye aspect ratio of every face is computed at once
 	# compute the euclidean distances between the two sets of
 	# vertical eye landmarks (x, y)-coordinates
-	A = dist.euclidean(eye[1], eye[5])
-	B = dist.euclidean(eye[2], eye[4])
+	A = np.linalg.norm(eyes[:, 1] - eyes[:, 5], axis=1)
+	B = np.linalg.norm(eyes[:, 2] - eyes[:, 4], axis=1)
  
 	# compute the euclidean distance between the horizontal
 	# eye landmark (x, y)-coordinates
-	C = dist.euclidean(eye[0], eye[3])
+	C = np.linalg.norm(eyes[:, 0] - eyes[:, 3], axis=1)
  
 	# compute the eye aspect ratio
 	ear = (A + B) / (2.0 * C)
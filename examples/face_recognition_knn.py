@@ -43,7 +43,7 @@ from face_recognition.face_recognition_cli import image_files_in_folder
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
 
-def train(train_dir, model_save_path=None, n_neighbors=None, knn_algo='ball_tree', verbose=False):
+def train(train_dir, model_save_path=None, n_neighbors=None, knn_algo='ball_tree', verbose=False, cache=None):
     """
     Trains a k-nearest neighbors classifier for face recognition.
 
@@ -66,6 +66,7 @@ def train(train_dir, model_save_path=None, n_neighbors=None, knn_algo='ball_tree
     :param n_neighbors: (optional) number of neighbors to weigh in classification. Chosen automatically if not specified
     :param knn_algo: (optional) underlying data structure to support knn.default is ball_tree
     :param verbose: verbosity of training
+    :param cache: (optional) a face_recognition.EncodingCache so unchanged training images are not encoded again
     :return: returns knn classifier that was trained on the given data.
     """
     X = []
@@ -78,8 +79,16 @@ def train(train_dir, model_save_path=None, n_neighbors=None, knn_algo='ball_tree
 
         # Loop through each training image for the current person
         for img_path in image_files_in_folder(os.path.join(train_dir, class_dir)):
-            image = face_recognition.load_image_file(img_path)
-            face_bounding_boxes = face_recognition.face_locations(image)
+            def encode_training_image():
+                image = face_recognition.load_image_file(img_path)
+                boxes = face_recognition.face_locations(image)
+                # Only images with exactly one face are used, so don't spend time encoding the others
+                return boxes, face_recognition.face_encodings(image, known_face_locations=boxes) if len(boxes) == 1 else []
+
+            if cache is not None:
+                face_bounding_boxes, encodings = cache.get_or_compute_file(img_path, "knn_training", encode_training_image)
+            else:
+                face_bounding_boxes, encodings = encode_training_image()
 
             if len(face_bounding_boxes) != 1:
                 # If there are no people (or too many people) in a training image, skip the image.
@@ -87,7 +96,7 @@ def train(train_dir, model_save_path=None, n_neighbors=None, knn_algo='ball_tree
                     print("Image {} not suitable for training: {}".format(img_path, "Didn't find a face" if len(face_bounding_boxes) < 1 else "Found more than one face"))
             else:
                 # Add face encoding for current image to the training set
-                X.append(face_recognition.face_encodings(image, known_face_locations=face_bounding_boxes)[0])
+                X.append(encodings[0])
                 y.append(class_dir)
 
     # Determine how many neighbors to use for weighting in the KNN classifier
@@ -5,7 +5,8 @@ import numpy as np
 # This is a demo of running face recognition on live video from your webcam. It's a little more complicated than the
 # other example, but it includes some basic performance tweaks to make things run a lot faster:
 #   1. Process each video frame at 1/4 resolution (though still display it at full resolution)
-#   2. Only detect faces in every other frame of video.
+#   2. Only detect faces in as many frames of video as the computer can keep up with, while still showing the video
+#      at full speed (face_recognition.DetectionScheduler measures how long detection takes to decide that).
 
 # PLEASE NOTE: This example requires OpenCV (the `cv2` library) to be installed only to read from your webcam.
 # OpenCV is *not* required to use the face_recognition library. It's only required if you want to run this
@@ -36,14 +37,14 @@ known_face_names = [
 face_locations = []
 face_encodings = []
 face_names = []
-process_this_frame = True
+scheduler = face_recognition.DetectionScheduler(target_fps=30, max_staleness=0.5, levels=[(None, None)])
 
 while True:
     # Grab a single frame of video
     ret, frame = video_capture.read()
 
-    # Only process every other frame of video to save time
-    if process_this_frame:
+    # Only process the frames the scheduler picks, to save time
+    if scheduler.begin_frame()["detect"]:
         # Resize frame of video to 1/4 size for faster face recognition processing
         small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
 
@@ -51,8 +52,9 @@ while True:
         rgb_small_frame = small_frame[:, :, ::-1]
         
         # Find all the faces and face encodings in the current frame of video
-        face_locations = face_recognition.face_locations(rgb_small_frame)
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+        with scheduler.measure("detect"):
+            face_locations = face_recognition.face_locations(rgb_small_frame)
+            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
 
         face_names = []
         for face_encoding in face_encodings:
@@ -73,8 +75,6 @@ while True:
 
             face_names.append(name)
 
-    process_this_frame = not process_this_frame
-
 
     # Display the results
     for (top, right, bottom, left), name in zip(face_locations, face_names):
@@ -94,6 +94,7 @@ while True:
 
     # Display the resulting image
     cv2.imshow('Video', frame)
+    scheduler.end_frame()
 
     # Hit 'q' on the keyboard to quit!
     if cv2.waitKey(1) & 0xFF == ord('q'):
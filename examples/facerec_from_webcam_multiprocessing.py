@@ -1,10 +1,13 @@
 import face_recognition
+from face_recognition.frame_ring import FrameRing
 import cv2
-from multiprocessing import Process, Manager, cpu_count, set_start_method
+from multiprocessing import Event, Process, cpu_count, set_start_method
 import time
 import numpy
 import threading
 import platform
+import shutil
+import tempfile
 
 
 # This is a little bit complicated (but fast) example of running face recognition on live video from your webcam.
@@ -14,87 +17,65 @@ import platform
 # OpenCV is *not* required to use the face_recognition library. It's only required if you want to run this
 # specific demo. If you have trouble installing it, try any of the other demos that don't require it instead.
 
+# Frames are handed between the capture thread, the worker processes and the display loop through a ring of frame
+# slots in shared memory. Only slot numbers go through the queues between them, the frames themselves are never
+# copied or pickled. A slot goes from the capture thread to the CAPTURED stage, from a worker to the PROCESSED stage
+# and is released back to the ring once it has been displayed.
+CAPTURED = 0
+PROCESSED = 1
+
+
+# A thread used to capture frames.
+def capture(video_capture, frames, stop_event):
+    sequence = 0
+
+    while not stop_event.is_set():
+        acquired = frames.acquire(timeout=0)
+        if acquired is None:
+            # Every slot is busy: skip this frame instead of letting the video fall behind
+            video_capture.grab()
+            continue
+
+        # Grab a single frame of video straight into the shared memory slot
+        slot, frame = acquired
+        ret, image = video_capture.read(frame)
+        if not ret:
+            frames.release(slot)
+            stop_event.set()
+            break
+        if image is not frame:
+            numpy.copyto(frame, image)
 
-# Get next worker's id
-def next_id(current_id, worker_num):
-    if current_id == worker_num:
-        return 1
-    else:
-        return current_id + 1
-
-
-# Get previous worker's id
-def prev_id(current_id, worker_num):
-    if current_id == 1:
-        return worker_num
-    else:
-        return current_id - 1
-
-
-# A subprocess use to capture frames.
-def capture(read_frame_list, Global, worker_num):
-    # Get a reference to webcam #0 (the default one)
-    video_capture = cv2.VideoCapture(0)
-    # video_capture.set(3, 640)  # Width of the frames in the video stream.
-    # video_capture.set(4, 480)  # Height of the frames in the video stream.
-    # video_capture.set(5, 30) # Frame rate.
-    print("Width: %d, Height: %d, FPS: %d" % (video_capture.get(3), video_capture.get(4), video_capture.get(5)))
-
-    while not Global.is_exit:
-        # If it's time to read a frame
-        if Global.buff_num != next_id(Global.read_num, worker_num):
-            # Grab a single frame of video
-            ret, frame = video_capture.read()
-            read_frame_list[Global.buff_num] = frame
-            Global.buff_num = next_id(Global.buff_num, worker_num)
-        else:
-            time.sleep(0.01)
-
-    # Release webcam
-    video_capture.release()
+        frames.submit(slot, sequence, CAPTURED)
+        sequence += 1
 
 
 # Many subprocess use to process frames.
-def process(worker_id, read_frame_list, write_frame_list, Global, worker_num):
-    known_face_encodings = Global.known_face_encodings
-    known_face_names = Global.known_face_names
-    while not Global.is_exit:
-
-        # Wait to read
-        while Global.read_num != worker_id or Global.read_num != prev_id(Global.buff_num, worker_num):
-            # If the user has requested to end the app, then stop waiting for webcam frames
-            if Global.is_exit:
-                break
-
-            time.sleep(0.01)
-
-        # Delay to make the video look smoother
-        time.sleep(Global.frame_delay)
-
-        # Read a single frame from frame list
-        frame_process = read_frame_list[worker_id]
+def process(frames, known_faces, stop_event):
+    while not stop_event.is_set():
+        # Wait for a captured frame (the timeout is only there to notice when the user wants to quit)
+        received = frames.receive(CAPTURED, timeout=0.1)
+        if received is None:
+            continue
 
-        # Expect next worker to read frame
-        Global.read_num = next_id(Global.read_num, worker_num)
+        slot, sequence, frame_process = received
 
-        # Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
-        rgb_frame = frame_process[:, :, ::-1]
+        # Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses). cvtColor
+        # writes a contiguous copy, which dlib needs (it can't read a reversed view) and which stays valid after the
+        # ring slot is released.
+        rgb_frame = cv2.cvtColor(frame_process, cv2.COLOR_BGR2RGB)
 
         # Find all the faces and face encodings in the frame of video, cost most time
         face_locations = face_recognition.face_locations(rgb_frame)
         face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
 
-        # Loop through each face in this frame of video
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            # See if the face is a match for the known face(s)
-            matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-
-            name = "Unknown"
+        # See if the faces are a match for the known face(s)
+        matches = known_faces.best_matches(face_encodings)
 
-            # If a match was found in known_face_encodings, just use the first one.
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = known_face_names[first_match_index]
+        # Loop through each face in this frame of video
+        for (top, right, bottom, left), (name, distance) in zip(face_locations, matches):
+            if name is None:
+                name = "Unknown"
 
             # Draw a box around the face
             cv2.rectangle(frame_process, (left, top), (right, bottom), (0, 0, 255), 2)
@@ -104,15 +85,10 @@ def process(worker_id, read_frame_list, write_frame_list, Global, worker_num):
             font = cv2.FONT_HERSHEY_DUPLEX
             cv2.putText(frame_process, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
 
-        # Wait to write
-        while Global.write_num != worker_id:
-            time.sleep(0.01)
+        # Hand the frame (which was drawn on in place) to the display loop
+        frames.submit(slot, sequence, PROCESSED)
 
-        # Send frame to global
-        write_frame_list[worker_id] = frame_process
-
-        # Expect next worker to write frame
-        Global.write_num = next_id(Global.write_num, worker_num)
+    frames.close()
 
 
 if __name__ == '__main__':
@@ -121,28 +97,23 @@ if __name__ == '__main__':
     if platform.system() == 'Darwin':
         set_start_method('forkserver')
 
-    # Global variables
-    Global = Manager().Namespace()
-    Global.buff_num = 1
-    Global.read_num = 1
-    Global.write_num = 1
-    Global.frame_delay = 0
-    Global.is_exit = False
-    read_frame_list = Manager().dict()
-    write_frame_list = Manager().dict()
-
     # Number of workers (subprocess use to process frames)
     if cpu_count() > 2:
         worker_num = cpu_count() - 1  # 1 for capturing frames
     else:
         worker_num = 2
 
-    # Subprocess list
-    p = []
+    # Get a reference to webcam #0 (the default one)
+    video_capture = cv2.VideoCapture(0)
+    # video_capture.set(3, 640)  # Width of the frames in the video stream.
+    # video_capture.set(4, 480)  # Height of the frames in the video stream.
+    # video_capture.set(5, 30) # Frame rate.
+    width, height = int(video_capture.get(3)), int(video_capture.get(4))
+    print("Width: %d, Height: %d, FPS: %d" % (width, height, video_capture.get(5)))
 
-    # Create a thread to capture frames (if uses subprocess, it will crash on Mac)
-    p.append(threading.Thread(target=capture, args=(read_frame_list, Global, worker_num,)))
-    p[0].start()
+    # Two frames per worker, so a worker always has its next frame waiting while it processes the current one
+    frames = FrameRing((height, width, 3), slots=2 * worker_num + 2, stages=2)
+    stop_event = Event()
 
     # Load a sample picture and learn how to recognize it.
     obama_image = face_recognition.load_image_file("obama.jpg")
@@ -152,28 +123,35 @@ if __name__ == '__main__':
     biden_image = face_recognition.load_image_file("biden.jpg")
     biden_face_encoding = face_recognition.face_encodings(biden_image)[0]
 
-    # Create arrays of known face encodings and their names
-    Global.known_face_encodings = [
-        obama_face_encoding,
-        biden_face_encoding
-    ]
-    Global.known_face_names = [
-        "Barack Obama",
-        "Joe Biden"
-    ]
+    # Save the known face encodings and their names to a store on disk. Every worker memory maps the same file
+    # instead of getting its own copy of the encodings, so starting workers stays cheap with a large gallery.
+    known_faces_directory = tempfile.mkdtemp()
+    known_faces = face_recognition.EncodingStore(known_faces_directory)
+    known_faces.append(["Barack Obama", "Joe Biden"], [obama_face_encoding, biden_face_encoding])
 
     # Create workers
-    for worker_id in range(1, worker_num + 1):
-        p.append(Process(target=process, args=(worker_id, read_frame_list, write_frame_list, Global, worker_num,)))
-        p[worker_id].start()
+    workers = [Process(target=process, args=(frames, known_faces, stop_event,)) for _ in range(worker_num)]
+    for worker in workers:
+        worker.start()
+
+    # Create a thread to capture frames (if uses subprocess, it will crash on Mac)
+    capture_thread = threading.Thread(target=capture, args=(video_capture, frames, stop_event,))
+    capture_thread.start()
 
-    # Start to show video
-    last_num = 1
+    # Start to show video. Workers finish frames out of order, so hold on to finished frames until it's their turn.
+    finished_frames = {}
+    next_sequence = 0
     fps_list = []
     tmp_time = time.time()
-    while not Global.is_exit:
-        while Global.write_num != last_num:
-            last_num = int(Global.write_num)
+    while not stop_event.is_set():
+        received = frames.receive(PROCESSED, timeout=0.01)
+        if received is not None:
+            slot, sequence, _ = received
+            finished_frames[sequence] = slot
+
+        while next_sequence in finished_frames:
+            slot = finished_frames.pop(next_sequence)
+            next_sequence += 1
 
             # Calculate fps
             delay = time.time() - tmp_time
@@ -184,29 +162,20 @@ if __name__ == '__main__':
             fps = len(fps_list) / numpy.sum(fps_list)
             print("fps: %.2f" % fps)
 
-            # Calculate frame delay, in order to make the video look smoother.
-            # When fps is higher, should use a smaller ratio, or fps will be limited in a lower value.
-            # Larger ratio can make the video look smoother, but fps will hard to become higher.
-            # Smaller ratio can make fps higher, but the video looks not too smoother.
-            # The ratios below are tested many times.
-            if fps < 6:
-                Global.frame_delay = (1 / fps) * 0.75
-            elif fps < 20:
-                Global.frame_delay = (1 / fps) * 0.5
-            elif fps < 30:
-                Global.frame_delay = (1 / fps) * 0.25
-            else:
-                Global.frame_delay = 0
-
-            # Display the resulting image
-            cv2.imshow('Video', write_frame_list[prev_id(Global.write_num, worker_num)])
+            # Display the resulting image and give its slot back to the capture thread
+            cv2.imshow('Video', frames.view(slot))
+            frames.release(slot)
 
         # Hit 'q' on the keyboard to quit!
         if cv2.waitKey(1) & 0xFF == ord('q'):
-            Global.is_exit = True
-            break
-
-        time.sleep(0.01)
+            stop_event.set()
 
     # Quit
+    capture_thread.join()
+    for worker in workers:
+        worker.join()
+    video_capture.release()
     cv2.destroyAllWindows()
+    frames.close()
+    frames.unlink()
+    shutil.rmtree(known_faces_directory, ignore_errors=True)
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import face_recognition
+from face_recognition.profiling import stage
 import cv2
 import numpy as np
 import base64
@@ -86,6 +87,7 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 REFERENCE_FOLDER = os.path.join(BASE_DIR, 'reference_faces')
 UNKNOWN_FACES_FOLDER = os.path.join(BASE_DIR, 'unknown_faces')
 DETECTIONS_DB = os.path.join(BASE_DIR, 'detections_db.json')
+ENCODING_CACHE_FOLDER = os.path.join(BASE_DIR, '.encoding_cache')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
 # Crear directorios si no existen
@@ -93,6 +95,9 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(REFERENCE_FOLDER, exist_ok=True)
 os.makedirs(UNKNOWN_FACES_FOLDER, exist_ok=True)
 
+# Cache en disco de encodings: las referencias sin cambios no se vuelven a procesar con dlib al reiniciar
+encoding_cache = face_recognition.EncodingCache(ENCODING_CACHE_FOLDER)
+
 # Variables globales para la cámara
 camera = None
 camera_source = 0  # Por defecto webcam local (0), puede ser RTSP URL
@@ -105,14 +110,26 @@ OBJECT_DETECTION_ENABLED = True
 # Lock para inferencia YOLO (evitar segmentation faults en multi-threading)
 yolo_lock = threading.Lock()
 
-# Lock para reconocimiento facial (evitar trace traps en macOS con dlib)
-face_lock = threading.Lock()
-
 # Sistema Multi-Cámara para Centro de Monitoreo
 active_cameras = {}  # {camera_id: {'cap': cv2.VideoCapture, 'source': source, 'lock': threading.Lock()}}
 cameras_lock = threading.Lock()
 MAX_ACTIVE_CAMERAS = 4 # Límite para evitar agotar memoria en Mac
 
+# Puerta de movimiento: en cámaras fijas solo se detecta donde algo se movió (nada si la escena está quieta)
+MOTION_GATE_ENABLED = True
+MOTION_REFRESH_EVERY = 20 # Cada cuántos frames procesados se analiza el frame completo igualmente
+
+# Seguimiento de caras: cada persona se codifica y reconoce una vez por track, no en cada detección
+FACE_TRACKER_FOLLOW = "flow" # Mover los marcos entre detecciones: "flow" (flujo óptico), "kcf"/"csrt" (opencv-contrib) o None
+FACE_REENCODE_EVERY = 10 # Cada cuántas detecciones se vuelve a verificar la identidad de un track
+
+# Planificador de detección: según lo que tarda cada etapa, decide cada cuántos frames se detecta y a qué resolución
+# (ancho para caras e imgsz de YOLO) para mantener los FPS objetivo. La CPU se reparte entre las cámaras activas,
+# así que al abrir más cámaras todas bajan el ritmo de detección. Decisiones actuales en /api/scheduler
+TARGET_DISPLAY_FPS = 15
+MAX_DETECTION_STALENESS = 1.0 # Segundos máximos entre dos detecciones de la misma cámara
+detection_schedulers = face_recognition.SchedulerGroup(target_fps=TARGET_DISPLAY_FPS, max_staleness=MAX_DETECTION_STALENESS)
+
 # Pool de cámaras compartidas para evitar conflictos en macOS
 camera_pool = {} # {source: {'cap': cap, 'lock': lock, 'users': count}}
 pool_lock = threading.Lock()
@@ -198,6 +215,22 @@ PERSON_DETAILS = {
 # Base de datos de caras de referencia
 reference_faces = {}
 reference_encodings = []
+# Índice con todos los encodings de referencia en una matriz contigua (nombre por persona)
+reference_index = face_recognition.FaceIndex()
+
+
+def rebuild_reference_index():
+    """Reconstruir el índice de referencias (y la lista plana de encodings) desde reference_faces"""
+    global reference_encodings, reference_index
+    new_index = face_recognition.FaceIndex()
+    new_encodings = []
+    for face_name, face_data in reference_faces.items():
+        if face_data.get('encodings'):
+            new_index.add(face_name, face_data['encodings'])
+            new_encodings.extend(face_data['encodings'])
+    # Reemplazar de una vez para que los hilos de cámara nunca vean un índice a medio construir
+    reference_index = new_index
+    reference_encodings = new_encodings
 
 def allowed_file(filename):
     if not filename:
@@ -423,29 +456,33 @@ def load_reference_faces():
             filepath = os.path.join(REFERENCE_FOLDER, filename)
             try:
                 print(f"   → Procesando: {filename}")
-                image = face_recognition.load_image_file(filepath)
-                print(f"     Imagen cargada, detectando caras...")
-                # OPTIMIZACIÓN MEMORIA: Usar HOG por defecto (mucho más eficiente que CNN)
-                # CNN consume ~500MB+ de memoria, HOG solo ~50MB
-                with face_lock:
-                    face_locations = face_recognition.face_locations(image, model="hog")
-                
-                print(f"     Encontradas {len(face_locations)} caras, generando encodings...")
-                if len(face_locations) > 0:
+
+                def compute_reference():
+                    image = face_recognition.load_image_file(filepath)
+                    print(f"     Imagen cargada, detectando caras...")
+                    # OPTIMIZACIÓN MEMORIA: Usar HOG por defecto (mucho más eficiente que CNN)
+                    # CNN consume ~500MB+ de memoria, HOG solo ~50MB
+                    locations = face_recognition.face_locations(image, model="hog")
+
+                    print(f"     Encontradas {len(locations)} caras, generando encodings...")
+                    if len(locations) == 0:
+                        return [], []
+
                     # MEJORA: Usar num_jitters=2 para mejor precisión en referencias
                     # Las referencias deben ser de alta calidad para mejor matching
-                    with face_lock:
-                        face_encodings = face_recognition.face_encodings(
-                            image, 
-                            face_locations,
-                            num_jitters=2  # Mejor precisión para referencias
-                        )
+                    encodings = face_recognition.face_encodings(
+                        image,
+                        locations,
+                        num_jitters=2  # Mejor precisión para referencias
+                    )
                     print(f"     Encodings generados.")
-                    # Liberar imagen después de procesar
-                    del image
-                else:
-                    face_encodings = []
-                    del image
+                    return locations, encodings
+
+                # Si la imagen no cambió desde el último arranque, se usa el resultado guardado en cache
+                face_locations, face_encodings = encoding_cache.get_or_compute_file(
+                    filepath, "encodings", compute_reference,
+                    model="hog", number_of_times_to_upsample=1, num_jitters=2, landmarks_model="small")
+                face_encodings = list(face_encodings)
 
                 if len(face_encodings) > 0:
                     name = os.path.splitext(filename)[0]
@@ -472,17 +509,14 @@ def load_reference_faces():
                         reference_faces[name]['image_paths'] = reference_faces[name]['image_paths'][:MAX_ENCODINGS_PER_PERSON]
                         reference_faces[name]['face_locations'] = reference_faces[name]['face_locations'][:MAX_ENCODINGS_PER_PERSON]
                     
-                    # Reconstruir lista plana de encodings para matching rápido
-                    reference_encodings = []
-                    for face_name, face_data in reference_faces.items():
-                        reference_encodings.extend(face_data['encodings'])
-                    
                     print(f"✅ Cara de referencia cargada: {name} ({len(face_encodings)} encodings, Total refs: {len(reference_faces)})")
             except Exception as e:
                 print(f"⚠️ Error cargando {filename}: {e}")
                 import traceback
                 traceback.print_exc()
-    
+
+    # Construir el índice de matching una sola vez con todas las referencias
+    rebuild_reference_index()
     print(f"✅ Carga de referencias completada: {len(reference_faces)} personas registradas")
 
 def save_face_detection(frame, face_location, face_encoding, is_known=False, name=None, confidence=None):
@@ -1340,6 +1374,7 @@ def generate_frames_multicam(source, camera_id=None):
 
     cap = None
     cap_lock = None
+    profiler = None
     try:
         # --- Verificar Límite de Cámaras ---
         with cameras_lock:
@@ -1354,8 +1389,16 @@ def generate_frames_multicam(source, camera_id=None):
         if not cap:
             raise ConnectionError(f"No se pudo abrir la fuente de video: {source}")
 
+        # Tiempos por etapa (capture, yolo, detect, landmarks, encode, match) solo de este hilo de cámara
+        profiler = face_recognition.Profiler(current_thread_only=True).start()
+
+        motion_gate = face_recognition.MotionGate(refresh_every=MOTION_REFRESH_EVERY) if MOTION_GATE_ENABLED else None
+        face_tracker = face_recognition.FaceTracker(reencode_every=FACE_REENCODE_EVERY, follow=FACE_TRACKER_FOLLOW)
+        scheduler = detection_schedulers.add(camera_id)
+
         with cameras_lock:
-            active_cameras[camera_id] = {'cap': cap, 'source': source, 'lock': cap_lock}
+            active_cameras[camera_id] = {'cap': cap, 'source': source, 'lock': cap_lock, 'profiler': profiler,
+                                         'motion': motion_gate, 'scheduler': scheduler}
         print(f"✅ Stream iniciado: {camera_id}")
 
         frame_count = 0
@@ -1364,7 +1407,8 @@ def generate_frames_multicam(source, camera_id=None):
         
         # Cache para persistir los marcos entre frames procesados y evitar intermitencia
         last_yolo_detections = [] # [{'box': (x1, y1, x2, y2), 'conf': conf}]
-        last_face_detections = [] # [{'box': (t, r, b, l), 'label': label, 'color': color}]
+        last_face_detections = [] # [{'box': (t, r, b, l), 'label': label, 'color': color, 'track': track}]
+        matched_index = None # Índice de referencias con el que se reconocieron los tracks
 
         # --- Bucle Principal de Procesamiento ---
         while camera_id in active_cameras:
@@ -1372,7 +1416,7 @@ def generate_frames_multicam(source, camera_id=None):
                 cam_data = active_cameras.get(camera_id)
                 if not cam_data: break
 
-                with cam_data['lock']:
+                with cam_data['lock'], stage("capture"):
                     success, frame = cap.read()
 
                 if not success or frame is None:
@@ -1385,8 +1429,17 @@ def generate_frames_multicam(source, camera_id=None):
                 
                 error_count = 0
 
-                # --- Procesamiento de Detección (cada 3 frames para rendimiento) ---
-                if frame_count % 3 == 0:
+                # --- Planificador: ¿se detecta en este frame? ¿a qué resolución? ---
+                frame_started = time.perf_counter()
+                plan = scheduler.begin_frame()
+
+                # --- Puerta de movimiento: si nada se movió se mantienen los últimos marcos sin detectar ---
+                motion_regions = None
+                if plan['detect'] and motion_gate is not None:
+                    motion_regions = motion_gate.update(frame)
+
+                # --- Procesamiento de Detección (cada plan['stride'] frames, según la carga) ---
+                if plan['detect'] and motion_regions != []:
                     # OPTIMIZACIÓN: Liberar memoria periódicamente
                     if frame_count % 150 == 0:
                         gc.collect()
@@ -1395,12 +1448,9 @@ def generate_frames_multicam(source, camera_id=None):
                     # Usar 0.5x para YOLO (suficiente para objetos grandes)
                     small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
                     
-                    # OPTIMIZACIÓN ROSTROS: Redimensionar a un ancho fijo (ej: 640px)
-                    # Esto hace que la detección sea consistente sin importar la resolución de la cámara
-                    target_width = 640
-                    face_scale = target_width / w
-                    face_frame = cv2.resize(frame, (target_width, int(h * face_scale)))
-                    rgb_face_frame = cv2.cvtColor(face_frame, cv2.COLOR_BGR2RGB)
+                    # OPTIMIZACIÓN ROSTROS: detectar sobre una copia de 640px de ancho y calcular los
+                    # encodings sobre el frame original (mejor precisión para caras pequeñas)
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                     
                     # Limpiar cache para nueva detección
                     new_yolo_detections = []
@@ -1409,9 +1459,9 @@ def generate_frames_multicam(source, camera_id=None):
                     # 1. Detección de Objetos (YOLO)
                     if OBJECT_DETECTION_ENABLED and yolo_model:
                         try:
-                            with yolo_lock:
-                                # OPTIMIZACIÓN: imgsz=320 reduce drásticamente el uso de RAM y CPU
-                                yolo_results = yolo_model(small_frame, conf=0.3, iou=0.5, imgsz=320, verbose=False)
+                            with yolo_lock, stage("yolo"), scheduler.measure("yolo"):
+                                # OPTIMIZACIÓN: imgsz lo elige el planificador (320 reduce drásticamente el uso de RAM y CPU)
+                                yolo_results = yolo_model(small_frame, conf=0.3, iou=0.5, imgsz=plan['yolo_imgsz'], verbose=False)
                             
                             for result in yolo_results:
                                 if result.boxes:
@@ -1444,111 +1494,83 @@ def generate_frames_multicam(source, camera_id=None):
                             print(f"❌ Error en YOLO para {camera_id}: {yolo_error}")
 
                     # 2. Detección de Rostros
-                    with face_lock:
-                        # Upsample=1 con 640px de ancho es ideal para HOG
-                        face_locations = face_recognition.face_locations(rgb_face_frame, number_of_times_to_upsample=1, model="hog")
-                        face_encodings = face_recognition.face_encodings(rgb_face_frame, face_locations)
+                    # Cada hilo de cámara usa su propia instancia de los modelos dlib, sin lock global.
+                    # Upsample=1 con 640px de ancho es ideal para HOG
+                    # Solo en las zonas con movimiento (None = frame completo)
+                    face_regions = None if motion_regions in (None, [(0, w, h, 0)]) else motion_regions
+                    # Sin encodings: el tracker decide qué caras hay que codificar
+                    with scheduler.measure("detect"):
+                        face_locations, _, _ = face_recognition.detect_and_encode(
+                            rgb_frame, detect_max_width=plan['detect_width'], number_of_times_to_upsample=1, model="hog",
+                            regions=face_regions, encode=False)
                     
                     # MEJORA DISTANCIA: Si detectamos personas con YOLO pero no caras, 
-                    # intentamos buscar caras dentro de los recuadros de las personas a mayor resolución
+                    # buscamos caras solo en la zona de la cabeza de esas personas (ampliada si es pequeña)
                     if OBJECT_DETECTION_ENABLED and yolo_model:
+                        head_regions = []
                         for det in new_yolo_detections:
                             if "PERSON" in det['class_name']:
                                 x1, y1, x2, y2 = det['box']
-                                # Verificar si ya hay una cara en esta área
-                                face_already_detected = False
-                                for (f_top, f_right, f_bottom, f_left) in face_locations:
-                                    # Escalar coordenadas de cara a resolución original
-                                    f_top_orig = int(f_top / face_scale)
-                                    f_right_orig = int(f_right / face_scale)
-                                    f_bottom_orig = int(f_bottom / face_scale)
-                                    f_left_orig = int(f_left / face_scale)
-                                    
-                                    # Calcular IoU o simplemente ver si el centro de la cara está en el box de la persona
-                                    f_center_x = (f_left_orig + f_right_orig) / 2
-                                    f_center_y = (f_top_orig + f_bottom_orig) / 2
-                                    if x1 <= f_center_x <= x2 and y1 <= f_center_y <= y2:
-                                        face_already_detected = True
-                                        break
-                                
+                                # Ver si el centro de alguna cara ya detectada está en el box de la persona
+                                face_already_detected = any(
+                                    x1 <= (f_left + f_right) / 2 <= x2 and y1 <= (f_top + f_bottom) / 2 <= y2
+                                    for (f_top, f_right, f_bottom, f_left) in face_locations)
+
                                 if not face_already_detected:
-                                    # Extraer ROI de la persona del frame original (alta res)
-                                    # Añadir un poco de margen arriba para la cabeza
-                                    roi_y1 = max(0, y1 - int((y2-y1)*0.1))
-                                    roi_y2 = min(h, y1 + int((y2-y1)*0.4)) # Solo la parte superior (cabeza/hombros)
-                                    roi_x1 = max(0, x1)
-                                    roi_x2 = min(w, x2)
-                                    
-                                    if roi_y2 > roi_y1 and roi_x2 > roi_x1:
-                                        person_roi = frame[roi_y1:roi_y2, roi_x1:roi_x2]
-                                        if person_roi.size > 0:
-                                            # Redimensionar ROI para que sea lo suficientemente grande para HOG
-                                            roi_h, roi_w = person_roi.shape[:2]
-                                            if roi_w < 160: # Si es muy pequeño, agrandar
-                                                scale = 160 / roi_w
-                                                person_roi = cv2.resize(person_roi, (0,0), fx=scale, fy=scale)
-                                            else:
-                                                scale = 1.0
-                                            
-                                            rgb_roi = cv2.cvtColor(person_roi, cv2.COLOR_BGR2RGB)
-                                            with face_lock:
-                                                roi_face_locs = face_recognition.face_locations(rgb_roi, model="hog")
-                                                roi_face_encs = face_recognition.face_encodings(rgb_roi, roi_face_locs)
-                                            
-                                            for (r_top, r_right, r_bottom, r_left), r_enc in zip(roi_face_locs, roi_face_encs):
-                                                # Convertir coordenadas de ROI a coordenadas originales
-                                                orig_top = int(r_top / scale) + roi_y1
-                                                orig_right = int(r_right / scale) + roi_x1
-                                                orig_bottom = int(r_bottom / scale) + roi_y1
-                                                orig_left = int(r_left / scale) + roi_x1
-                                                
-                                                # Añadir a la lista de caras (en escala de face_frame para el loop siguiente)
-                                                face_locations.append((
-                                                    int(orig_top * face_scale),
-                                                    int(orig_right * face_scale),
-                                                    int(orig_bottom * face_scale),
-                                                    int(orig_left * face_scale)
-                                                ))
-                                                face_encodings.append(r_enc)
-                                                print(f"🎯 [{camera_id}] Cara detectada mediante ZOOM en persona a distancia")
-
-                    # DEBUG: Siempre imprimir si se está procesando
+                                    # Solo la parte superior (cabeza/hombros), con un poco de margen arriba para la cabeza
+                                    head_regions.append((y1 - int((y2 - y1) * 0.1), x2, y1 + int((y2 - y1) * 0.4), x1))
+
+                        if head_regions:
+                            # Detección solo dentro de las regiones (sin recortar ni copiar el frame a mano); las regiones
+                            # de menos de 160px se amplían y las coordenadas vuelven en el sistema del frame original
+                            with scheduler.measure("zoom"):
+                                roi_face_locs = face_recognition.face_locations(rgb_frame, regions=head_regions, region_margin=0,
+                                                                                min_region_size=160)
+                            face_locations.extend(roi_face_locs)
+                            for _ in roi_face_locs:
+                                print(f"🎯 [{camera_id}] Cara detectada mediante ZOOM en persona a distancia")
+
+                    # DEBUG: tiempo medio por etapa desde que empezó el stream (también en /metrics)
                     if frame_count % 30 == 0:
-                        print(f"🔍 [{camera_id}] Res: {w}x{h} | FaceRes: {face_frame.shape[1]}x{face_frame.shape[0]} | Caras: {len(face_locations)}")
+                        etapas = " | ".join(f"{nombre}: {datos['mean_seconds'] * 1000:.0f}ms"
+                                            for nombre, datos in sorted(profiler.stats().items()))
+                        print(f"🔍 [{camera_id}] Res: {w}x{h} | Caras: {len(face_locations)} | "
+                              f"Detección: {plan['detect_width']}px cada {plan['stride']} frames | {etapas}")
 
                     if len(face_locations) > 0:
                         print(f"👤 [{camera_id}] Detectadas {len(face_locations)} caras")
 
-                    for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                        # Escalar de vuelta a la resolución original (1/face_scale)
-                        top = int(top / face_scale)
-                        right = int(right / face_scale)
-                        bottom = int(bottom / face_scale)
-                        left = int(left / face_scale)
-                        
+                    # Asociar las caras a sus tracks y codificar solo las nuevas, las que toca verificar o las que
+                    # cambiaron de aspecto; el resto reutiliza la identidad guardada en su track
+                    face_tracks = face_tracker.update(frame, face_locations)
+                    with scheduler.measure("encode"):
+                        encoded_tracks = face_tracker.encode(rgb_frame, face_tracks)
+
+                    # Comparar las caras recién codificadas contra todas las referencias en una sola pasada
+                    # (distancia mínima por persona, sin recorrer el diccionario de referencias)
+                    # Si las referencias se recargaron, volver a reconocer todos los tracks
+                    current_index = reference_index
+                    if current_index is not matched_index:
+                        encoded_tracks = face_tracks
+                        matched_index = current_index
+                    if encoded_tracks:
+                        face_matches = current_index.best_matches([track.encoding for track in encoded_tracks], tolerance=0.6)
+                        for track, match in zip(encoded_tracks, face_matches):
+                            track.identity = match
+
+                    for track in face_tracks:
+                        top, right, bottom, left = track.location
                         color = (0, 0, 255); label = "Desconocido"; is_known = False; matched_name = None; confidence = None
 
-                        if reference_encodings:
-                            with face_lock:
-                                matches = face_recognition.compare_faces(reference_encodings, face_encoding, tolerance=0.6)
-                                face_distances = face_recognition.face_distance(reference_encodings, face_encoding)
-                            
-                            if True in matches:
-                                best_match_index = np.argmin(face_distances)
-                                if matches[best_match_index]:
-                                    confidence = 1.0 - face_distances[best_match_index]
-                                    is_known = True
-                                    color = (0, 255, 0)
-                                    
-                                    current_index = 0
-                                    for person_name, person_data in reference_faces.items():
-                                        num_encodings = len(person_data['encodings'])
-                                        if best_match_index < current_index + num_encodings:
-                                            # Extraer nombre base (antes de guiones o números)
-                                            matched_name = person_name.split('_')[0].split('-')[0].strip()
-                                            label = f"{matched_name} ({confidence:.2f})"
-                                            break
-                                        current_index += num_encodings
+                        if len(current_index):
+                            person_name, distance = track.identity
+                            if person_name is not None:
+                                confidence = 1.0 - distance
+                                is_known = True
+                                color = (0, 255, 0)
+                                # Extraer nombre base (antes de guiones o números)
+                                matched_name = person_name.split('_')[0].split('-')[0].strip()
+                                label = f"{matched_name} ({confidence:.2f})"
                         else:
                             if frame_count % 30 == 0:
                                 print(f"⚠️ [{camera_id}] No hay encodings de referencia cargados")
@@ -1559,18 +1581,24 @@ def generate_frames_multicam(source, camera_id=None):
                             'box': (top, right, bottom, left), 
                             'label': label, 
                             'color': color,
-                            'details': details
+                            'details': details,
+                            'track': track
                         })
                     
                     # Liberar frames temporales
                     del small_frame
-                    del face_frame
-                    del rgb_face_frame
+                    del rgb_frame
                     
                     # Actualizar cache persistente
                     last_yolo_detections = new_yolo_detections
                     last_face_detections = new_face_detections
 
+                elif face_tracker.follow_method and last_face_detections:
+                    # Entre detecciones, mover los marcos de las caras junto con su track
+                    face_tracker.follow(frame)
+                    for det in last_face_detections:
+                        det['box'] = det['track'].location
+
                 # --- Dibujar Detecciones (en CADA frame para evitar parpadeo) ---
                 # Colores estilo TRON ARES (Cyan eléctrico y Blanco)
                 TRON_CYAN = (255, 255, 0)
@@ -1654,13 +1682,15 @@ def generate_frames_multicam(source, camera_id=None):
                 
                 # --- Envío del Frame ---
                 ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 75])
+                scheduler.end_frame()
                 if not ret: continue
                 
                 frame_bytes = buffer.tobytes()
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
                 
-                time.sleep(0.03)
+                # Mantener los FPS objetivo (en lugar de una pausa fija)
+                time.sleep(max(0.0, 1.0 / TARGET_DISPLAY_FPS - (time.perf_counter() - frame_started)))
 
             except Exception as e:
                 print(f"❌ Error en bucle de stream {camera_id}: {e}")
@@ -1671,6 +1701,9 @@ def generate_frames_multicam(source, camera_id=None):
 
     finally:
         print(f"🧹 Limpiando y cerrando stream: {camera_id}")
+        if profiler:
+            profiler.stop()
+        detection_schedulers.remove(camera_id)
         # Liberar del pool compartido en lugar de cerrar directamente
         if source:
             release_shared_cap(source)
@@ -1686,109 +1719,103 @@ def generate_frames():
     global camera, camera_lock, is_streaming
     
     frame_count = 0
-    last_detection_time = 0
-    detection_interval = 1  # segundos
+    # Cada cuántos frames se detecta y a qué resolución lo decide el planificador (antes: una vez por segundo)
+    scheduler = detection_schedulers.add('principal')
     
-    while True:
-        with camera_lock:
-            if not is_streaming or camera is None or not camera.isOpened():
-                # Si el stream está detenido, enviar un frame negro
-                black_frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(black_frame, "Stream Detenido", (180, 240), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                ret, buffer = cv2.imencode('.jpg', black_frame)
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                          b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                time.sleep(1)
-                continue
+    try:
+        while True:
+            with camera_lock:
+                if not is_streaming or camera is None or not camera.isOpened():
+                    # Si el stream está detenido, enviar un frame negro
+                    black_frame = np.zeros((480, 640, 3), dtype=np.uint8)
+                    cv2.putText(black_frame, "Stream Detenido", (180, 240), 
+                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+                    ret, buffer = cv2.imencode('.jpg', black_frame)
+                    if ret:
+                        frame_bytes = buffer.tobytes()
+                        yield (b'--frame\r\n'
+                              b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                    time.sleep(1)
+                    continue
 
-            success, frame = camera.read()
-            if not success:
-                print("Error leyendo frame de la cámara principal")
-                time.sleep(0.5)
-                continue
+                success, frame = camera.read()
+                if not success:
+                    print("Error leyendo frame de la cámara principal")
+                    time.sleep(0.5)
+                    continue
 
-        # Procesamiento de frames
-        current_time = time.time()
-        if current_time - last_detection_time > detection_interval:
-            last_detection_time = current_time
-            
-            # Detección de objetos
-            if OBJECT_DETECTION_ENABLED:
-                try:
-                    detections = detect_objects_dnn(frame)
-                    if detections:
-                        # Estabilizar detecciones
-                        detections = stabilize_detections(detections)
-                        
-                        for det in detections:
-                            x1, y1, x2, y2 = det['box']
-                            label = f"{det['class']} ({det['confidence']:.2f})"
-                            
-                            # Color diferente para personas
-                            color = (255, 255, 0) if det['class'] == 'person' else (0, 255, 0)
+            # Procesamiento de frames
+            frame_started = time.perf_counter()
+            plan = scheduler.begin_frame()
+            if plan['detect']:
+                
+                # Detección de objetos
+                if OBJECT_DETECTION_ENABLED:
+                    try:
+                        with scheduler.measure("objects"):
+                            detections = detect_objects_dnn(frame)
+                        if detections:
+                            # Estabilizar detecciones
+                            detections = stabilize_detections(detections)
                             
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                except Exception as e:
-                    print(f"Error en detección de objetos: {e}")
-
-            # Detección de caras
-            rgb_small_frame = cv2.cvtColor(cv2.resize(frame, (0, 0), fx=0.25, fy=0.25), cv2.COLOR_BGR2RGB)
-            with face_lock:
-                face_locations = face_recognition.face_locations(rgb_small_frame)
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-
-            for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                top *= 4
-                right *= 4
-                bottom *= 4
-                left *= 4
-
-                with face_lock:
-                    matches = face_recognition.compare_faces(reference_encodings, face_encoding)
-                name = "Desconocido"
-                color = (0, 0, 255)
-
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    
-                    current_index = 0
-                    for person_name, person_data in reference_faces.items():
-                        num_encodings = len(person_data['encodings'])
-                        if first_match_index < current_index + num_encodings:
-                            name = person_name.split('_')[0].split('-')[0].strip()
-                            color = (0, 255, 0)
-                            break
-                        current_index += num_encodings
-                else:
-                    # ...existing code...
-                    if time.time() - save_unknown_face.last_save_time > 5:
-                        save_unknown_face(frame, (top, right, bottom, left), face_encoding)
-                        save_unknown_face.last_save_time = time.time()
+                            for det in detections:
+                                x1, y1, x2, y2 = det['box']
+                                label = f"{det['class']} ({det['confidence']:.2f})"
+                                
+                                # Color diferente para personas
+                                color = (255, 255, 0) if det['class'] == 'person' else (0, 255, 0)
+                                
+                                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                                cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+                    except Exception as e:
+                        print(f"Error en detección de objetos: {e}")
 
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-                
-                # Etiqueta de nombre
-                cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                font = cv2.FONT_HERSHEY_DUPLEX
-                cv2.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
-                
-                # Información Adicional (Biografía) para compatibilidad
-                details = PERSON_DETAILS.get(name, [])
-                for i, line in enumerate(details):
-                    cv2.putText(frame, line, (left, bottom + 20 + (i * 18)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+                # Detección de caras
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                # Detectar al ancho que decida el planificador, encodings a resolución completa
+                with scheduler.measure("detect"):
+                    face_locations, face_encodings, _ = face_recognition.detect_and_encode(
+                        rgb_frame, detect_max_width=plan['detect_width'])
 
-        # Comprimir y enviar frame
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-        if ret:
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\n'
-                  b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        
-        time.sleep(0.03) # Limitar a ~30 FPS
+                face_matches = reference_index.best_matches(face_encodings)
+
+                for (top, right, bottom, left), face_encoding, (person_name, _) in zip(face_locations, face_encodings, face_matches):
+                    name = "Desconocido"
+                    color = (0, 0, 255)
+
+                    if person_name is not None:
+                        name = person_name.split('_')[0].split('-')[0].strip()
+                        color = (0, 255, 0)
+                    else:
+                        # ...existing code...
+                        if time.time() - save_unknown_face.last_save_time > 5:
+                            save_unknown_face(frame, (top, right, bottom, left), face_encoding)
+                            save_unknown_face.last_save_time = time.time()
+
+                    cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+                    
+                    # Etiqueta de nombre
+                    cv2.rectangle(frame, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+                    font = cv2.FONT_HERSHEY_DUPLEX
+                    cv2.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
+                    
+                    # Información Adicional (Biografía) para compatibilidad
+                    details = PERSON_DETAILS.get(name, [])
+                    for i, line in enumerate(details):
+                        cv2.putText(frame, line, (left, bottom + 20 + (i * 18)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (200, 200, 200), 1)
+
+            # Comprimir y enviar frame
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            scheduler.end_frame()
+            if ret:
+                frame_bytes = buffer.tobytes()
+                yield (b'--frame\r\n'
+                      b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            
+            # Mantener los FPS objetivo (en lugar de una pausa fija)
+            time.sleep(max(0.0, 1.0 / TARGET_DISPLAY_FPS - (time.perf_counter() - frame_started)))
+    finally:
+        detection_schedulers.remove('principal')
 
 
 @app.route('/')
@@ -1970,10 +1997,8 @@ def upload_reference():
             reference_faces[name]['image_paths'].append(filepath)
             reference_faces[name]['face_locations'].append(location)
         
-        # Reconstruir lista plana de encodings para matching rápido
-        reference_encodings = []
-        for face_name, face_data in reference_faces.items():
-            reference_encodings.extend(face_data['encodings'])
+        # Reconstruir índice de encodings para matching rápido
+        rebuild_reference_index()
 
         # Convertir imagen a base64 para mostrar
         buffered = io.BytesIO()
@@ -2062,10 +2087,8 @@ def delete_reference(name):
             # Eliminar la persona del diccionario
             del reference_faces[name]
             
-            # Reconstruir lista plana de encodings para matching rápido
-            reference_encodings = []
-            for face_name, face_data in reference_faces.items():
-                reference_encodings.extend(face_data.get('encodings', []))
+            # Reconstruir índice de encodings para matching rápido
+            rebuild_reference_index()
 
             return jsonify({'success': True, 'message': f'Cara "{name}" eliminada'})
         else:
@@ -2259,6 +2282,26 @@ def get_kpi():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Tiempos por etapa de cada cámara activa en formato de texto de Prometheus"""
+    with cameras_lock:
+        profilers = [({'camera': cam_id}, data['profiler']) for cam_id, data in sorted(active_cameras.items()) if data.get('profiler')]
+        motion_gates = [(cam_id, data['motion']) for cam_id, data in sorted(active_cameras.items()) if data.get('motion')]
+
+    text = face_recognition.profiling.prometheus_text(profilers)
+    if motion_gates:
+        text += "# HELP face_recognition_motion_ratio Fraction of the last processed frame that moved.\n"
+        text += "# TYPE face_recognition_motion_ratio gauge\n"
+        for cam_id, motion_gate in motion_gates:
+            text += f'face_recognition_motion_ratio{{camera="{cam_id}"}} {motion_gate.motion_ratio!r}\n'
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/scheduler', methods=['GET'])
+def get_scheduler():
+    """Decisiones actuales del planificador de detección de cada cámara (cada cuántos frames, resolución, FPS esperados)"""
+    return jsonify({'success': True, 'cameras': detection_schedulers.decisions()})
+
 # ========== ENDPOINT PARA SERVIR IMÁGENES DE DESCONOCIDOS ==========
 
 @app.route('/api/unknown_image/<filename>')
@@ -2301,6 +2344,14 @@ if __name__ == '__main__':
     print("INICIANDO SERVIDOR FLASK")
     print("=" * 60)
     
+    # 0. Precargar solo los modelos dlib que usa el servidor (HOG + 5 puntos + encoder),
+    # una instancia por cámara para que los hilos no se esperen entre sí.
+    # El detector CNN no se carga nunca si no se usa.
+    print("\n[0] Precargando modelos de face_recognition...")
+    for model_name, load_time in face_recognition.preload(["face_detector", "pose_predictor_5_point", "face_encoder"],
+                                                          instances=MAX_ACTIVE_CAMERAS).items():
+        print(f"   {model_name}: {load_time:.2f}s")
+
     # 1. Cargar caras de referencia (usando dlib/face_recognition)
     print("\n[1] Cargando caras de referencia...")
     load_reference_faces()
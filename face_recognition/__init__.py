@@ -5,3 +5,18 @@ __email__ = 'ageitgey@gmail.com'
 __version__ = '1.4.0'
 
 from .api import load_image_file, face_locations, batch_face_locations, face_landmarks, face_encodings, compare_faces, face_distance
+from .api import preload, model_load_times, model_instance_counts
+from .api import batch_face_encodings, iter_batch_face_locations
+from .api import face_distance_matrix, match_faces
+from .api import face_landmarks_array, FACE_LANDMARKS_68_POINT, FACE_LANDMARKS_5_POINT
+from .api import detect_and_encode
+from .encoding_cache import EncodingCache
+from .face_index import FaceIndex
+from .ann_index import IVFIndex
+from .quantization import QuantizedEncodings
+from .encoding_store import EncodingStore
+from .frame_ring import FrameRing
+from .profiling import Profiler
+from .motion import MotionGate
+from .tracking import FaceTracker
+from .scheduling import DetectionScheduler, SchedulerGroup
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+
+from .api import face_distance_matrix, _squared_distance_matrix, _top_k
+
+
+def _nearest_centroids(data, centroids, chunk_size=16384):
+    """
+    Returns the index of the closest centroid for each row of data, working in chunks so the distance matrix of a
+    large data set never has to be held in memory at once.
+    """
+    nearest = np.empty(len(data), dtype=np.intp)
+    for start in range(0, len(data), chunk_size):
+        nearest[start:start + chunk_size] = np.argmin(_squared_distance_matrix(data[start:start + chunk_size], centroids), axis=1)
+    return nearest
+
+
+def _kmeans(data, k, iterations=20, random_state=None):
+    """
+    Clusters the rows of data into k clusters with Lloyd's algorithm.
+
+    :param data: float32 numpy array of shape (N, D) with N >= k
+    :param k: number of clusters
+    :param iterations: number of assignment / update rounds
+    :param random_state: seed or numpy RandomState used to pick the initial centroids
+    :return: a float32 numpy array of shape (k, D) with the cluster centroids
+    """
+    random = random_state if isinstance(random_state, np.random.RandomState) else np.random.RandomState(random_state)
+    centroids = data[random.choice(len(data), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = _nearest_centroids(data, centroids)
+
+        # Sum the points of each cluster with one reduceat over the points sorted by cluster
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=k)
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        centroids[non_empty] = np.add.reduceat(data[order], starts, axis=0) / counts[non_empty, np.newaxis]
+
+        # Restart empty clusters from random points so every list ends up being used
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[random.choice(len(data), len(empty), replace=False)]
+
+    return centroids
+
+
+def _merge_candidates(best_rows, best_distances, query_numbers, rows, distances):
+    """
+    Merges the distances from some queries to a block of rows into the running best candidates of those queries.
+    """
+    keep = best_rows.shape[1]
+    if distances.shape[1] > keep:
+        columns = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+        distances = np.take_along_axis(distances, columns, axis=1)
+        block_rows = rows[columns]
+    else:
+        block_rows = np.broadcast_to(rows, distances.shape)
+
+    merged_distances = np.concatenate([best_distances[query_numbers], distances], axis=1)
+    merged_rows = np.concatenate([best_rows[query_numbers], block_rows], axis=1)
+    columns, best_distances[query_numbers] = _top_k(merged_distances, keep)
+    best_rows[query_numbers] = np.take_along_axis(merged_rows, columns, axis=1)
+
+
+class IVFIndex(object):
+    """
+    An approximate nearest neighbor index for very large galleries of face encodings, in pure numpy.
+
+    Encodings are split into n_lists inverted lists with a k-means coarse quantizer. A search only scans the nprobe
+    lists whose centroids are closest to the query instead of the whole gallery. With pq_subvectors set, the
+    residuals of the encodings are also product quantized to one byte per subvector and the lists are scanned with
+    lookup tables, after which the best candidates are re-ranked with their exact float32 distance.
+
+    Use evaluate() to measure the recall and latency of different nprobe settings against a brute force search.
+    """
+
+    def __init__(self, n_lists=1024, nprobe=8, pq_subvectors=None, rerank=64, random_state=0):
+        """
+        :param n_lists: number of inverted lists (k-means clusters). Around sqrt(number of encodings) works well.
+        :param nprobe: default number of lists to scan per query. Higher is more accurate, but slower.
+        :param pq_subvectors: Optional - number of subvectors to product quantize the encodings into (must divide the
+                              number of dimensions, i.e. 16 or 32 for 128-d encodings). None scans exact float32 distances.
+        :param rerank: with product quantization, how many of the best candidates of each query to re-rank with their
+                       exact distance (at least k are always re-ranked)
+        :param random_state: seed for k-means
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.pq_subvectors = pq_subvectors
+        self.rerank = rerank
+        self.random_state = random_state
+
+        self.centroids = None
+        self.pq_codebooks = None
+
+        self._pending_vectors = []
+        self._pending_ids = []
+        self._vectors = None
+        self._ids = None
+        self._codes = None
+        self._norms = None
+        self._list_offsets = None
+        self._list_sizes = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        stored = 0 if self._list_sizes is None else int(self._list_sizes.sum())
+        return stored + sum(len(ids) for ids in self._pending_ids)
+
+    def train(self, encodings, iterations=20, max_training_points=256):
+        """
+        Learns the coarse quantizer (and product quantizer) from a representative sample of encodings.
+
+        :param encodings: numpy array of shape (N, D) with at least n_lists rows
+        :param iterations: number of k-means iterations
+        :param max_training_points: k-means is run on at most this many points per list, sampled at random
+        """
+        encodings = np.asarray(encodings, dtype=np.float32)
+        random = np.random.RandomState(self.random_state)
+
+        if len(encodings) < self.n_lists:
+            raise ValueError("Need at least n_lists={} encodings to train, got {}.".format(self.n_lists, len(encodings)))
+
+        if len(encodings) > self.n_lists * max_training_points:
+            encodings = encodings[random.choice(len(encodings), self.n_lists * max_training_points, replace=False)]
+
+        self.centroids = _kmeans(encodings, self.n_lists, iterations, random)
+
+        if self.pq_subvectors:
+            dimensions = encodings.shape[1]
+            if dimensions % self.pq_subvectors:
+                raise ValueError("pq_subvectors must divide the number of dimensions ({}).".format(dimensions))
+
+            residuals = encodings - self.centroids[_nearest_centroids(encodings, self.centroids)]
+            subvectors = residuals.reshape(len(residuals), self.pq_subvectors, -1)
+            codebook_size = min(256, len(encodings))
+            self.pq_codebooks = np.stack([_kmeans(np.ascontiguousarray(subvectors[:, m]), codebook_size, iterations, random)
+                                          for m in range(self.pq_subvectors)])
+
+    def add(self, encodings, ids=None):
+        """
+        Adds encodings to the index. The index must be trained first.
+
+        :param encodings: numpy array of shape (N, D)
+        :param ids: Optional - an int id for each encoding, returned by search(). Defaults to consecutive numbers
+                    starting at the number of encodings already in the index.
+        :return: the ids of the added encodings
+        """
+        if not self.is_trained:
+            raise ValueError("The index must be trained before encodings can be added.")
+
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        if ids is None:
+            ids = np.arange(len(self), len(self) + len(encodings), dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        # New encodings are buffered and merged into the inverted lists on the next search
+        self._pending_vectors.append(encodings)
+        self._pending_ids.append(ids)
+        return ids
+
+    def _encode(self, vectors, assignments):
+        residuals = (vectors - self.centroids[assignments]).reshape(len(vectors), self.pq_subvectors, -1)
+        codes = np.empty((len(vectors), self.pq_subvectors), dtype=np.uint8)
+        for m in range(self.pq_subvectors):
+            codes[:, m] = _nearest_centroids(np.ascontiguousarray(residuals[:, m]), self.pq_codebooks[m])
+        return codes
+
+    def _merge_pending(self):
+        if not self._pending_ids:
+            return
+
+        vectors = np.concatenate(self._pending_vectors)
+        ids = np.concatenate(self._pending_ids)
+        assignments = _nearest_centroids(vectors, self.centroids)
+        counts = np.bincount(assignments, minlength=self.n_lists)
+
+        # Every list is one contiguous slice with room to grow at its end. Only when a list runs out of room is the
+        # layout rebuilt, with enough spare room that this happens less and less often as the index grows.
+        sizes = counts if self._list_sizes is None else self._list_sizes + counts
+        if self._list_sizes is None or np.any(sizes > np.diff(self._list_offsets)):
+            self._grow(sizes)
+
+        # Each new encoding goes right after the encodings already in its list
+        order = np.argsort(assignments, kind="stable")
+        assignments = assignments[order]
+        first_of_list = np.cumsum(counts) - counts
+        rows = self._list_offsets[assignments] + (sizes - counts)[assignments] + np.arange(len(order)) - first_of_list[assignments]
+
+        self._vectors[rows] = vectors[order]
+        self._ids[rows] = ids[order]
+        self._norms[rows] = np.einsum("ij,ij->i", vectors[order], vectors[order])
+        if self.pq_subvectors:
+            self._codes[rows] = self._encode(vectors[order], assignments)
+        self._list_sizes = sizes
+        self._pending_vectors = []
+        self._pending_ids = []
+
+    def _grow(self, sizes):
+        """
+        Moves the stored encodings to a new layout with room for at least `sizes` encodings in each list, plus as
+        many again (and at least the average list size) to grow into.
+        """
+        capacities = sizes + np.maximum(sizes, int(np.ceil(sizes.sum() / float(self.n_lists))))
+        offsets = np.concatenate(([0], np.cumsum(capacities)))
+        dimensions = self.centroids.shape[1]
+
+        vectors = np.zeros((offsets[-1], dimensions), dtype=np.float32)
+        ids = np.full(offsets[-1], -1, dtype=np.int64)
+        norms = np.zeros(offsets[-1], dtype=np.float32)
+        codes = np.zeros((offsets[-1], self.pq_subvectors), dtype=np.uint8) if self.pq_subvectors else None
+
+        if self._list_sizes is not None:
+            old_rows, new_rows = self._stored_rows(), self._stored_rows(offsets)
+            vectors[new_rows] = self._vectors[old_rows]
+            ids[new_rows] = self._ids[old_rows]
+            norms[new_rows] = self._norms[old_rows]
+            if codes is not None:
+                codes[new_rows] = self._codes[old_rows]
+
+        self._vectors, self._ids, self._norms, self._codes = vectors, ids, norms, codes
+        self._list_offsets = offsets
+
+    def _stored_rows(self, offsets=None):
+        # The rows of the stored encodings, list by list, in the current layout or in one with other list offsets
+        offsets = self._list_offsets if offsets is None else offsets
+        lists = np.repeat(np.arange(self.n_lists), self._list_sizes)
+        first_of_list = np.cumsum(self._list_sizes) - self._list_sizes
+        return offsets[lists] + np.arange(len(lists)) - first_of_list[lists]
+
+    def search(self, face_encodings_to_check, k=1, nprobe=None):
+        """
+        Finds the (approximately) k closest encodings in the index to each of a list of face encodings.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param k: how many of the closest encodings to return for each face, closest first
+        :param nprobe: how many inverted lists to scan per face. Defaults to the nprobe given to the constructor.
+        :return: A tuple of (ids, distances), each a numpy ndarray of shape (N, k). If fewer than k candidates were
+                 found for a face, the remaining ids are -1 and the distances inf.
+        """
+        self._merge_pending()
+        queries = np.asarray(face_encodings_to_check, dtype=np.float32).reshape(len(face_encodings_to_check), -1)
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+
+        if len(queries) == 0 or self._ids is None:
+            return np.full((len(queries), k), -1, dtype=np.int64), np.full((len(queries), k), np.inf, dtype=np.float32)
+
+        probes, _ = _top_k(face_distance_matrix(queries, self.centroids), nprobe)
+
+        # With product quantization the lists are scanned with approximate distances and the best `keep` candidates of
+        # each query are re-ranked exactly at the end. Without it the exact distances are computed right away.
+        keep = max(k, self.rerank) if self.pq_subvectors else k
+        best_rows = np.full((len(queries), keep), -1, dtype=np.intp)
+        best_distances = np.full((len(queries), keep), np.inf, dtype=np.float32)
+
+        # Visit every probed list once, together with all the queries that probe it
+        flat_lists = probes.ravel()
+        flat_queries = np.repeat(np.arange(len(queries)), probes.shape[1])
+        order = np.argsort(flat_lists, kind="stable")
+        flat_lists, flat_queries = flat_lists[order], flat_queries[order]
+        boundaries = np.flatnonzero(np.concatenate(([True], flat_lists[1:] != flat_lists[:-1], [True])))
+
+        for group_start, group_end in zip(boundaries[:-1], boundaries[1:]):
+            list_number = flat_lists[group_start]
+            start = self._list_offsets[list_number]
+            end = start + self._list_sizes[list_number]
+            if start == end:
+                continue
+
+            query_numbers = flat_queries[group_start:group_end]
+            if self.pq_subvectors:
+                distances = self._pq_distances(queries[query_numbers], list_number)
+            else:
+                distances = np.einsum("ij,ij->i", queries[query_numbers], queries[query_numbers])[:, np.newaxis] + self._norms[np.newaxis, start:end]
+                distances -= 2 * np.dot(queries[query_numbers], self._vectors[start:end].T)
+
+            _merge_candidates(best_rows, best_distances, query_numbers, np.arange(start, end), distances)
+
+        if self.pq_subvectors:
+            # Re-rank the candidates with their exact distance
+            candidates = self._vectors[np.maximum(best_rows, 0)]
+            exact = np.sum((candidates - queries[:, np.newaxis, :]) ** 2, axis=2)
+            best_distances = np.where(best_rows >= 0, exact, np.inf).astype(np.float32)
+            columns, best_distances = _top_k(best_distances, k)
+            best_rows = np.take_along_axis(best_rows, columns, axis=1)
+
+        result_ids = np.where(best_rows >= 0, self._ids[np.maximum(best_rows, 0)], -1)
+        return result_ids, np.sqrt(np.maximum(best_distances, 0))
+
+    def _pq_distances(self, queries, list_number):
+        """
+        Returns the approximate squared distances from each query to every encoding in an inverted list, using the codes.
+        """
+        start = self._list_offsets[list_number]
+        end = start + self._list_sizes[list_number]
+
+        # Lookup tables of squared distances from each query residual subvector to every codebook entry
+        residuals = (queries - self.centroids[list_number]).reshape(len(queries), self.pq_subvectors, 1, -1)
+        tables = np.sum((self.pq_codebooks[np.newaxis] - residuals) ** 2, axis=3)
+
+        codes = self._codes[start:end]
+        distances = np.zeros((len(queries), end - start), dtype=np.float32)
+        for m in range(self.pq_subvectors):
+            distances += tables[:, m, codes[:, m]]
+        return distances
+
+    def evaluate(self, face_encodings_to_check, k=10, nprobe_values=(1, 2, 4, 8, 16, 32)):
+        """
+        Compares the results and speed of search() against an exact brute force search over the same encodings.
+
+        :param face_encodings_to_check: List of N face encodings to use as queries
+        :param k: how many neighbors to compare
+        :param nprobe_values: the nprobe settings to measure
+        :return: A dict with the brute force time per query in milliseconds ("brute_force_ms") and a list ("runs") with
+                 the "nprobe", "recall" (fraction of the true k nearest neighbors found) and "ms_per_query" of each setting
+        """
+        self._merge_pending()
+        queries = np.asarray(face_encodings_to_check, dtype=np.float32)
+
+        rows = self._stored_rows()
+        vectors = self._vectors[rows]
+
+        # Brute force in small batches of queries so the distance matrix stays a reasonable size
+        start = time.perf_counter()
+        exact_rows = np.concatenate([_top_k(face_distance_matrix(queries[i:i + 16], vectors), k)[0]
+                                     for i in range(0, len(queries), 16)])
+        brute_force_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+        exact_ids = self._ids[rows][exact_rows]
+
+        runs = []
+        for nprobe in nprobe_values:
+            start = time.perf_counter()
+            ids, _ = self.search(queries, k, nprobe)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+            found = sum(len(np.intersect1d(expected, actual)) for expected, actual in zip(exact_ids, ids))
+            runs.append({
+                "nprobe": nprobe,
+                "recall": found / float(exact_ids.size) if exact_ids.size else 1.0,
+                "ms_per_query": elapsed_ms,
+            })
+
+        return {"brute_force_ms": brute_force_ms, "runs": runs}
@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import contextlib
+import io
+import math
+import os
+import threading
+import time
+
 import PIL.Image
 import dlib
 import numpy as np
 from PIL import ImageFile
 
+from .encoding_cache import image_digest
+from .profiling import stage
+
 try:
     import face_recognition_models
 except Exception:
@@ -14,19 +24,213 @@ except Exception:
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
-face_detector = dlib.get_frontal_face_detector()
+# dlib models are loaded lazily on first use instead of at import time, so that a process which only needs the
+# HOG detector (for example a face_detection worker) never pays for loading the CNN detector or the face encoder.
+_model_factories = {
+    "face_detector": lambda: dlib.get_frontal_face_detector(),
+    "pose_predictor_68_point": lambda: dlib.shape_predictor(face_recognition_models.pose_predictor_model_location()),
+    "pose_predictor_5_point": lambda: dlib.shape_predictor(face_recognition_models.pose_predictor_five_point_model_location()),
+    "cnn_face_detector": lambda: dlib.cnn_face_detection_model_v1(face_recognition_models.cnn_face_detector_model_location()),
+    "face_encoder": lambda: dlib.face_recognition_model_v1(face_recognition_models.face_recognition_model_location()),
+}
+
+_model_load_times = {}
+_models_lock = threading.Lock()
+
+
+class _ModelPool(object):
+    """
+    A pool of instances of one dlib model.
+
+    dlib models keep scratch buffers between calls, so one instance must never be used by two threads at once. Rather
+    than serializing every call behind a lock, each call checks an instance out of the pool for its own use and a new
+    instance is loaded whenever all of them are busy, up to max_instances. Past that, callers wait for an instance to
+    be released, so a burst of threads can't load more copies of a model than there are cores to run them.
+    """
+
+    def __init__(self, name, max_instances=None):
+        """
+        :param name: name of the model. One of the keys of `_model_factories`.
+        :param max_instances: the most instances to load. Defaults to the number of CPU cores.
+        """
+        self.name = name
+        self.max_instances = max_instances or os.cpu_count() or 1
+        self._instances = []
+        self._free = []
+        self._loading = 0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._instances)
+
+    def _load(self):
+        # The caller has already counted this load in self._loading
+        start = time.perf_counter()
+        try:
+            model = _model_factories[self.name]()
+        except Exception:
+            with self._lock:
+                self._loading -= 1
+                self._released.notify()
+            raise
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._instances.append(model)
+            self._loading -= 1
+            _model_load_times.setdefault(self.name, elapsed)
+        return model
+
+    def acquire(self):
+        with self._lock:
+            while not self._free and len(self._instances) + self._loading >= self.max_instances:
+                self._released.wait()
+            if self._free:
+                return self._free.pop()
+            self._loading += 1
+
+        # Load outside of the lock so threads that find a free instance don't wait for the load
+        return self._load()
+
+    def release(self, model):
+        with self._lock:
+            self._free.append(model)
+            self._released.notify()
+
+    @contextlib.contextmanager
+    def checkout(self):
+        model = self.acquire()
+        try:
+            yield model
+        finally:
+            self.release(model)
+
+    def reserve(self, instances):
+        """
+        Makes sure the pool holds at least the given number of instances, raising max_instances if it is lower.
+        """
+        while True:
+            with self._lock:
+                self.max_instances = max(self.max_instances, instances)
+                if len(self._instances) + self._loading >= instances:
+                    return
+                self._loading += 1
+            self.release(self._load())
+
+    def first(self):
+        """
+        Returns the first instance of the pool, loading it if needed. It stays in the pool, so it is only safe to use
+        from one thread at a time.
+        """
+        self.reserve(1)
+        return self._instances[0]
+
+
+_model_pools = {}
+
+
+def _get_model_pool(name):
+    """
+    Returns the pool of instances of the dlib model registered under the given name.
+
+    :param name: name of the model. One of the keys of `_model_factories`.
+    :return: a _ModelPool
+    """
+    pool = _model_pools.get(name)
+    if pool is None:
+        if name not in _model_factories:
+            raise ValueError("Unknown model '{}'. Supported models are {}.".format(name, sorted(_model_factories)))
+
+        with _models_lock:
+            pool = _model_pools.setdefault(name, _ModelPool(name))
 
-predictor_68_point_model = face_recognition_models.pose_predictor_model_location()
-pose_predictor_68_point = dlib.shape_predictor(predictor_68_point_model)
+    return pool
 
-predictor_5_point_model = face_recognition_models.pose_predictor_five_point_model_location()
-pose_predictor_5_point = dlib.shape_predictor(predictor_5_point_model)
 
-cnn_face_detection_model = face_recognition_models.cnn_face_detector_model_location()
-cnn_face_detector = dlib.cnn_face_detection_model_v1(cnn_face_detection_model)
+def _checkout_model(name):
+    """
+    Checks an instance of a dlib model out for the calling thread. Use as `with _checkout_model(name) as model:`.
+    """
+    return _get_model_pool(name).checkout()
+
+
+def _get_model(name):
+    """
+    Returns the first loaded instance of the dlib model registered under the given name, loading it if needed.
+    This instance is shared, library code checks a model out with _checkout_model() instead.
+
+    :param name: name of the model. One of the keys of `_model_factories`.
+    :return: the loaded dlib model object
+    """
+    return _get_model_pool(name).first()
+
+
+def preload(models=None, instances=1):
+    """
+    Loads dlib models ahead of time so the first call to face_locations(), face_encodings(), etc doesn't have to.
+    Useful for servers that want a warm start. Models that are already loaded are not loaded again.
+
+    Calls made from different threads at the same time each use their own instance of a model, so they don't have to
+    wait for each other, up to one instance per CPU core. Set instances to the number of threads that will call the
+    library (i.e. one per camera) to load all of those instances up front and allow that many at once.
+
+    :param models: Optional - a list of model names to load. Supported names are "face_detector", "cnn_face_detector",
+                   "pose_predictor_68_point", "pose_predictor_5_point" and "face_encoder". Defaults to all of them.
+    :param instances: how many instances of each model to load
+    :return: A dict of model name to the number of seconds it took to load that model
+    """
+    if models is None:
+        models = list(_model_factories)
 
-face_recognition_model = face_recognition_models.face_recognition_model_location()
-face_encoder = dlib.face_recognition_model_v1(face_recognition_model)
+    for name in models:
+        _get_model_pool(name).reserve(instances)
+
+    return {name: _model_load_times[name] for name in models}
+
+
+def model_load_times():
+    """
+    Returns how long each model that has been loaded so far took to load.
+
+    :return: A dict of model name to load time in seconds. Models that haven't been loaded yet are not included.
+    """
+    return dict(_model_load_times)
+
+
+def model_instance_counts():
+    """
+    Returns how many instances of each model have been loaded so far. More than one instance of a model is loaded
+    when it is used from several threads at the same time.
+
+    :return: A dict of model name to number of loaded instances
+    """
+    return {name: len(pool) for name, pool in _model_pools.items() if len(pool)}
+
+
+class _LazyModel(object):
+    # Stands in for one of the old module level model attributes (i.e. `api.face_encoder`), loading the model on first
+    # use. A module level __getattr__ would do the same, but needs Python 3.7.
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(_get_model(self._name), attribute)
+
+    def __call__(self, *args, **kwargs):
+        return _get_model(self._name)(*args, **kwargs)
+
+    def __repr__(self):
+        return "<lazily loaded {}>".format(self._name)
+
+
+face_detector = _LazyModel("face_detector")
+pose_predictor_68_point = _LazyModel("pose_predictor_68_point")
+pose_predictor_5_point = _LazyModel("pose_predictor_5_point")
+cnn_face_detector = _LazyModel("cnn_face_detector")
+face_encoder = _LazyModel("face_encoder")
 
 
 def _rect_to_css(rect):
@@ -72,21 +276,102 @@ def face_distance(face_encodings, face_to_compare):
     if len(face_encodings) == 0:
         return np.empty((0))
 
-    return np.linalg.norm(face_encodings - face_to_compare, axis=1)
+    with stage("match", len(face_encodings)):
+        return np.linalg.norm(face_encodings - face_to_compare, axis=1)
 
 
-def load_image_file(file, mode='RGB'):
+def face_distance_matrix(face_encodings_to_check, known_face_encodings):
+    """
+    Given two lists of face encodings, get the euclidean distance between every pair of faces in a single pass.
+
+    This is equivalent to calling face_distance() once for every face encoding to check, but is computed as one
+    float32 matrix product (|a|^2 + |b|^2 - 2ab) so it stays fast with many faces and thousands of known encodings.
+
+    :param face_encodings_to_check: List of N face encodings (i.e. every face found in a frame)
+    :param known_face_encodings: List of M known face encodings to compare against
+    :return: A float32 numpy ndarray of shape (N, M) where [i, j] is the distance between face i and known face j
+    """
+    if len(face_encodings_to_check) == 0 or len(known_face_encodings) == 0:
+        return np.empty((len(face_encodings_to_check), len(known_face_encodings)), dtype=np.float32)
+
+    with stage("match", len(face_encodings_to_check) * len(known_face_encodings)):
+        squared_distances = _squared_distance_matrix(np.asarray(face_encodings_to_check, dtype=np.float32),
+                                                     np.asarray(known_face_encodings, dtype=np.float32))
+        return np.sqrt(squared_distances, out=squared_distances)
+
+
+def _squared_distance_matrix(a, b):
+    """
+    Returns the matrix of squared euclidean distances between the rows of two 2d arrays, as |a|^2 + |b|^2 - 2ab.
+    """
+    squared_distances = np.einsum("ij,ij->i", a, a)[:, np.newaxis] + np.einsum("ij,ij->i", b, b)[np.newaxis, :]
+    squared_distances -= 2 * np.dot(a, b.T)
+
+    # Rounding can make the distance between (almost) identical faces slightly negative
+    return np.maximum(squared_distances, 0, out=squared_distances)
+
+
+def match_faces(face_encodings_to_check, known_face_encodings, tolerance=0.6, top_k=1):
+    """
+    Find the closest known faces for each of a list of face encodings in a single pass.
+
+    :param face_encodings_to_check: List of N face encodings (i.e. every face found in a frame)
+    :param known_face_encodings: List of M known face encodings to compare against
+    :param tolerance: How much distance between faces to consider it a match. Lower is more strict. 0.6 is typical best performance.
+    :param top_k: How many of the closest known faces to return for each face, closest first.
+    :return: A tuple of (indices, distances, matches), each a numpy ndarray of shape (N, min(top_k, M)). indices holds the
+             positions in known_face_encodings of the closest known faces, distances their distance to the face and matches
+             is True where that distance is within tolerance.
+    """
+    indices, best_distances = _top_k(face_distance_matrix(face_encodings_to_check, known_face_encodings), top_k)
+    return indices, best_distances, best_distances <= tolerance
+
+
+def _top_k(distances, k):
+    """
+    Returns the column indices and values of the k smallest values in each row of a distance matrix, smallest first.
+    """
+    k = min(k, distances.shape[1])
+
+    if k < distances.shape[1]:
+        columns = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(distances.shape[1]), (distances.shape[0], 1))
+
+    best_distances = np.take_along_axis(distances, columns, axis=1)
+    order = np.argsort(best_distances, axis=1)
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(best_distances, order, axis=1)
+
+
+def load_image_file(file, mode='RGB', max_dimension=None):
     """
     Loads an image file (.jpg, .png, etc) into a numpy array
 
-    :param file: image file name or file object to load
+    :param file: image file name, file object or the raw bytes of an image file to load
     :param mode: format to convert the image to. Only 'RGB' (8-bit RGB, 3 channels) and 'L' (black and white) are supported.
+    :param max_dimension: Optional - if the image is bigger than this many pixels on its longest side, scale it down to
+                          fit. JPEG files are decoded directly at a reduced size which is much faster and uses much less
+                          memory than decoding the full image and shrinking it afterwards.
     :return: image contents as numpy array
     """
-    im = PIL.Image.open(file)
-    if mode:
-        im = im.convert(mode)
-    return np.array(im)
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        file = io.BytesIO(file)
+
+    with stage("decode") as timed:
+        im = PIL.Image.open(file)
+
+        if max_dimension and max(im.size) > max_dimension:
+            scale = float(max_dimension) / max(im.size)
+            # Let the JPEG decoder skip straight to the smallest power-of-two reduction that is still at least this big
+            im.draft(mode, (int(math.ceil(im.size[0] * scale)), int(math.ceil(im.size[1] * scale))))
+            if max(im.size) > max_dimension:
+                im.thumbnail((max_dimension, max_dimension), PIL.Image.LANCZOS)
+
+        if mode:
+            im = im.convert(mode)
+        image = np.array(im)
+        timed.size = image.shape[0] * image.shape[1]
+    return image
 
 
 def _raw_face_locations(img, number_of_times_to_upsample=1, model="hog"):
@@ -99,13 +384,141 @@ def _raw_face_locations(img, number_of_times_to_upsample=1, model="hog"):
                   deep-learning model which is GPU/CUDA accelerated (if available). The default is "hog".
     :return: A list of dlib 'rect' objects of found face locations
     """
+    with _checkout_model("cnn_face_detector" if model == "cnn" else "face_detector") as detector:
+        with stage("detect", (img.shape[0] * img.shape[1]) << (2 * number_of_times_to_upsample)):
+            return detector(img, number_of_times_to_upsample)
+
+
+def _raw_face_locations_with_scores(img, number_of_times_to_upsample=1, model="hog"):
+    """
+    Returns the bounding boxes of human faces in an image together with how confident the detector is about each one.
+
+    :return: A tuple of (locations, scores): a list of tuples of face locations in css (top, right, bottom, left) order
+             and a list of detection scores. Scores of the "hog" and "cnn" models are on different scales.
+    """
     if model == "cnn":
-        return cnn_face_detector(img, number_of_times_to_upsample)
-    else:
-        return face_detector(img, number_of_times_to_upsample)
+        detections = _raw_face_locations(img, number_of_times_to_upsample, "cnn")
+        return [_trim_css_to_bounds(_rect_to_css(face.rect), img.shape) for face in detections], [face.confidence for face in detections]
+
+    with _checkout_model("face_detector") as detector:
+        with stage("detect", (img.shape[0] * img.shape[1]) << (2 * number_of_times_to_upsample)):
+            detections, scores, _ = detector.run(img, number_of_times_to_upsample, 0.0)
+    return [_trim_css_to_bounds(_rect_to_css(face), img.shape) for face in detections], list(scores)
 
 
-def face_locations(img, number_of_times_to_upsample=1, model="hog"):
+def _non_max_suppression(locations, scores, threshold=0.5):
+    """
+    Drops every face location that overlaps a higher scoring one by more than threshold, measured as the area of their
+    intersection over the area of the smaller of the two. Unlike intersection over union, this also catches a face
+    that was cut off at the edge of a tile, which lies almost entirely inside the full detection of the same face.
+
+    :param locations: numpy array of shape (N, 4) of face locations in css (top, right, bottom, left) order
+    :param scores: numpy array of N detection scores
+    :param threshold: how much two locations have to overlap to be considered the same face
+    :return: a numpy array of the indexes of the locations to keep, highest score first
+    """
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    top, right, bottom, left = np.asarray(locations, dtype=np.int64)[order].T
+
+    intersection_heights = np.minimum(bottom[:, np.newaxis], bottom) - np.maximum(top[:, np.newaxis], top)
+    intersection_widths = np.minimum(right[:, np.newaxis], right) - np.maximum(left[:, np.newaxis], left)
+    intersections = np.clip(intersection_heights, 0, None) * np.clip(intersection_widths, 0, None)
+    areas = np.maximum((bottom - top) * (right - left), 1)
+    overlaps = intersections / np.minimum(areas[:, np.newaxis], areas)
+
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1:] &= overlaps[i, i + 1:] <= threshold
+    return order[keep]
+
+
+def _tile_spans(size, count, overlap):
+    """
+    Splits size pixels into count equal tiles, each grown on both sides so neighboring tiles share overlap times the
+    tile size.
+
+    :return: a list of (start, end) tuples
+    """
+    tile_size = int(math.ceil(size / float(count)))
+    margin = int(math.ceil(tile_size * overlap / 2.0))
+    return [(max(0, i * tile_size - margin), min(size, (i + 1) * tile_size + margin)) for i in range(count)]
+
+
+def _detect_tile(arguments):
+    # Module level so that a process pool can run it
+    tile, top, left, scale, number_of_times_to_upsample, model = arguments
+    locations, scores = _raw_face_locations_with_scores(tile, number_of_times_to_upsample, model)
+    if scale != 1.0:
+        locations = [tuple(int(round(v / scale)) for v in location) for location in locations]
+    return [(t + top, r + left, b + top, l + left) for t, r, b, l in locations], scores
+
+
+def _detect_in_parts(jobs, image_shape, pool):
+    """
+    Detects faces in parts of an image (tiles or regions) and merges the faces found in more than one part.
+
+    :param jobs: an iterable of (part, top, left, scale, number_of_times_to_upsample, model) tuples, where part is the
+                 image of the part scaled by scale and (top, left) is where the part starts in the whole image
+    :param image_shape: the shape of the whole image
+    :param pool: Optional - an executor or pool whose map() detects the parts in parallel
+    :return: A list of tuples of found face locations in css (top, right, bottom, left) order
+    """
+    locations = []
+    scores = []
+    for part_locations, part_scores in (pool.map if pool is not None else map)(_detect_tile, jobs):
+        locations.extend(part_locations)
+        scores.extend(part_scores)
+
+    if not locations:
+        return []
+
+    # Faces near the edge of a part are found by every part that contains them, so keep only the best detection of each
+    keep = _non_max_suppression(locations, scores)
+    return [_trim_css_to_bounds(locations[i], image_shape) for i in keep]
+
+
+def _tiled_face_locations(img, number_of_times_to_upsample, model, tiles, overlap, pool):
+    rows, columns = tiles
+    if rows < 1 or columns < 1:
+        raise ValueError("tiles must be a (rows, columns) tuple of positive numbers, got {}.".format(tiles))
+
+    # dlib's HOG detector ignores the strides of numpy views and silently finds nothing in them, so every tile is
+    # copied. A copy costs far less than detecting faces in it and only one tile is held at a time without a pool.
+    jobs = ((np.ascontiguousarray(img[top:bottom, left:right]), top, left, 1.0, number_of_times_to_upsample, model)
+            for top, bottom in _tile_spans(img.shape[0], rows, overlap)
+            for left, right in _tile_spans(img.shape[1], columns, overlap))
+
+    return _detect_in_parts(jobs, img.shape, pool)
+
+
+def _region_jobs(img, regions, number_of_times_to_upsample, model, margin, min_size):
+    for region in regions:
+        top, right, bottom, left = region
+        vertical_margin = int(round((bottom - top) * margin))
+        horizontal_margin = int(round((right - left) * margin))
+        top, right, bottom, left = _trim_css_to_bounds(
+            (top - vertical_margin, right + horizontal_margin, bottom + vertical_margin, left - horizontal_margin), img.shape)
+        if bottom <= top or right <= left:
+            continue
+
+        view = img[top:bottom, left:right]
+        scale = float(min_size) / min(view.shape[:2]) if min_size else 1.0
+        if scale > 1.0:
+            # Resizing reads straight from the view, so the region is only copied once, at its new size
+            size = (int(round(view.shape[1] * scale)), int(round(view.shape[0] * scale)))
+            part = np.array(PIL.Image.fromarray(view).resize(size, PIL.Image.BILINEAR))
+            scale = (float(size[0]) / view.shape[1] + float(size[1]) / view.shape[0]) / 2
+        else:
+            # See _tiled_face_locations() for why the region can't be passed to dlib as a view
+            part = np.ascontiguousarray(view)
+            scale = 1.0
+
+        yield part, top, left, scale, number_of_times_to_upsample, model
+
+
+def face_locations(img, number_of_times_to_upsample=1, model="hog", cache=None, tiles=None, overlap=0.2, pool=None,
+                   regions=None, region_margin=0.1, min_region_size=160):
     """
     Returns an array of bounding boxes of human faces in a image
 
@@ -113,8 +526,50 @@ def face_locations(img, number_of_times_to_upsample=1, model="hog"):
     :param number_of_times_to_upsample: How many times to upsample the image looking for faces. Higher numbers find smaller faces.
     :param model: Which face detection model to use. "hog" is less accurate but faster on CPUs. "cnn" is a more accurate
                   deep-learning model which is GPU/CUDA accelerated (if available). The default is "hog".
-    :return: A list of tuples of found face locations in css (top, right, bottom, left) order
+    :param cache: Optional - an EncodingCache to look the result up in (and store it in), keyed by the image content.
+    :param tiles: Optional - a (rows, columns) tuple to split the image into overlapping tiles and detect faces in each
+                  tile separately, i.e. to find small faces in 4K video. Each tile is upsampled on its own, so the
+                  upsampled image is never in memory as a whole, and the tiles can be detected in parallel. Faces
+                  found by more than one tile are merged.
+    :param overlap: With tiles, how much neighboring tiles overlap, as a fraction of the tile size. Faces up to this
+                    fraction of a tile across are always entirely inside one of the tiles.
+    :param pool: Optional - with tiles or regions, a concurrent.futures executor or multiprocessing pool whose map()
+                 detects the tiles or regions in parallel. The "hog" detector releases the GIL, so a ThreadPoolExecutor
+                 works well.
+    :param regions: Optional - a list of (top, right, bottom, left) areas of the image to look for faces in, i.e. the
+                    heads of people found by a person detector or the zones a camera should watch. The rest of the
+                    image is skipped. Faces found in more than one region are merged.
+    :param region_margin: With regions, how much to grow each region on every side, as a fraction of its size, so
+                          faces at the edge of a region are found too.
+    :param min_region_size: With regions, regions whose shortest side is smaller than this many pixels are scaled up to
+                            it before detection, so far away faces become big enough for the detector. None to never
+                            scale regions.
+    :return: A list of tuples of found face locations in css (top, right, bottom, left) order, in the coordinates of
+             the whole image
     """
+    if tiles is not None and regions is not None:
+        raise ValueError("Pass either tiles or regions, not both.")
+
+    if cache is not None:
+        settings = {"model": model, "number_of_times_to_upsample": number_of_times_to_upsample}
+        if tiles is not None:
+            settings.update(tiles=tuple(tiles), overlap=overlap)
+        if regions is not None:
+            settings.update(regions=[tuple(int(v) for v in region) for region in regions], region_margin=region_margin,
+                            min_region_size=min_region_size)
+        key = cache.key(image_digest(img), "locations", **settings)
+        locations, _ = cache.get_or_compute(key, lambda: (face_locations(
+            img, number_of_times_to_upsample, model, tiles=tiles, overlap=overlap, pool=pool, regions=regions,
+            region_margin=region_margin, min_region_size=min_region_size), []))
+        return locations
+
+    if tiles is not None:
+        return _tiled_face_locations(img, number_of_times_to_upsample, model, tiles, overlap, pool)
+
+    if regions is not None:
+        jobs = _region_jobs(img, regions, number_of_times_to_upsample, model, region_margin, min_region_size)
+        return _detect_in_parts(jobs, img.shape, pool)
+
     if model == "cnn":
         return [_trim_css_to_bounds(_rect_to_css(face.rect), img.shape) for face in _raw_face_locations(img, number_of_times_to_upsample, "cnn")]
     else:
@@ -129,26 +584,117 @@ def _raw_face_locations_batched(images, number_of_times_to_upsample=1, batch_siz
     :param number_of_times_to_upsample: How many times to upsample the image looking for faces. Higher numbers find smaller faces.
     :return: A list of dlib 'rect' objects of found face locations
     """
-    return cnn_face_detector(images, number_of_times_to_upsample, batch_size=batch_size)
+    with _checkout_model("cnn_face_detector") as detector:
+        with stage("detect", sum(image.shape[0] * image.shape[1] for image in images) << (2 * number_of_times_to_upsample)):
+            return detector(images, number_of_times_to_upsample, batch_size=batch_size)
 
 
-def batch_face_locations(images, number_of_times_to_upsample=1, batch_size=128):
+def _bucket_shape(image_shape, bucket_granularity):
+    """
+    Rounds an image's height and width up to a multiple of bucket_granularity so similarly sized images share a bucket.
+    """
+    return tuple(-(-size // bucket_granularity) * bucket_granularity for size in image_shape[:2]) + tuple(image_shape[2:])
+
+
+def _pad_to_shape(image, shape):
+    """
+    Pads an image with black pixels on the bottom and right so it has the given shape. Face coordinates found in the
+    padded image are the same as in the original image.
+    """
+    if image.shape == shape:
+        return image
+
+    padded = np.zeros(shape, dtype=image.dtype)
+    padded[:image.shape[0], :image.shape[1]] = image
+    return padded
+
+
+def _detect_bucket(bucket, number_of_times_to_upsample, batch_size):
+    """
+    Runs the cnn face detector over a list of (index, image) entries that share a bucket.
+
+    :return: A dict of input index to a list of face locations in css (top, right, bottom, left) order
+    """
+    shape = tuple(max(image.shape[axis] for _, image in bucket) for axis in range(bucket[0][1].ndim))
+    padded_images = [_pad_to_shape(image, shape) for _, image in bucket]
+
+    raw_detections_batched = _raw_face_locations_batched(padded_images, number_of_times_to_upsample, batch_size)
+
+    results = {}
+    for (index, image), detections in zip(bucket, raw_detections_batched):
+        locations = [_trim_css_to_bounds(_rect_to_css(face.rect), image.shape) for face in detections]
+        # Drop detections that were entirely inside the padding
+        results[index] = [(top, right, bottom, left) for top, right, bottom, left in locations if bottom > top and right > left]
+    return results
+
+
+def iter_batch_face_locations(images, number_of_times_to_upsample=1, batch_size=128, bucket_granularity=64, max_pending=None):
+    """
+    Finds the faces in a stream of images of possibly different sizes using the cnn face detector, yielding the
+    results for each image in input order.
+
+    Images are grouped into buckets of similar resolution. Images in a bucket are padded to a common size and sent to
+    the cnn face detector together once batch_size images have been collected (or the input runs out). So that an
+    image in a rarely used bucket can't hold back the results of every image after it, its bucket is sent early, only
+    partially filled, once max_pending images are waiting for a result. That also bounds how many images are held in
+    memory, which matters for endless streams like a camera.
+
+    :param images: An iterable of images (each as a numpy array)
+    :param number_of_times_to_upsample: How many times to upsample the image looking for faces. Higher numbers find smaller faces.
+    :param batch_size: How many images to include in each GPU processing batch.
+    :param bucket_granularity: Images whose height and width round up to the same multiple of this many pixels are batched together.
+    :param max_pending: the most images to hold while waiting for the oldest one's result. Defaults to batch_size.
+    :return: A generator of lists of tuples of found face locations in css (top, right, bottom, left) order, one list per input image
+    """
+    max_pending = max_pending or batch_size
+    pending_buckets = {}
+    results = {}
+    next_index = 0
+
+    for index, image in enumerate(images):
+        bucket_key = _bucket_shape(image.shape, bucket_granularity)
+        bucket = pending_buckets.setdefault(bucket_key, [])
+        bucket.append((index, image))
+
+        if len(bucket) >= batch_size:
+            results.update(_detect_bucket(pending_buckets.pop(bucket_key), number_of_times_to_upsample, batch_size))
+
+        while True:
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+
+            if index - next_index + 1 < max_pending:
+                break
+
+            # The oldest image still waiting is always the first one of its bucket
+            oldest_key = next(key for key, entries in pending_buckets.items() if entries[0][0] == next_index)
+            results.update(_detect_bucket(pending_buckets.pop(oldest_key), number_of_times_to_upsample, batch_size))
+
+    # Flush the partially filled buckets, oldest first, so results can keep streaming out in order
+    for bucket in sorted(pending_buckets.values(), key=lambda entries: entries[0][0]):
+        results.update(_detect_bucket(bucket, number_of_times_to_upsample, batch_size))
+
+        while next_index in results:
+            yield results.pop(next_index)
+            next_index += 1
+
+
+def batch_face_locations(images, number_of_times_to_upsample=1, batch_size=128, bucket_granularity=64):
     """
     Returns an 2d array of bounding boxes of human faces in a image using the cnn face detector
     If you are using a GPU, this can give you much faster results since the GPU
     can process batches of images at once. If you aren't using a GPU, you don't need this function.
 
+    The images don't need to be the same size. See iter_batch_face_locations() for how mixed sizes are batched.
+
     :param images: A list of images (each as a numpy array)
     :param number_of_times_to_upsample: How many times to upsample the image looking for faces. Higher numbers find smaller faces.
     :param batch_size: How many images to include in each GPU processing batch.
+    :param bucket_granularity: Images whose height and width round up to the same multiple of this many pixels are batched together.
     :return: A list of tuples of found face locations in css (top, right, bottom, left) order
     """
-    def convert_cnn_detections_to_css(detections):
-        return [_trim_css_to_bounds(_rect_to_css(face.rect), images[0].shape) for face in detections]
-
-    raw_detections_batched = _raw_face_locations_batched(images, number_of_times_to_upsample, batch_size)
-
-    return list(map(convert_cnn_detections_to_css, raw_detections_batched))
+    return list(iter_batch_face_locations(images, number_of_times_to_upsample, batch_size, bucket_granularity))
 
 
 def _raw_face_landmarks(face_image, face_locations=None, model="large"):
@@ -157,12 +703,39 @@ def _raw_face_landmarks(face_image, face_locations=None, model="large"):
     else:
         face_locations = [_css_to_rect(face_location) for face_location in face_locations]
 
-    pose_predictor = pose_predictor_68_point
-
-    if model == "small":
-        pose_predictor = pose_predictor_5_point
-
-    return [pose_predictor(face_image, face_location) for face_location in face_locations]
+    with _checkout_model("pose_predictor_5_point" if model == "small" else "pose_predictor_68_point") as pose_predictor:
+        with stage("landmarks", len(face_locations)):
+            return [pose_predictor(face_image, face_location) for face_location in face_locations]
+
+
+# Indexes of the points that make up each facial feature in the 68 and 5 point landmark models.
+# For a definition of each point index, see https://cdn-images-1.medium.com/max/1600/1*AbEg31EgkbXSQehuNJBlWg.png
+FACE_LANDMARKS_68_POINT = {
+    "chin": list(range(0, 17)),
+    "left_eyebrow": list(range(17, 22)),
+    "right_eyebrow": list(range(22, 27)),
+    "nose_bridge": list(range(27, 31)),
+    "nose_tip": list(range(31, 36)),
+    "left_eye": list(range(36, 42)),
+    "right_eye": list(range(42, 48)),
+    "top_lip": list(range(48, 55)) + [64, 63, 62, 61, 60],
+    "bottom_lip": list(range(54, 60)) + [48, 60, 67, 66, 65, 64],
+}
+
+FACE_LANDMARKS_5_POINT = {
+    "nose_tip": [4],
+    "left_eye": [2, 3],
+    "right_eye": [0, 1],
+}
+
+
+def _landmark_feature_indexes(model):
+    if model == "large":
+        return FACE_LANDMARKS_68_POINT
+    elif model == "small":
+        return FACE_LANDMARKS_5_POINT
+    else:
+        raise ValueError("Invalid landmarks model type. Supported models are ['small', 'large'].")
 
 
 def face_landmarks(face_image, face_locations=None, model="large"):
@@ -174,33 +747,41 @@ def face_landmarks(face_image, face_locations=None, model="large"):
     :param model: Optional - which model to use. "large" (default) or "small" which only returns 5 points but is faster.
     :return: A list of dicts of face feature locations (eyes, nose, etc)
     """
+    feature_indexes = _landmark_feature_indexes(model)
     landmarks = _raw_face_landmarks(face_image, face_locations, model)
     landmarks_as_tuples = [[(p.x, p.y) for p in landmark.parts()] for landmark in landmarks]
 
-    # For a definition of each point index, see https://cdn-images-1.medium.com/max/1600/1*AbEg31EgkbXSQehuNJBlWg.png
-    if model == 'large':
-        return [{
-            "chin": points[0:17],
-            "left_eyebrow": points[17:22],
-            "right_eyebrow": points[22:27],
-            "nose_bridge": points[27:31],
-            "nose_tip": points[31:36],
-            "left_eye": points[36:42],
-            "right_eye": points[42:48],
-            "top_lip": points[48:55] + [points[64]] + [points[63]] + [points[62]] + [points[61]] + [points[60]],
-            "bottom_lip": points[54:60] + [points[48]] + [points[60]] + [points[67]] + [points[66]] + [points[65]] + [points[64]]
-        } for points in landmarks_as_tuples]
-    elif model == 'small':
-        return [{
-            "nose_tip": [points[4]],
-            "left_eye": points[2:4],
-            "right_eye": points[0:2],
-        } for points in landmarks_as_tuples]
-    else:
-        raise ValueError("Invalid landmarks model type. Supported models are ['small', 'large'].")
+    return [{
+        feature: [points[i] for i in indexes] for feature, indexes in feature_indexes.items()
+    } for points in landmarks_as_tuples]
 
 
-def face_encodings(face_image, known_face_locations=None, num_jitters=1, model="small"):
+def face_landmarks_array(face_image, face_locations=None, model="large"):
+    """
+    Given an image, returns the face landmark points of every face in the image as a single numpy array.
+
+    This is much cheaper than face_landmarks() when processing many faces per frame. Use FACE_LANDMARKS_68_POINT or
+    FACE_LANDMARKS_5_POINT to pick out a facial feature for every face at once, i.e.
+    `points[:, FACE_LANDMARKS_68_POINT["left_eye"]]` is an (N, 6, 2) array of left eye points.
+
+    :param face_image: image to search
+    :param face_locations: Optionally provide a list of face locations to check.
+    :param model: Optional - which model to use. "large" (default) or "small" which only returns 5 points but is faster.
+    :return: An int32 numpy array of shape (N, 68, 2) for the "large" model or (N, 5, 2) for the "small" model holding
+             the (x, y) coordinates of each landmark point of each face
+    """
+    # Raises a ValueError for unsupported models before doing any work
+    _landmark_feature_indexes(model)
+    num_points = 68 if model == "large" else 5
+
+    landmarks = _raw_face_landmarks(face_image, face_locations, model)
+    points = np.empty((len(landmarks), num_points, 2), dtype=np.int32)
+    for face_index, landmark in enumerate(landmarks):
+        points[face_index] = [(p.x, p.y) for p in landmark.parts()]
+    return points
+
+
+def face_encodings(face_image, known_face_locations=None, num_jitters=1, model="small", cache=None, regions=None):
     """
     Given an image, return the 128-dimension face encoding for each face in the image.
 
@@ -208,10 +789,202 @@ def face_encodings(face_image, known_face_locations=None, num_jitters=1, model="
     :param known_face_locations: Optional - the bounding boxes of each face if you already know them.
     :param num_jitters: How many times to re-sample the face when calculating encoding. Higher is more accurate, but slower (i.e. 100 is 100x slower)
     :param model: Optional - which model to use. "large" or "small" (default) which only returns 5 points but is faster.
+    :param cache: Optional - an EncodingCache to look the result up in (and store it in), keyed by the image content.
+    :param regions: Optional - if known_face_locations isn't given, only look for faces inside these (top, right,
+                    bottom, left) areas of the image. See face_locations() for more control over how regions are searched.
     :return: A list of 128-dimensional face encodings (one for each face in the image)
     """
+    if regions is not None and known_face_locations is None:
+        known_face_locations = face_locations(face_image, regions=regions, cache=cache)
+
+    if cache is not None:
+        if known_face_locations is not None:
+            known_face_locations = [tuple(int(v) for v in location) for location in known_face_locations]
+        key = cache.key(image_digest(face_image), "encodings", known_face_locations=known_face_locations,
+                        num_jitters=num_jitters, model=model)
+
+        def compute():
+            if known_face_locations is not None:
+                return known_face_locations, face_encodings(face_image, known_face_locations, num_jitters, model)
+            return _locate_and_encode(face_image, num_jitters, model)
+
+        _, encodings = cache.get_or_compute(key, compute)
+        return [encoding.astype(np.float64) for encoding in encodings]
+
     raw_landmarks = _raw_face_landmarks(face_image, known_face_locations, model)
-    return [np.array(face_encoder.compute_face_descriptor(face_image, raw_landmark_set, num_jitters)) for raw_landmark_set in raw_landmarks]
+    if not raw_landmarks:
+        return []
+
+    # Encode every face in the image with a single call instead of one call per face
+    with _checkout_model("face_encoder") as face_encoder:
+        with stage("encode", len(raw_landmarks) * num_jitters):
+            encodings = face_encoder.compute_face_descriptor(face_image, _to_full_object_detections(raw_landmarks), num_jitters)
+    return [np.array(encoding) for encoding in encodings]
+
+
+def _locate_and_encode(face_image, num_jitters=1, model="small"):
+    """
+    Finds and encodes every face in an image, for callers that cache both. The locations are trimmed to the image like
+    face_locations() returns them, but the untrimmed boxes are encoded like face_encodings() does without
+    known_face_locations, so faces that touch the edge of the image get the same encodings with or without a cache.
+
+    :return: A tuple of (list of face locations in css (top, right, bottom, left) order, list of face encodings)
+    """
+    raw_locations = [_rect_to_css(face) for face in _raw_face_locations(face_image)]
+    locations = [_trim_css_to_bounds(location, face_image.shape) for location in raw_locations]
+    return locations, face_encodings(face_image, raw_locations, num_jitters, model)
+
+
+def _to_full_object_detections(raw_landmarks):
+    detections = dlib.full_object_detections()
+    detections.extend(raw_landmarks)
+    return detections
+
+
+def _batches_by_face_count(faces_per_image, batch_size):
+    """
+    Groups (image_index, image, detections) entries into batches holding at most batch_size faces each.
+    An image with more than batch_size faces is put in a batch on its own.
+    """
+    batch = []
+    batch_face_count = 0
+
+    for entry in faces_per_image:
+        face_count = len(entry[2])
+        if batch and batch_face_count + face_count > batch_size:
+            yield batch
+            batch = []
+            batch_face_count = 0
+        batch.append(entry)
+        batch_face_count += face_count
+
+    if batch:
+        yield batch
+
+
+def batch_face_encodings(images, locations_per_image=None, num_jitters=1, batch_size=128, model="small"):
+    """
+    Given a list of images, return the 128-dimension face encoding for every face in every image.
+
+    This packs the faces of many images into a few batched calls to the face encoder, which is a lot faster
+    than calling face_encodings() once per image when encoding large numbers of images.
+
+    :param images: A list of images (each as a numpy array)
+    :param locations_per_image: Optional - a list with the bounding boxes of the faces in each image if you already know them.
+                                If not given, faces are found with the "hog" model.
+    :param num_jitters: How many times to re-sample the face when calculating encoding. Higher is more accurate, but slower (i.e. 100 is 100x slower)
+    :param batch_size: The maximum number of faces to send to the face encoder in a single call.
+    :param model: Optional - which model to use. "large" or "small" (default) which only returns 5 points but is faster.
+    :return: A tuple of (encodings, index). encodings is a float32 numpy array of shape (N, 128) with one row per face found.
+             index is an int numpy array of shape (N, 2) holding the (image index, face index within that image) of each row.
+    """
+    if locations_per_image is None:
+        locations_per_image = [None] * len(images)
+
+    faces_per_image = []
+    for image_index, (image, locations) in enumerate(zip(images, locations_per_image)):
+        raw_landmarks = _raw_face_landmarks(image, locations, model)
+        if raw_landmarks:
+            faces_per_image.append((image_index, image, _to_full_object_detections(raw_landmarks)))
+
+    face_count = sum(len(detections) for _, _, detections in faces_per_image)
+    encodings = np.empty((face_count, 128), dtype=np.float32)
+    index = np.empty((face_count, 2), dtype=np.intp)
+
+    row = 0
+    with _checkout_model("face_encoder") as face_encoder:
+        for batch in _batches_by_face_count(faces_per_image, batch_size):
+            batch_images = [image for _, image, _ in batch]
+            batch_faces = [detections for _, _, detections in batch]
+
+            with stage("encode", sum(len(detections) for detections in batch_faces) * num_jitters):
+                batch_encodings = face_encoder.compute_face_descriptor(batch_images, batch_faces, num_jitters)
+
+            for (image_index, _, detections), image_encodings in zip(batch, batch_encodings):
+                count = len(detections)
+                encodings[row:row + count] = np.array(image_encodings)
+                index[row:row + count, 0] = image_index
+                index[row:row + count, 1] = np.arange(count)
+                row += count
+
+    return encodings, index
+
+
+def _resize_to_max_width(img, max_width):
+    """
+    Scales an image down so it is at most max_width pixels wide.
+
+    :return: A tuple of (resized image, scale) where scale is resized size / original size. The original image is
+             returned unchanged with a scale of 1.0 if it is already narrow enough.
+    """
+    height, width = img.shape[:2]
+    if not max_width or width <= max_width:
+        return img, 1.0
+
+    scale = float(max_width) / width
+    resized = PIL.Image.fromarray(img).resize((max_width, max(1, int(round(height * scale)))), PIL.Image.BILINEAR)
+    return np.array(resized), scale
+
+
+def _scale_css(css, scale, image_shape):
+    """
+    Scales a tuple in (top, right, bottom, left) order found in a resized image back to the original image.
+    """
+    return _trim_css_to_bounds(tuple(int(round(v / scale)) for v in css), image_shape)
+
+
+def detect_and_encode(img, detect_max_width=640, encode_on="original", number_of_times_to_upsample=1, model="hog",
+                      num_jitters=1, landmarks_model="small", regions=None, encode=True):
+    """
+    Find every face in an image and return its encoding, detecting faces on a scaled down copy of the image.
+
+    Face detection gets much slower as images get bigger, but the encodings of small faces get less accurate if
+    they are computed on a scaled down image. This detects on a copy that is at most detect_max_width pixels wide,
+    scales the face locations back up and (by default) computes the landmarks and encodings on the original image.
+
+    :param img: An image (as a numpy array)
+    :param detect_max_width: The maximum width of the image used for face detection. None to detect on the original image.
+    :param encode_on: "original" (default) to compute encodings on the full resolution image or "detection" to compute
+                      them on the scaled down image used for detection, which is faster but less accurate.
+    :param number_of_times_to_upsample: How many times to upsample the detection image looking for faces. Higher numbers find smaller faces.
+    :param model: Which face detection model to use. "hog" (default) or "cnn".
+    :param num_jitters: How many times to re-sample the face when calculating encoding. Higher is more accurate, but slower.
+    :param landmarks_model: Which landmarks model to use for the encodings. "large" or "small" (default).
+    :param regions: Optional - only look for faces inside these (top, right, bottom, left) areas of the original image,
+                    i.e. the regions returned by MotionGate.update(). An empty list skips detection entirely.
+    :param encode: False to only detect the faces and return None as the encodings, i.e. to let a FaceTracker decide
+                   which faces need to be encoded.
+    :return: A tuple of (face_locations, face_encodings, timings). face_locations are in css (top, right, bottom, left)
+             order in the coordinates of the original image. timings is a dict with the seconds spent in the
+             "resize", "detect" and "encode" stages.
+    """
+    if encode_on not in ("original", "detection"):
+        raise ValueError("Invalid encode_on value. Supported values are ['original', 'detection'].")
+
+    start = time.perf_counter()
+    detection_img, scale = _resize_to_max_width(img, detect_max_width)
+    resized = time.perf_counter()
+
+    if regions is not None:
+        regions = [tuple(int(value * scale) for value in region) for region in regions]
+    detection_locations = face_locations(detection_img, number_of_times_to_upsample, model, regions=regions)
+    locations = [_scale_css(location, scale, img.shape) for location in detection_locations]
+    detected = time.perf_counter()
+
+    if not encode:
+        encodings = None
+    elif encode_on == "original":
+        encodings = face_encodings(img, locations, num_jitters, landmarks_model)
+    else:
+        encodings = face_encodings(detection_img, detection_locations, num_jitters, landmarks_model)
+    encoded = time.perf_counter()
+
+    timings = {
+        "resize": resized - start,
+        "detect": detected - resized,
+        "encode": encoded - detected,
+    }
+    return locations, encodings, timings
 
 
 def compare_faces(known_face_encodings, face_encoding_to_check, tolerance=0.6):
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def image_digest(img):
+    """
+    Returns a hash of the contents of an image that is already loaded into a numpy array
+
+    :param img: An image (as a numpy array)
+    :return: a hex digest string
+    """
+    img = np.ascontiguousarray(img)
+    digest = hashlib.sha1("{}:{}:".format(img.shape, img.dtype.str).encode("utf-8"))
+    digest.update(img.data)
+    return digest.hexdigest()
+
+
+def file_digest(file):
+    """
+    Returns a hash of the contents of an image file. This is cheaper than image_digest() because the image doesn't need
+    to be decoded first.
+
+    :param file: image file name
+    :return: a hex digest string
+    """
+    digest = hashlib.sha1()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EncodingCache(object):
+    """
+    An on-disk cache of face locations and face encodings, keyed by the content of the image and every setting that
+    changes the result (detection model, upsampling, jitters, landmark model, ...).
+
+    Each entry is stored as a small .npz file holding the face locations as int32 and the encodings as float32. When the
+    total size of the cache grows above max_bytes, the least recently used entries are removed. The cache directory can
+    be shared by several processes.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        """
+        :param directory: directory to keep the cache files in. It is created if it doesn't exist.
+        :param max_bytes: the maximum total size of the cache files before old entries are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = None
+        self._total_bytes = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __getstate__(self):
+        # Only the settings are sent to other processes, each process builds its own view of the cache directory
+        return {"directory": self.directory, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"], state["max_bytes"])
+
+    @staticmethod
+    def key(content_digest, kind, **settings):
+        """
+        Builds a cache key from the digest of an image and the settings used to process it.
+
+        :param content_digest: the result of image_digest() or file_digest()
+        :param kind: what is being cached, i.e. "locations" or "encodings"
+        :param settings: every setting that changes the result, i.e. model="hog", number_of_times_to_upsample=1, ...
+        :return: a key string
+        """
+        description = "{}:{}:{}".format(content_digest, kind, sorted(settings.items()))
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def _load_entries(self):
+        # Build the LRU index from the files on disk the first time it is needed
+        if self._entries is None:
+            self._entries = {}
+            self._total_bytes = 0
+            for filename in os.listdir(self.directory):
+                if filename.endswith(".npz"):
+                    stat = os.stat(os.path.join(self.directory, filename))
+                    self._entries[filename[:-4]] = (stat.st_size, stat.st_mtime)
+                    self._total_bytes += stat.st_size
+
+    def get(self, key):
+        """
+        Looks up a cache entry
+
+        :param key: a key built with EncodingCache.key()
+        :return: a tuple of (face locations, face encodings) or None if the key isn't cached. face locations are a list of
+                 tuples in css (top, right, bottom, left) order and face encodings a float32 numpy array of shape (N, 128).
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                locations = [tuple(int(v) for v in location) for location in data["locations"]]
+                encodings = data["encodings"]
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        # Mark the entry as recently used, both on disk (for other processes) and in the index
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            if self._entries is not None and key in self._entries:
+                self._entries[key] = (self._entries[key][0], now)
+
+        return locations, encodings
+
+    def put(self, key, locations, encodings):
+        """
+        Stores a cache entry, evicting the least recently used entries if the cache is over its size limit.
+
+        :param key: a key built with EncodingCache.key()
+        :param locations: a list of face locations in css (top, right, bottom, left) order
+        :param encodings: a list of 128-dimensional face encodings. Can be empty to only cache locations.
+        """
+        locations = np.asarray(locations, dtype=np.int32).reshape(-1, 4)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+
+        # Write to a temporary file first so readers never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, locations=locations, encodings=encodings)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        size = os.path.getsize(self._path(key))
+        with self._lock:
+            self._load_entries()
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][0]
+            self._entries[key] = (size, time.time())
+            self._total_bytes += size
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached entry for key, calling compute() and caching its result if there isn't one.
+
+        :param key: a key built with EncodingCache.key()
+        :param compute: a function returning a tuple of (face locations, face encodings)
+        :return: a tuple of (face locations, face encodings) as returned by get()
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        locations, encodings = compute()
+        self.put(key, locations, encodings)
+        return list(locations), np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+
+    def get_or_compute_file(self, file, kind, compute, **settings):
+        """
+        Like get_or_compute(), but keyed by the contents of an image file so a cache hit doesn't even need to decode it.
+
+        :param file: image file name
+        :param kind: what is being cached, i.e. "locations" or "encodings"
+        :param compute: a function returning a tuple of (face locations, face encodings) for the file
+        :param settings: every setting that changes the result, i.e. model="hog", number_of_times_to_upsample=1, ...
+        :return: a tuple of (face locations, face encodings) as returned by get()
+        """
+        return self.get_or_compute(self.key(file_digest(file), kind, **settings), compute)
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        for key, (size, _) in sorted(self._entries.items(), key=lambda entry: entry[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._entries[key]
+            self._total_bytes -= size
+
+    def clear(self):
+        """
+        Removes every entry from the cache
+        """
+        with self._lock:
+            self._load_entries()
+            for key in list(self._entries):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._entries = {}
+            self._total_bytes = 0
+
+    def __len__(self):
+        with self._lock:
+            self._load_entries()
+            return len(self._entries)
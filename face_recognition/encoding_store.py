@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .api import face_distance_matrix, _top_k
+
+
+def _write_atomically(path, write):
+    # Write to a temporary file first so readers never see a partially written file
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_json(path, data):
+    _write_atomically(path, lambda f: f.write(json.dumps(data).encode("utf-8")))
+
+
+class EncodingStore(object):
+    """
+    An on-disk gallery of known face encodings that several processes can share.
+
+    The encodings are kept in float32 (or float64) .npy shards which are opened with np.memmap, so every process
+    reading the store shares the same copy in the page cache and opening a store costs the same no matter how many
+    encodings it holds. The names (and optional metadata) of the encodings are kept in a small .json file next to each
+    shard and are only read when they are needed. A manifest.json file lists the shards.
+
+    Writes are append-only: every call to append() adds a new shard. Use compact() to merge the shards back into one.
+    Only one process should write to a store at a time, but any number of processes can read it while it is written.
+    The shards replaced by a compaction are only deleted by the next one, so readers that opened the store before it
+    was compacted can keep reading them in the meantime.
+
+    An EncodingStore pickles to just its directory, so it can be handed to worker processes cheaply. A process opens
+    each store only once, however many times it is unpickled, and just refreshes it after that.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory, dimensions=128, dtype=np.float32):
+        """
+        Opens the store in directory, creating an empty one if it doesn't exist yet.
+
+        :param directory: directory holding the store
+        :param dimensions: the number of dimensions of each face encoding, when creating a new store
+        :param dtype: the type the encodings are stored as, when creating a new store. float32 (the default) halves the
+                      size of the store, float64 keeps the encodings exactly as face_encodings() returns them.
+        """
+        self.directory = directory
+
+        if not os.path.isfile(os.path.join(directory, self.MANIFEST)):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            _write_json(os.path.join(directory, self.MANIFEST), {"dimensions": dimensions, "dtype": np.dtype(dtype).name,
+                                                                 "next_shard": 0, "shards": []})
+
+        self._manifest_version = None
+        self.refresh()
+
+    def __reduce__(self):
+        return _unpickle_store, (self.directory,)
+
+    def refresh(self):
+        """
+        Picks up shards appended (or compacted) by another process since the store was opened.
+        """
+        path = os.path.join(self.directory, self.MANIFEST)
+        stat = os.stat(path)
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version == self._manifest_version:
+            return
+
+        with open(path, "rb") as f:
+            manifest = json.loads(f.read().decode("utf-8"))
+
+        self._manifest_version = version
+        self.dimensions = manifest["dimensions"]
+        self.dtype = np.dtype(manifest.get("dtype", "float32"))
+        self._next_shard = manifest["next_shard"]
+        self._shards = manifest["shards"]
+        self._retired = manifest.get("retired", [])
+        self._offsets = np.concatenate(([0], np.cumsum([shard["count"] for shard in self._shards], dtype=np.int64)))
+        self._arrays = [None] * len(self._shards)
+        self._names = [None] * len(self._shards)
+        self._metadata = [None] * len(self._shards)
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def _shard_path(self, shard, extension):
+        return os.path.join(self.directory, shard["file"] + extension)
+
+    def shard_encodings(self):
+        """
+        Returns the encodings of every shard, as read-only memory mapped numpy arrays of shape (N, dimensions).
+        These can be passed to any of the matching functions in face_recognition.api without copying them.
+        """
+        try:
+            self._map_shards()
+        except FileNotFoundError:
+            # The store was compacted twice since it was last refreshed, so its shards are gone
+            self.refresh()
+            self._map_shards()
+        return list(self._arrays)
+
+    def _map_shards(self):
+        for number, shard in enumerate(self._shards):
+            if self._arrays[number] is None:
+                self._arrays[number] = np.load(self._shard_path(shard, ".npy"), mmap_mode="r")
+
+    @property
+    def encodings(self):
+        """
+        Every encoding in the store as one (N, dimensions) array. This is the memory mapped shard itself when
+        the store has a single shard (see compact()), and a copy otherwise.
+        """
+        arrays = self.shard_encodings()
+        if len(arrays) == 1:
+            return arrays[0]
+        elif not arrays:
+            return np.empty((0, self.dimensions), dtype=self.dtype)
+        return np.concatenate(arrays)
+
+    def _load_sidecar(self, number):
+        if self._names[number] is None:
+            with open(self._shard_path(self._shards[number], ".json"), "rb") as f:
+                sidecar = json.loads(f.read().decode("utf-8"))
+            self._names[number] = sidecar["names"]
+            self._metadata[number] = sidecar["metadata"]
+
+    @property
+    def names(self):
+        """
+        The name of every encoding in the store, in row order.
+        """
+        for number in range(len(self._shards)):
+            self._load_sidecar(number)
+        return [name for names in self._names for name in names]
+
+    @property
+    def metadata(self):
+        """
+        The metadata dict of every encoding in the store, in row order.
+        """
+        for number in range(len(self._shards)):
+            self._load_sidecar(number)
+        return [item for metadata in self._metadata for item in metadata]
+
+    def names_of(self, rows):
+        """
+        Returns the name each of the given rows belongs to.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        shard_numbers = np.searchsorted(self._offsets, rows, side="right") - 1
+
+        names = []
+        for row, number in zip(rows.tolist(), shard_numbers.tolist()):
+            self._load_sidecar(number)
+            names.append(self._names[number][row - self._offsets[number]])
+        return names
+
+    def append(self, names, encodings, metadata=None):
+        """
+        Adds encodings to the store as a new shard.
+
+        :param names: the name of the person each encoding belongs to
+        :param encodings: a list or numpy array of face encodings
+        :param metadata: Optional - a json serializable dict for each encoding, i.e. the file it was found in
+        :return: the number of encodings added
+        """
+        encodings = np.asarray(encodings, dtype=self.dtype).reshape(-1, self.dimensions)
+        names = list(names)
+        metadata = list(metadata) if metadata is not None else [{} for _ in names]
+        if not len(names) == len(metadata) == len(encodings):
+            raise ValueError("Got {} names and {} metadata items for {} encodings.".format(len(names), len(metadata), len(encodings)))
+
+        if len(encodings) == 0:
+            return 0
+
+        self.refresh()
+        self._write_shard(names, encodings, metadata, self._shards, self._retired)
+        return len(encodings)
+
+    def _write_shard(self, names, encodings, metadata, keep_shards, retired):
+        shard = {"file": "shard-{:06d}".format(self._next_shard), "count": len(encodings)}
+
+        # The shard files are written first and the manifest last, so readers only ever see complete shards
+        _write_atomically(self._shard_path(shard, ".npy"), lambda f: np.save(f, encodings))
+        _write_json(self._shard_path(shard, ".json"), {"names": names, "metadata": metadata})
+        _write_json(os.path.join(self.directory, self.MANIFEST), {
+            "dimensions": self.dimensions,
+            "dtype": self.dtype.name,
+            "next_shard": self._next_shard + 1,
+            "shards": keep_shards + [shard],
+            "retired": retired,
+        })
+        self.refresh()
+
+    def compact(self, drop_names=None):
+        """
+        Merges every shard into a single one, so the store can be read as one memory mapped array.
+
+        :param drop_names: Optional - names of people whose encodings should be left out of the compacted store
+        :return: the number of encodings in the compacted store
+        """
+        self.refresh()
+        old_shards = list(self._shards)
+        if len(old_shards) <= 1 and not drop_names:
+            return len(self)
+
+        drop_names = set(drop_names or ())
+        keep = np.array([name not in drop_names for name in self.names], dtype=bool)
+        names = [name for name, kept in zip(self.names, keep) if kept]
+        metadata = [item for item, kept in zip(self.metadata, keep) if kept]
+        previously_retired = list(self._retired)
+        self._write_shard(names, np.ascontiguousarray(self.encodings[keep]), metadata, [], old_shards)
+
+        # The shards replaced by this compaction stay on disk for readers that haven't refreshed yet, the ones
+        # replaced by the previous compaction are deleted. Processes that still have those mapped keep working, the
+        # files only go away once they are closed.
+        for shard in previously_retired:
+            for extension in (".npy", ".json"):
+                try:
+                    os.remove(self._shard_path(shard, extension))
+                except OSError:
+                    pass
+
+        return len(self)
+
+    def distances(self, face_encodings_to_check):
+        """
+        Returns the distance between each face encoding and every encoding in the store.
+
+        :param face_encodings_to_check: List of N face encodings
+        :return: A float32 numpy ndarray of shape (N, len(store))
+        """
+        arrays = self.shard_encodings()
+        if not arrays:
+            return np.empty((len(face_encodings_to_check), 0), dtype=np.float32)
+        return np.concatenate([face_distance_matrix(face_encodings_to_check, array) for array in arrays], axis=1)
+
+    def search(self, face_encodings_to_check, k=1):
+        """
+        Finds the k closest encodings in the store to each of a list of face encodings.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param k: how many of the closest encodings to return for each face, closest first
+        :return: A tuple of (rows, distances), each a numpy ndarray of shape (N, min(k, len(store))). Use names_of() to
+                 get the names the rows belong to.
+        """
+        return _top_k(self.distances(face_encodings_to_check), k)
+
+    def best_matches(self, face_encodings_to_check, tolerance=0.6):
+        """
+        Finds the name of the closest encoding in the store for each of a list of face encodings.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param tolerance: How much distance between faces to consider it a match. Lower is more strict. 0.6 is typical best performance.
+        :return: A list of N (name, distance) tuples. name is None if no encoding in the store is within tolerance,
+                 distance is None if the store is empty.
+        """
+        if len(self) == 0:
+            return [(None, None) for _ in face_encodings_to_check]
+
+        rows, distances = self.search(face_encodings_to_check, k=1)
+        names = self.names_of(rows[:, 0])
+        return [(name if distance <= tolerance else None, float(distance)) for name, distance in zip(names, distances[:, 0])]
+
+
+# The stores unpickled in this process by directory, so a worker process that is sent the same store with every task
+# doesn't open it again every time
+_unpickled_stores = {}
+
+
+def _unpickle_store(directory):
+    # Forget stores whose directory was removed, i.e. temporary ones, so their shards aren't kept mapped
+    for gone in [d for d in _unpickled_stores if not os.path.isdir(d)]:
+        del _unpickled_stores[gone]
+
+    store = _unpickled_stores.get(directory)
+    if store is None:
+        store = _unpickled_stores[directory] = EncodingStore(directory)
+    else:
+        store.refresh()
+    return store
@@ -4,48 +4,172 @@ import click
 import os
 import re
 import face_recognition.api as face_recognition
-import multiprocessing
-import sys
+from face_recognition.encoding_cache import EncodingCache, file_digest
+from face_recognition.parallel import imap_in_process_pool
+from face_recognition.video import is_video_source, iter_video_frames
+from concurrent.futures import ThreadPoolExecutor
+import collections
 import itertools
+import sys
 
 
-def print_result(filename, location):
+def format_result(filename, location):
     top, right, bottom, left = location
-    print("{},{},{},{},{}".format(filename, top, right, bottom, left))
+    return "{},{},{},{},{}".format(filename, top, right, bottom, left)
+
+
+def print_result(filename, location):
+    print(format_result(filename, location))
+
+
+def image_results(image_to_check, model, upsample, cache=None):
+    def compute():
+        unknown_image = face_recognition.load_image_file(image_to_check)
+        return face_recognition.face_locations(unknown_image, number_of_times_to_upsample=upsample, model=model), []
+
+    if cache is None:
+        face_locations, _ = compute()
+    else:
+        face_locations, _ = cache.get_or_compute_file(image_to_check, "locations", compute, model=model, number_of_times_to_upsample=upsample)
+
+    return [format_result(image_to_check, face_location) for face_location in face_locations]
+
 
+def _image_results_star(args):
+    return image_results(*args)
 
-def test_image(image_to_check, model, upsample):
-    unknown_image = face_recognition.load_image_file(image_to_check)
-    face_locations = face_recognition.face_locations(unknown_image, number_of_times_to_upsample=upsample, model=model)
 
-    for face_location in face_locations:
-        print_result(image_to_check, face_location)
+def frame_results(frame_label, frame, model, upsample):
+    face_locations = face_recognition.face_locations(frame, number_of_times_to_upsample=upsample, model=model)
+    return [format_result(frame_label, face_location) for face_location in face_locations]
+
+
+def _frame_results_star(args):
+    return frame_results(*args)
+
+
+def test_image(image_to_check, model, upsample, cache=None):
+    for line in image_results(image_to_check, model, upsample, cache):
+        print(line)
+
+
+def iter_image_files_in_folder(folder):
+    # scandir doesn't build the whole listing up front, which matters for folders with millions of files
+    for entry in os.scandir(folder):
+        if re.match(r'.*\.(jpg|jpeg|png)', entry.name, flags=re.I):
+            yield os.path.join(folder, entry.name)
 
 
 def image_files_in_folder(folder):
-    return [os.path.join(folder, f) for f in os.listdir(folder) if re.match(r'.*\.(jpg|jpeg|png)', f, flags=re.I)]
+    return list(iter_image_files_in_folder(folder))
 
 
-def process_images_in_process_pool(images_to_check, number_of_cpus, model, upsample):
-    if number_of_cpus == -1:
-        processes = None
-    else:
-        processes = number_of_cpus
+def process_images_in_process_pool(images_to_check, number_of_cpus, model, upsample, cache=None, ordered=True):
+    # The workers only compute the results, the output is written here so lines of different images never mix
+    function_parameters = ((image_to_check, model, upsample, cache) for image_to_check in images_to_check)
+    for lines in imap_in_process_pool(_image_results_star, function_parameters, number_of_cpus, ordered):
+        for line in lines:
+            print(line)
+
+
+def process_video(video_to_check, number_of_cpus, model, upsample, every_nth_frame=1, fps=None, ordered=True, batch_size=0):
+    # Each sampled frame is reported as "filename,frame_index,timestamp" in place of the image file name
+    frames = (("{},{},{:.3f}".format(video_to_check, frame_index, timestamp), frame)
+              for frame_index, timestamp, frame in iter_video_frames(video_to_check, every_nth_frame, fps))
 
-    # macOS will crash due to a bug in libdispatch if you don't use 'forkserver'
-    context = multiprocessing
-    if "forkserver" in multiprocessing.get_all_start_methods():
-        context = multiprocessing.get_context("forkserver")
+    if batch_size:
+        # Every frame of a video has the same size, so they batch perfectly for the cnn model
+        frame_labels = collections.deque()
 
-    pool = context.Pool(processes=processes)
+        def frames_only():
+            for frame_label, frame in frames:
+                frame_labels.append(frame_label)
+                yield frame
 
-    function_parameters = zip(
-        images_to_check,
-        itertools.repeat(model),
-        itertools.repeat(upsample),
-    )
+        def batched_results():
+            for face_locations in face_recognition.iter_batch_face_locations(frames_only(), upsample, batch_size):
+                frame_label = frame_labels.popleft()
+                yield [format_result(frame_label, face_location) for face_location in face_locations]
 
-    pool.starmap(test_image, function_parameters)
+        results = batched_results()
+    elif number_of_cpus == 1:
+        results = (frame_results(frame_label, frame, model, upsample) for frame_label, frame in frames)
+    else:
+        # The video is decoded here and the sampled frames are sent to the workers one at a time
+        function_parameters = ((frame_label, frame, model, upsample) for frame_label, frame in frames)
+        results = imap_in_process_pool(_frame_results_star, function_parameters, number_of_cpus, ordered, chunksize=1)
+
+    for lines in results:
+        for line in lines:
+            print(line)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def _prepare_batch(files, upsample, cache=None):
+    """
+    Looks the files up in the cache and decodes the ones that aren't cached.
+
+    :return: a list of (file, cache key, cached face locations, image) tuples. Either the cached face locations or the
+             image is None.
+    """
+    prepared = []
+    for file in files:
+        key = cached = None
+        if cache is not None:
+            key = cache.key(file_digest(file), "locations", model="cnn", number_of_times_to_upsample=upsample)
+            entry = cache.get(key)
+            if entry is not None:
+                cached = entry[0]
+
+        image = face_recognition.load_image_file(file) if cached is None else None
+        prepared.append((file, key, cached, image))
+    return prepared
+
+
+def _detect_batch(prepared, upsample, batch_size, cache=None):
+    images = [image for _, _, cached, image in prepared if cached is None]
+    detected = iter(face_recognition.batch_face_locations(images, upsample, batch_size))
+
+    results = []
+    for file, key, cached, _ in prepared:
+        if cached is None:
+            cached = next(detected)
+            if cache is not None:
+                cache.put(key, cached, [])
+        results.extend(format_result(file, face_location) for face_location in cached)
+    return results
+
+
+def process_images_in_batches(images_to_check, batch_size, upsample, cache=None):
+    """
+    Finds faces with the cnn model, batch_size images at a time. The next batch of images is decoded on a background
+    thread while the current one is being detected. Images of different sizes are padded to a common size.
+    """
+    with ThreadPoolExecutor(max_workers=1) as decoder:
+        pending = None
+        for files in _chunks(images_to_check, batch_size):
+            next_batch = decoder.submit(_prepare_batch, files, upsample, cache)
+            if pending is not None:
+                for line in _detect_batch(pending.result(), upsample, batch_size, cache):
+                    print(line)
+            pending = next_batch
+
+        if pending is not None:
+            for line in _detect_batch(pending.result(), upsample, batch_size, cache):
+                print(line)
+
+
+def _check_fps(ctx, param, value):
+    if value is not None and value <= 0:
+        raise click.BadParameter("must be greater than 0")
+    return value
 
 
 @click.command()
@@ -53,19 +177,38 @@ def process_images_in_process_pool(images_to_check, number_of_cpus, model, upsam
 @click.option('--cpus', default=1, help='number of CPU cores to use in parallel. -1 means "use all in system"')
 @click.option('--model', default="hog", help='Which face detection model to use. Options are "hog" or "cnn".')
 @click.option('--upsample', default=0, help='How many times to upsample the image looking for faces. Higher numbers find smaller faces.')
-def main(image_to_check, cpus, model, upsample):
+@click.option('--cache-dir', default=None, help='Directory to cache face locations in so unchanged images are not processed again on the next run.')
+@click.option('--unordered', is_flag=True, help='With --cpus, print results as soon as they are ready instead of in input order.')
+@click.option('--batch-size', default=0, help='With --model cnn, detect faces in batches of this many images (much faster on a GPU). 0 disables batching.')
+@click.option('--every-nth-frame', default=1, type=click.IntRange(min=1), help='For videos, only look at one out of every this many frames.')
+@click.option('--fps', default=None, type=float, callback=_check_fps,
+              help='For videos, look at this many frames per second of video (instead of --every-nth-frame).')
+def main(image_to_check, cpus, model, upsample, cache_dir, unordered, batch_size, every_nth_frame, fps):
+    cache = EncodingCache(cache_dir) if cache_dir else None
+
+    if batch_size and model != "cnn":
+        click.echo("WARNING: --batch-size only works with --model cnn. Processing images one at a time.")
+        batch_size = 0
+    elif batch_size and cpus != 1:
+        click.echo("WARNING: --batch-size runs in a single process. Ignoring --cpus.")
+        cpus = 1
+
     # Multi-core processing only supported on Python 3.4 or greater
     if (sys.version_info < (3, 4)) and cpus != 1:
         click.echo("WARNING: Multi-processing support requires Python 3.4 or greater. Falling back to single-threaded processing!")
         cpus = 1
 
-    if os.path.isdir(image_to_check):
-        if cpus == 1:
-            [test_image(image_file, model, upsample) for image_file in image_files_in_folder(image_to_check)]
+    if is_video_source(image_to_check):
+        process_video(image_to_check, cpus, model, upsample, every_nth_frame, fps, not unordered, batch_size)
+    elif os.path.isdir(image_to_check):
+        if batch_size:
+            process_images_in_batches(iter_image_files_in_folder(image_to_check), batch_size, upsample, cache)
+        elif cpus == 1:
+            [test_image(image_file, model, upsample, cache) for image_file in iter_image_files_in_folder(image_to_check)]
         else:
-            process_images_in_process_pool(image_files_in_folder(image_to_check), cpus, model, upsample)
+            process_images_in_process_pool(iter_image_files_in_folder(image_to_check), cpus, model, upsample, cache, not unordered)
     else:
-        test_image(image_to_check, model, upsample)
+        test_image(image_to_check, model, upsample, cache)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from .api import face_distance_matrix, _top_k
+
+
+class FaceIndex(object):
+    """
+    An in-memory gallery of known face encodings, grouped by the name of the person they belong to.
+
+    Encodings are kept in one contiguous float32 (or float64) matrix next to an int array of labels (one label per
+    person), so a whole frame of faces can be compared against the gallery in a single matrix product. Adding encodings
+    is amortized O(1) and removing a person only moves as many rows as that person has encodings.
+    """
+
+    def __init__(self, dimensions=128, capacity=64, dtype=np.float32):
+        """
+        :param dimensions: the number of dimensions of each face encoding
+        :param capacity: how many encodings to allocate room for up front. The index grows as needed.
+        :param dtype: the type the encodings are kept as. float32 (the default) halves the memory and speeds up
+                      matching, float64 keeps the encodings exactly as face_encodings() returns them.
+        """
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype)
+        self._encodings = np.empty((max(capacity, 1), dimensions), dtype=self.dtype)
+        self._labels = np.empty(max(capacity, 1), dtype=np.int32)
+        self._size = 0
+        self._names = []
+        self._labels_by_name = {}
+        self._rows_by_label = {}
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, name):
+        return name in self._labels_by_name
+
+    @property
+    def encodings(self):
+        """
+        A read-only (N, dimensions) view of every encoding in the index, in row order.
+        """
+        view = self._encodings[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def labels(self):
+        """
+        A read-only int32 view of the label of every encoding in the index, in row order.
+        """
+        view = self._labels[:self._size]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def names(self):
+        """
+        The names of every person that has at least one encoding in the index.
+        """
+        return list(self._labels_by_name)
+
+    def name_of(self, label):
+        """
+        Returns the name of the person with the given label.
+        """
+        return self._names[label]
+
+    def names_of(self, rows):
+        """
+        Returns the name of the person each of the given rows belongs to.
+        """
+        return [self._names[label] for label in self._labels[np.asarray(rows, dtype=np.intp)]]
+
+    def count(self, name):
+        """
+        Returns how many encodings the index holds for a person.
+        """
+        label = self._labels_by_name.get(name)
+        return 0 if label is None else len(self._rows_by_label[label])
+
+    def _grow(self, needed):
+        capacity = len(self._labels)
+        if needed <= capacity:
+            return
+
+        while capacity < needed:
+            capacity *= 2
+
+        encodings = np.empty((capacity, self.dimensions), dtype=self.dtype)
+        encodings[:self._size] = self._encodings[:self._size]
+        labels = np.empty(capacity, dtype=np.int32)
+        labels[:self._size] = self._labels[:self._size]
+        self._encodings = encodings
+        self._labels = labels
+
+    def add(self, name, encodings):
+        """
+        Adds one or more face encodings of a person to the index.
+
+        :param name: the name of the person
+        :param encodings: a single face encoding or a list of face encodings
+        :return: a numpy array with the rows the encodings were stored in
+        """
+        encodings = np.asarray(encodings, dtype=self.dtype).reshape(-1, self.dimensions)
+
+        label = self._labels_by_name.get(name)
+        if label is None:
+            label = len(self._names)
+            self._names.append(name)
+            self._labels_by_name[name] = label
+            self._rows_by_label[label] = set()
+
+        start = self._size
+        self._grow(start + len(encodings))
+        self._encodings[start:start + len(encodings)] = encodings
+        self._labels[start:start + len(encodings)] = label
+        self._size += len(encodings)
+
+        rows = np.arange(start, self._size)
+        self._rows_by_label[label].update(rows.tolist())
+        return rows
+
+    def remove(self, name):
+        """
+        Removes every encoding of a person from the index. The last rows of the index are moved into the freed rows,
+        so row numbers returned earlier by add() or search() may change.
+
+        :param name: the name of the person
+        :return: the number of encodings that were removed
+        """
+        label = self._labels_by_name.pop(name, None)
+        if label is None:
+            return 0
+
+        # Fill the freed rows from the end, highest row first, so a row that is about to be freed is never moved
+        rows = sorted(self._rows_by_label.pop(label), reverse=True)
+        for row in rows:
+            last = self._size - 1
+            if row != last:
+                moved_label = self._labels[last]
+                self._encodings[row] = self._encodings[last]
+                self._labels[row] = moved_label
+                moved_rows = self._rows_by_label[moved_label]
+                moved_rows.remove(last)
+                moved_rows.add(row)
+            self._size -= 1
+
+        return len(rows)
+
+    def distances(self, face_encodings_to_check):
+        """
+        Returns the distance between each face encoding and every encoding in the index.
+
+        :param face_encodings_to_check: List of N face encodings
+        :return: A float32 numpy ndarray of shape (N, len(index))
+        """
+        return face_distance_matrix(face_encodings_to_check, self.encodings)
+
+    def search(self, face_encodings_to_check, k=1):
+        """
+        Finds the k closest encodings in the index to each of a list of face encodings.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param k: how many of the closest encodings to return for each face, closest first
+        :return: A tuple of (rows, distances), each a numpy ndarray of shape (N, min(k, len(index))). Use names_of() to
+                 get the names of the people the rows belong to.
+        """
+        return _top_k(self.distances(face_encodings_to_check), k)
+
+    def identity_distances(self, face_encodings_to_check):
+        """
+        Returns the distance between each face encoding and the closest encoding of every person in the index.
+
+        :param face_encodings_to_check: List of N face encodings
+        :return: A tuple of (labels, distances). labels is an int numpy array with the label of each of the P people in
+                 the index and distances a float32 numpy ndarray of shape (N, P).
+        """
+        distances = self.distances(face_encodings_to_check)
+        if self._size == 0:
+            return np.empty(0, dtype=np.int32), distances
+
+        # Sort the columns by label so the minimum of every person's columns can be taken in one reduceat call
+        order = np.argsort(self._labels[:self._size], kind="stable")
+        sorted_labels = self._labels[:self._size][order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_labels[1:] != sorted_labels[:-1])))
+
+        return sorted_labels[starts], np.minimum.reduceat(distances[:, order], starts, axis=1)
+
+    def search_identities(self, face_encodings_to_check, k=1):
+        """
+        Finds the k closest people in the index to each of a list of face encodings, using the distance to the
+        closest encoding of each person.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param k: how many of the closest people to return for each face, closest first
+        :return: A tuple of (labels, distances), each a numpy ndarray of shape (N, min(k, number of people)). Use
+                 name_of() to get the name for a label.
+        """
+        identity_labels, distances = self.identity_distances(face_encodings_to_check)
+        columns, best_distances = _top_k(distances, k)
+        return identity_labels[columns], best_distances
+
+    def best_matches(self, face_encodings_to_check, tolerance=0.6):
+        """
+        Finds the name of the closest person in the index for each of a list of face encodings.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param tolerance: How much distance between faces to consider it a match. Lower is more strict. 0.6 is typical best performance.
+        :return: A list of N (name, distance) tuples. name is None if no one in the index is within tolerance, distance
+                 is None if the index is empty.
+        """
+        if self._size == 0:
+            return [(None, None) for _ in face_encodings_to_check]
+
+        labels, distances = self.search_identities(face_encodings_to_check, k=1)
+        return [(self._names[label] if distance <= tolerance else None, float(distance))
+                for label, distance in zip(labels[:, 0], distances[:, 0])]
+
+    def save(self, file):
+        """
+        Saves the index to a .npz file.
+
+        :param file: file name or file object to save to
+        """
+        # Renumber the labels so people that were removed don't take up room in the saved name table
+        used_labels, labels = np.unique(self._labels[:self._size], return_inverse=True)
+        names = np.array([self._names[label] for label in used_labels], dtype=np.str_)
+        np.savez(file, encodings=self._encodings[:self._size], labels=labels.astype(np.int32), names=names)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Loads an index saved with save().
+
+        :param file: file name or file object to load from
+        :return: a FaceIndex
+        """
+        with np.load(file) as data:
+            encodings = data["encodings"]
+            labels = data["labels"]
+            names = [str(name) for name in data["names"]]
+
+        index = cls(dimensions=encodings.shape[1], capacity=len(encodings))
+        index._encodings[:len(encodings)] = encodings
+        index._labels[:len(labels)] = labels
+        index._size = len(encodings)
+        index._names = names
+        index._labels_by_name = {name: label for label, name in enumerate(names)}
+        index._rows_by_label = {label: set(np.flatnonzero(labels == label).tolist()) for label in range(len(names))}
+        return index
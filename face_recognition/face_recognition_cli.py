@@ -4,92 +4,257 @@ import click
 import os
 import re
 import face_recognition.api as face_recognition
-import multiprocessing
-import itertools
-import sys
-import PIL.Image
+from face_recognition.encoding_cache import EncodingCache
+from face_recognition.encoding_store import EncodingStore
+from face_recognition.face_index import FaceIndex
+from face_recognition.parallel import imap_in_process_pool, process_pool
+from face_recognition.video import is_video_source, iter_video_frames
+import contextlib
 import numpy as np
+import shutil
+import sys
+import tempfile
+
+
+def encode_image_file(file, cache=None, max_dimension=None):
+    if cache is None:
+        img = face_recognition.load_image_file(file, max_dimension=max_dimension)
+        return face_recognition.face_encodings(img)
+
+    def compute():
+        img = face_recognition.load_image_file(file, max_dimension=max_dimension)
+        return face_recognition._locate_and_encode(img)
+
+    _, encodings = cache.get_or_compute_file(file, "encodings", compute, max_dimension=max_dimension, model="hog",
+                                             number_of_times_to_upsample=1, num_jitters=1, landmarks_model="small")
+    return list(encodings)
+
+
+def _encode_known_person(args):
+    file, cache = args
+    encodings = encode_image_file(file, cache)
+    return len(encodings), (encodings[0] if encodings else None)
+
+
+def load_known_cache(known_cache):
+    """
+    Reads a known people sidecar file written by save_known_cache().
+
+    :return: a dict of file path to a tuple of (size, mtime in ns, number of faces found, first face encoding or None)
+    """
+    if not known_cache or not os.path.isfile(known_cache):
+        return {}
+
+    try:
+        with np.load(known_cache) as data:
+            return {
+                str(path): (int(size), int(mtime), int(face_count), encoding if face_count else None)
+                for path, size, mtime, face_count, encoding in zip(data["paths"], data["sizes"], data["mtimes"], data["face_counts"], data["encodings"])
+            }
+    except (IOError, OSError, ValueError, KeyError):
+        click.echo("WARNING: Could not read {}. Encoding every known person again.".format(known_cache))
+        return {}
+
 
+def save_known_cache(known_cache, entries):
+    """
+    Writes a known people sidecar file, replacing it atomically.
 
-def scan_known_people(known_people_folder):
+    :param entries: a dict of file path to a tuple of (size, mtime in ns, number of faces found, first face encoding or None)
+    """
+    paths = sorted(entries)
+    encodings = np.zeros((len(paths), 128), dtype=np.float64)
+    for row, path in enumerate(paths):
+        if entries[path][3] is not None:
+            encodings[row] = entries[path][3]
+
+    directory = os.path.dirname(os.path.abspath(known_cache))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, paths=np.array(paths, dtype=np.str_), encodings=encodings,
+                     sizes=np.array([entries[path][0] for path in paths], dtype=np.int64),
+                     mtimes=np.array([entries[path][1] for path in paths], dtype=np.int64),
+                     face_counts=np.array([entries[path][2] for path in paths], dtype=np.int32))
+        os.replace(tmp_path, known_cache)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def scan_known_people(known_people_folder, cache=None, known_cache=None, number_of_cpus=1, pool=None):
+    """
+    Encodes the first face of every image in known_people_folder.
+
+    :param cache: Optional - an EncodingCache to look encodings up in
+    :param known_cache: Optional - path of a sidecar file remembering the encoding of each file by path, size and
+                        modification time. Only new or changed files are encoded again.
+    :param number_of_cpus: number of worker processes to encode with. -1 means "use all in system".
+    :param pool: Optional - a process pool with number_of_cpus workers to use
+    :return: a tuple of (names, encodings)
+    """
     known_names = []
     known_face_encodings = []
 
-    for file in image_files_in_folder(known_people_folder):
+    files = image_files_in_folder(known_people_folder)
+    previous_entries = load_known_cache(known_cache)
+    entries = {}
+    to_encode = []
+
+    for file in files:
+        stat = os.stat(file)
+        entry = previous_entries.get(file)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            entries[file] = entry
+        else:
+            entries[file] = (stat.st_size, stat.st_mtime_ns)
+            to_encode.append(file)
+
+    if number_of_cpus == 1:
+        results = map(_encode_known_person, ((file, cache) for file in to_encode))
+    else:
+        results = imap_in_process_pool(_encode_known_person, ((file, cache) for file in to_encode), number_of_cpus, pool=pool)
+
+    for file, (face_count, encoding) in zip(to_encode, results):
+        entries[file] = entries[file] + (face_count, encoding)
+
+    if known_cache and (to_encode or set(previous_entries) != set(entries)):
+        save_known_cache(known_cache, entries)
+
+    for file in files:
         basename = os.path.splitext(os.path.basename(file))[0]
-        img = face_recognition.load_image_file(file)
-        encodings = face_recognition.face_encodings(img)
+        face_count, encoding = entries[file][2:]
 
-        if len(encodings) > 1:
+        if face_count > 1:
             click.echo("WARNING: More than one face found in {}. Only considering the first face.".format(file))
 
-        if len(encodings) == 0:
+        if face_count == 0:
             click.echo("WARNING: No faces found in {}. Ignoring file.".format(file))
         else:
             known_names.append(basename)
-            known_face_encodings.append(encodings[0])
+            known_face_encodings.append(encoding)
 
     return known_names, known_face_encodings
 
 
-def print_result(filename, name, distance, show_distance=False):
+def format_result(filename, name, distance, show_distance=False):
     if show_distance:
-        print("{},{},{}".format(filename, name, distance))
+        return "{},{},{}".format(filename, name, distance)
     else:
-        print("{},{}".format(filename, name))
+        return "{},{}".format(filename, name)
 
 
-def test_image(image_to_check, known_names, known_face_encodings, tolerance=0.6, show_distance=False):
-    unknown_image = face_recognition.load_image_file(image_to_check)
+def print_result(filename, name, distance, show_distance=False):
+    print(format_result(filename, name, distance, show_distance))
 
-    # Scale down image if it's giant so things run a little faster
-    if max(unknown_image.shape) > 1600:
-        pil_img = PIL.Image.fromarray(unknown_image)
-        pil_img.thumbnail((1600, 1600), PIL.Image.LANCZOS)
-        unknown_image = np.array(pil_img)
 
-    unknown_encodings = face_recognition.face_encodings(unknown_image)
+def encodings_results(image_to_check, unknown_encodings, known_faces, tolerance=0.6, show_distance=False):
+    # The known encodings are kept as float64 and compared with face_distance(), so the tolerance check and the printed
+    # distances are exactly what face_distance() gives. Encoding the image costs far more than comparing it anyway.
+    known_encodings = known_faces.encodings
+    distance_matrix = np.array([face_recognition.face_distance(known_encodings, encoding) for encoding in unknown_encodings])
+    distance_matrix = distance_matrix.reshape(len(unknown_encodings), len(known_faces))
+    matches = distance_matrix <= tolerance
 
-    for unknown_encoding in unknown_encodings:
-        distances = face_recognition.face_distance(known_face_encodings, unknown_encoding)
-        result = list(distances <= tolerance)
+    # Only look up the names of the known faces that matched something
+    matched_rows = np.flatnonzero(matches.any(axis=0))
+    known_names = dict(zip(matched_rows.tolist(), known_faces.names_of(matched_rows)))
+    results = []
 
-        if True in result:
-            [print_result(image_to_check, name, distance, show_distance) for is_match, name, distance in zip(result, known_names, distances) if is_match]
+    for distances, is_match in zip(distance_matrix, matches):
+        rows = np.flatnonzero(is_match).tolist()
+
+        if rows:
+            results.extend(format_result(image_to_check, known_names[row], distances[row], show_distance) for row in rows)
         else:
-            print_result(image_to_check, "unknown_person", None, show_distance)
+            results.append(format_result(image_to_check, "unknown_person", None, show_distance))
 
     if not unknown_encodings:
         # print out fact that no faces were found in image
-        print_result(image_to_check, "no_persons_found", None, show_distance)
+        results.append(format_result(image_to_check, "no_persons_found", None, show_distance))
+
+    return results
+
+
+def image_results(image_to_check, known_faces, tolerance=0.6, show_distance=False, cache=None):
+    # Scale down image if it's giant so things run a little faster
+    unknown_encodings = encode_image_file(image_to_check, cache, max_dimension=1600)
+    return encodings_results(image_to_check, unknown_encodings, known_faces, tolerance, show_distance)
+
+
+def _image_results_star(args):
+    return image_results(*args)
+
+
+def frame_results(frame_label, frame, known_faces, tolerance=0.6, show_distance=False):
+    return encodings_results(frame_label, face_recognition.face_encodings(frame), known_faces, tolerance, show_distance)
+
+
+def _frame_results_star(args):
+    return frame_results(*args)
+
+
+def test_image(image_to_check, known_faces, tolerance=0.6, show_distance=False, cache=None):
+    for line in image_results(image_to_check, known_faces, tolerance, show_distance, cache):
+        print(line)
+
+
+def iter_image_files_in_folder(folder):
+    # scandir doesn't build the whole listing up front, which matters for folders with millions of files
+    for entry in os.scandir(folder):
+        if re.match(r'.*\.(jpg|jpeg|png)', entry.name, flags=re.I):
+            yield os.path.join(folder, entry.name)
 
 
 def image_files_in_folder(folder):
-    return [os.path.join(folder, f) for f in os.listdir(folder) if re.match(r'.*\.(jpg|jpeg|png)', f, flags=re.I)]
+    return list(iter_image_files_in_folder(folder))
 
 
-def process_images_in_process_pool(images_to_check, known_names, known_face_encodings, number_of_cpus, tolerance, show_distance):
-    if number_of_cpus == -1:
-        processes = None
-    else:
-        processes = number_of_cpus
+@contextlib.contextmanager
+def shared_known_faces(known_faces):
+    # Share the known faces through a memory mapped store instead of pickling a copy of them for every image
+    store_directory = tempfile.mkdtemp(prefix="face_recognition_known_")
+    try:
+        known_faces_store = EncodingStore(store_directory, dimensions=known_faces.dimensions, dtype=known_faces.dtype)
+        known_faces_store.append(known_faces.names_of(range(len(known_faces))), known_faces.encodings)
+        yield known_faces_store
+    finally:
+        shutil.rmtree(store_directory, ignore_errors=True)
+
 
-    # macOS will crash due to a bug in libdispatch if you don't use 'forkserver'
-    context = multiprocessing
-    if "forkserver" in multiprocessing.get_all_start_methods():
-        context = multiprocessing.get_context("forkserver")
+def process_images_in_process_pool(images_to_check, known_faces, number_of_cpus, tolerance, show_distance, cache=None, ordered=True, pool=None):
+    with shared_known_faces(known_faces) as known_faces_store:
+        # The workers only compute the results, the output is written here so lines of different images never mix
+        function_parameters = ((image_to_check, known_faces_store, tolerance, show_distance, cache) for image_to_check in images_to_check)
+        for lines in imap_in_process_pool(_image_results_star, function_parameters, number_of_cpus, ordered, pool=pool):
+            for line in lines:
+                print(line)
 
-    pool = context.Pool(processes=processes)
 
-    function_parameters = zip(
-        images_to_check,
-        itertools.repeat(known_names),
-        itertools.repeat(known_face_encodings),
-        itertools.repeat(tolerance),
-        itertools.repeat(show_distance)
-    )
+def process_video(video_to_check, known_faces, number_of_cpus, tolerance, show_distance, every_nth_frame=1, fps=None, ordered=True, pool=None):
+    # Each sampled frame is reported as "filename,frame_index,timestamp" in place of the image file name
+    frames = (("{},{},{:.3f}".format(video_to_check, frame_index, timestamp), frame)
+              for frame_index, timestamp, frame in iter_video_frames(video_to_check, every_nth_frame, fps))
 
-    pool.starmap(test_image, function_parameters)
+    if number_of_cpus == 1:
+        for frame_label, frame in frames:
+            for line in frame_results(frame_label, frame, known_faces, tolerance, show_distance):
+                print(line)
+        return
+
+    # The video is decoded here and the sampled frames are sent to the workers one at a time
+    with shared_known_faces(known_faces) as known_faces_store:
+        function_parameters = ((frame_label, frame, known_faces_store, tolerance, show_distance) for frame_label, frame in frames)
+        for lines in imap_in_process_pool(_frame_results_star, function_parameters, number_of_cpus, ordered, chunksize=1, pool=pool):
+            for line in lines:
+                print(line)
+
+
+def _check_fps(ctx, param, value):
+    if value is not None and value <= 0:
+        raise click.BadParameter("must be greater than 0")
+    return value
 
 
 @click.command()
@@ -98,21 +263,38 @@ def process_images_in_process_pool(images_to_check, known_names, known_face_enco
 @click.option('--cpus', default=1, help='number of CPU cores to use in parallel (can speed up processing lots of images). -1 means "use all in system"')
 @click.option('--tolerance', default=0.6, help='Tolerance for face comparisons. Default is 0.6. Lower this if you get multiple matches for the same person.')
 @click.option('--show-distance', default=False, type=bool, help='Output face distance. Useful for tweaking tolerance setting.')
-def main(known_people_folder, image_to_check, cpus, tolerance, show_distance):
-    known_names, known_face_encodings = scan_known_people(known_people_folder)
+@click.option('--cache-dir', default=None, help='Directory to cache face encodings in so unchanged images are not encoded again on the next run.')
+@click.option('--unordered', is_flag=True, help='With --cpus, print results as soon as they are ready instead of in input order.')
+@click.option('--known-cache', default=None, help='File to remember known people encodings in (i.e. known.npz). Only new or changed files are encoded again.')
+@click.option('--every-nth-frame', default=1, type=click.IntRange(min=1), help='For videos, only look at one out of every this many frames.')
+@click.option('--fps', default=None, type=float, callback=_check_fps,
+              help='For videos, look at this many frames per second of video (instead of --every-nth-frame).')
+def main(known_people_folder, image_to_check, cpus, tolerance, show_distance, cache_dir, unordered, known_cache, every_nth_frame, fps):
+    cache = EncodingCache(cache_dir) if cache_dir else None
 
     # Multi-core processing only supported on Python 3.4 or greater
     if (sys.version_info < (3, 4)) and cpus != 1:
         click.echo("WARNING: Multi-processing support requires Python 3.4 or greater. Falling back to single-threaded processing!")
         cpus = 1
 
-    if os.path.isdir(image_to_check):
-        if cpus == 1:
-            [test_image(image_file, known_names, known_face_encodings, tolerance, show_distance) for image_file in image_files_in_folder(image_to_check)]
+    # The same worker processes encode the known people and then check the unknown images
+    with process_pool(cpus) as pool:
+        known_names, known_face_encodings = scan_known_people(known_people_folder, cache, known_cache, cpus, pool)
+
+        known_faces = FaceIndex(capacity=len(known_face_encodings), dtype=np.float64)
+        for name, encoding in zip(known_names, known_face_encodings):
+            known_faces.add(name, encoding)
+
+        if is_video_source(image_to_check):
+            process_video(image_to_check, known_faces, cpus, tolerance, show_distance, every_nth_frame, fps, not unordered, pool)
+        elif os.path.isdir(image_to_check):
+            if cpus == 1:
+                [test_image(image_file, known_faces, tolerance, show_distance, cache) for image_file in iter_image_files_in_folder(image_to_check)]
+            else:
+                process_images_in_process_pool(iter_image_files_in_folder(image_to_check), known_faces, cpus, tolerance, show_distance, cache,
+                                               not unordered, pool)
         else:
-            process_images_in_process_pool(image_files_in_folder(image_to_check), known_names, known_face_encodings, cpus, tolerance, show_distance)
-    else:
-        test_image(image_to_check, known_names, known_face_encodings, tolerance, show_distance)
+            test_image(image_to_check, known_faces, tolerance, show_distance, cache)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import queue
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def _attach_shared_memory(name):
+    # Only the process that created the block should unlink it, so don't let this process' resource tracker own it
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class FrameRing(object):
+    """
+    A fixed number of frame sized slots in shared memory, for handing video frames between processes without copying
+    or pickling them.
+
+    A slot goes around the ring like this: a producer takes a free slot with acquire(), fills its view in place (i.e.
+    `video_capture.read(view)`) and hands it on with submit(). A consumer waits for it with receive(), uses the view in
+    place and either hands it on to the next stage with submit(slot, sequence, stage + 1) or gives it back with
+    release(). Only slot numbers and sequence numbers go through the (blocking) queues, never the frames themselves.
+
+    A FrameRing can be passed to multiprocessing.Process as an argument. Call close() in every process when done with
+    it and unlink() once in the process that created it.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, slots=8, stages=1, context=multiprocessing):
+        """
+        :param shape: the shape of every frame, i.e. (height, width, 3)
+        :param dtype: the numpy dtype of the frames
+        :param slots: how many frames can be in flight at once
+        :param stages: how many queues of submitted frames the ring has, i.e. 2 for "captured" and "processed"
+        :param context: the multiprocessing module or context to create the queues with
+        """
+        if shared_memory is None:
+            raise RuntimeError("FrameRing needs multiprocessing.shared_memory (Python 3.8 or newer).")
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self._frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._memory = shared_memory.SharedMemory(create=True, size=self._frame_bytes * slots)
+        self._owner = True
+        self._free = context.Queue()
+        self._stages = [context.Queue() for _ in range(stages)]
+
+        for slot in range(slots):
+            self._free.put(slot)
+
+        self._map_views()
+
+    def _map_views(self):
+        frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=self._memory.buf)
+        self._views = list(frames)
+
+    def __getstate__(self):
+        return {
+            "shape": self.shape, "dtype": self.dtype.str, "slots": self.slots, "name": self._memory.name,
+            "free": self._free, "stages": self._stages,
+        }
+
+    def __setstate__(self, state):
+        self.shape = state["shape"]
+        self.dtype = np.dtype(state["dtype"])
+        self.slots = state["slots"]
+        self._frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._memory = _attach_shared_memory(state["name"])
+        self._owner = False
+        self._free = state["free"]
+        self._stages = state["stages"]
+        self._map_views()
+
+    def view(self, slot):
+        """
+        Returns the numpy array of a slot. Writing to it writes to shared memory.
+        """
+        return self._views[slot]
+
+    def acquire(self, timeout=None):
+        """
+        Takes a free slot to write a frame into.
+
+        :param timeout: how many seconds to wait for a free slot. None waits forever, 0 doesn't wait at all (useful
+                        for live video, where dropping a frame is better than falling behind).
+        :return: a tuple of (slot, view), or None if no slot became free in time
+        """
+        try:
+            slot = self._free.get(block=timeout != 0, timeout=timeout or None)
+        except queue.Empty:
+            return None
+        return slot, self._views[slot]
+
+    def submit(self, slot, sequence, stage=0):
+        """
+        Hands a filled slot to whoever calls receive() on the given stage.
+
+        :param slot: the slot number returned by acquire() or receive()
+        :param sequence: a number identifying the frame, i.e. its position in the video
+        :param stage: which stage queue to put the slot in
+        """
+        self._stages[stage].put((slot, sequence))
+
+    def receive(self, stage=0, timeout=None):
+        """
+        Waits for a slot submitted to the given stage.
+
+        :param stage: which stage queue to take a slot from
+        :param timeout: how many seconds to wait. None waits forever.
+        :return: a tuple of (slot, sequence, view), or None if nothing was submitted in time
+        """
+        try:
+            slot, sequence = self._stages[stage].get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return slot, sequence, self._views[slot]
+
+    def release(self, slot):
+        """
+        Gives a slot back to the ring so it can be acquired again.
+        """
+        self._free.put(slot)
+
+    def close(self):
+        """
+        Stops using the shared memory in this process. Views returned earlier must not be used afterwards.
+        """
+        self._views = []
+        try:
+            self._memory.close()
+        except BufferError:
+            # A view is still referenced somewhere, the mapping goes away when the process exits instead
+            pass
+
+    def unlink(self):
+        """
+        Frees the shared memory. Call once, from the process that created the ring, after every process closed it.
+        """
+        if self._owner:
+            self._memory.unlink()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+
+from .profiling import stage
+
+
+class MotionGate(object):
+    """
+    Decides which parts of a video frame are worth running face detection on, for cameras that mostly look at an
+    empty scene.
+
+    Every frame is compared against a running average of the previous frames (the background) on a heavily downscaled
+    grayscale copy, which costs well under a millisecond even for 4K frames. The pixels that changed are grouped into
+    cells and neighboring moving cells into regions. If nothing moved, update() returns no regions and detection can be
+    skipped entirely. Otherwise the regions can be passed to face_locations(regions=...).
+
+    People who stand still long enough fade into the background. Use refresh_every to get the whole frame back
+    every so often, so they are still seen (i.e. by a tracker that keeps their identity).
+    """
+
+    def __init__(self, width=160, threshold=25, learning_rate=0.05, cell_size=8, min_cell_motion=0.1, margin=0.25,
+                 refresh_every=None):
+        """
+        :param width: the width, in pixels, of the downscaled frame motion is detected in
+        :param threshold: how much (0-255) a pixel has to differ from the background to count as moving
+        :param learning_rate: how quickly the background follows the scene (0-1). Higher values forget moving things
+                              sooner but also let slow movement fade into the background.
+        :param cell_size: the size, in downscaled pixels, of the cells moving pixels are counted in
+        :param min_cell_motion: the fraction of a cell's pixels that have to move for the cell to count as moving.
+                                Filters out sensor noise and flickering single pixels.
+        :param margin: how much to grow each region on every side, as a fraction of its size, so a whole face is
+                       inside it even if only part of the person moved
+        :param refresh_every: Optional - return the whole frame as a region every this many frames
+        """
+        self.width = width
+        self.threshold = threshold
+        self.learning_rate = learning_rate
+        self.cell_size = cell_size
+        self.min_cell_motion = min_cell_motion
+        self.margin = margin
+        self.refresh_every = refresh_every
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the background, i.e. after the camera moved. The next frame is returned as a single region.
+        """
+        self._background = None
+        self._frames = 0
+        self.motion_ratio = 0.0
+
+    def _downscale(self, frame):
+        step = max(1, int(math.ceil(frame.shape[1] / float(self.width))))
+        small = frame[::step, ::step]
+        if small.ndim == 3:
+            small = small.mean(axis=2, dtype=np.float32)
+        return small.astype(np.float32, copy=False), step
+
+    def update(self, frame):
+        """
+        Feeds the next frame of the video to the gate.
+
+        :param frame: the frame, as a numpy array (RGB, BGR or grayscale)
+        :return: a list of (top, right, bottom, left) regions of the frame where something moved. The whole frame is
+                 returned as one region for the first frame and, with refresh_every, every refresh_every frames.
+                 An empty list means nothing moved.
+        """
+        height, width = frame.shape[:2]
+
+        with stage("motion", height * width):
+            small, step = self._downscale(frame)
+            self._frames += 1
+
+            if self._background is None or self._background.shape != small.shape:
+                self._background = small.copy()
+                self.motion_ratio = 1.0
+                return [(0, width, height, 0)]
+
+            moving = np.abs(small - self._background) > self.threshold
+            self.motion_ratio = float(np.count_nonzero(moving)) / moving.size
+
+            # Moving pixels are kept out of the background a bit longer, so a person walking by doesn't leave a ghost
+            rate = np.where(moving, self.learning_rate / 4, self.learning_rate).astype(np.float32)
+            self._background += rate * (small - self._background)
+
+            if self.refresh_every and self._frames % self.refresh_every == 0:
+                return [(0, width, height, 0)]
+
+            if not self.motion_ratio:
+                return []
+
+            regions = []
+            for top, right, bottom, left in _moving_cell_groups(moving, self.cell_size, self.min_cell_motion):
+                top, right, bottom, left = top * step, right * step, bottom * step, left * step
+                vertical_margin = int((bottom - top) * self.margin)
+                horizontal_margin = int((right - left) * self.margin)
+                regions.append((max(0, top - vertical_margin), min(width, right + horizontal_margin),
+                                min(height, bottom + vertical_margin), max(0, left - horizontal_margin)))
+            return regions
+
+
+def _moving_cell_groups(moving, cell_size, min_cell_motion):
+    """
+    Splits a mask of moving pixels into cells and returns the bounding box of every group of touching moving cells.
+
+    :return: a list of (top, right, bottom, left) boxes in mask pixels
+    """
+    rows = int(math.ceil(moving.shape[0] / float(cell_size)))
+    columns = int(math.ceil(moving.shape[1] / float(cell_size)))
+
+    padded = np.zeros((rows * cell_size, columns * cell_size), dtype=np.float32)
+    padded[:moving.shape[0], :moving.shape[1]] = moving
+    cell_motion = padded.reshape(rows, cell_size, columns, cell_size).mean(axis=(1, 3))
+    active = cell_motion >= min_cell_motion
+
+    # Flood fill over the (small) grid of cells, 8-connected so diagonal parts of a person stay together
+    groups = []
+    unvisited = set(zip(*np.nonzero(active)))
+    while unvisited:
+        pending = [unvisited.pop()]
+        top, left = pending[0]
+        bottom, right = top, left
+        while pending:
+            row, column = pending.pop()
+            top, bottom = min(top, row), max(bottom, row)
+            left, right = min(left, column), max(right, column)
+            for neighbor in ((row + dr, column + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)):
+                if neighbor in unvisited:
+                    unvisited.remove(neighbor)
+                    pending.append(neighbor)
+
+        groups.append((int(top) * cell_size, min(moving.shape[1], (int(right) + 1) * cell_size),
+                       min(moving.shape[0], (int(bottom) + 1) * cell_size), int(left) * cell_size))
+    return sorted(groups)
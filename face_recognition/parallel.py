@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import multiprocessing
+import signal
+import threading
+
+
+def _ignore_sigint():
+    # Ctrl+C is handled by the parent process, which shuts the pool down. Workers would only print tracebacks.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _bounded(iterable, slots, stopping):
+    """
+    Yields the items of iterable, but only while fewer than the given number of them are in flight. A slot is given
+    back by the consumer of the results, so a slow consumer (or a slow first task with ordered results) stops the
+    input from being read any further ahead.
+    """
+    for item in iterable:
+        while not slots.acquire(timeout=0.1):
+            if stopping.is_set():
+                return
+        yield item
+
+
+def _pool_size(number_of_cpus):
+    return multiprocessing.cpu_count() if number_of_cpus == -1 else number_of_cpus
+
+
+def create_process_pool(number_of_cpus=-1):
+    """
+    Creates a pool of worker processes set up for running face_recognition in.
+
+    :param number_of_cpus: number of worker processes. -1 means "use all in system".
+    :return: a multiprocessing Pool
+    """
+    # macOS will crash due to a bug in libdispatch if you don't use 'forkserver'
+    context = multiprocessing
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+
+    return context.Pool(processes=_pool_size(number_of_cpus), initializer=_ignore_sigint)
+
+
+@contextlib.contextmanager
+def process_pool(number_of_cpus=-1):
+    """
+    A context manager giving a pool of worker processes that several calls to imap_in_process_pool() can share, so
+    the workers (and the models they load) only start once. The pool is closed and joined on exit, or terminated if an
+    exception was raised. Gives None if number_of_cpus is 1, to run everything in the current process.
+
+    :param number_of_cpus: number of worker processes. -1 means "use all in system".
+    """
+    if number_of_cpus == 1:
+        yield None
+        return
+
+    pool = create_process_pool(number_of_cpus)
+    try:
+        yield pool
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+
+def imap_in_process_pool(function, iterable, number_of_cpus=-1, ordered=True, chunksize=4, max_in_flight=None, pool=None):
+    """
+    Runs function on every item of iterable in a pool of worker processes and yields the results as they come in.
+
+    Unlike Pool.starmap(), the input is read lazily and results are yielded while the rest of the work is still
+    running, so this works on inputs of any size (i.e. every file of a huge photo archive) with bounded memory.
+    A pool created by this function is always shut down when the generator is exhausted or closed, or when an exception
+    is raised.
+
+    :param function: a picklable function taking one item
+    :param iterable: the items to process. Only read as fast as results are consumed.
+    :param number_of_cpus: number of worker processes. -1 means "use all in system".
+    :param ordered: whether to yield the results in input order. If False, results are yielded as soon as they are
+                    ready, which keeps every worker busy even when some items take much longer than others.
+    :param chunksize: how many items to send to a worker at once. Larger chunks mean less inter-process overhead,
+                      smaller chunks balance uneven work better. A few images per chunk is plenty for face detection.
+    :param max_in_flight: the maximum number of items that have been read from the input but whose result hasn't been
+                          yielded yet. Defaults to 8 chunks per worker process.
+    :param pool: Optional - an existing pool with number_of_cpus workers to use (see process_pool()). It is left
+                 running when done.
+    :return: a generator of results
+    """
+    owns_pool = pool is None
+    if owns_pool:
+        pool = create_process_pool(number_of_cpus)
+
+    # The pool reads whole chunks from the input before sending them, so there must be room for a few chunks per
+    # worker or nothing would ever be sent
+    minimum_in_flight = 2 * chunksize * _pool_size(number_of_cpus)
+    slots = threading.Semaphore(max(max_in_flight or 4 * minimum_in_flight, minimum_in_flight))
+    stopping = threading.Event()
+
+    imap = pool.imap if ordered else pool.imap_unordered
+    try:
+        for result in imap(function, _bounded(iterable, slots, stopping), chunksize):
+            slots.release()
+            yield result
+    except BaseException:
+        stopping.set()
+        if owns_pool:
+            pool.terminate()
+        raise
+    else:
+        if owns_pool:
+            pool.close()
+    finally:
+        stopping.set()
+        if owns_pool:
+            pool.join()
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import threading
+import time
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def add_hook(hook):
+    """
+    Registers a function to be called every time a stage of face_recognition finishes, from the thread that ran it.
+
+    The stages timed by the library are "decode" (load_image_file(), size is the number of pixels), "detect" (size is
+    the number of pixels searched), "landmarks" (size is the number of faces), "encode" (size is the number of faces
+    times num_jitters), "match" (size is the number of distances computed) and "motion" (MotionGate.update(), size is
+    the number of pixels of the frame). Applications can time their own stages with stage().
+
+    An exception raised by a hook is logged and otherwise ignored, so a broken hook never makes a library call fail.
+
+    :param hook: a function taking (stage, start, seconds, size), where start is a time.perf_counter() value
+    """
+    global _hooks
+    with _hooks_lock:
+        # Replace the list instead of changing it so stages that are finishing right now don't need the lock
+        _hooks = _hooks + [hook]
+
+
+def remove_hook(hook):
+    """
+    Unregisters a function registered with add_hook(). Does nothing if it isn't registered.
+    """
+    global _hooks
+    with _hooks_lock:
+        _hooks = [registered for registered in _hooks if registered is not hook]
+
+
+class _DisabledStage(object):
+    # Returned by stage() when nothing is listening, so timing costs a single check when profiling is off
+
+    @property
+    def size(self):
+        return 0
+
+    @size.setter
+    def size(self, size):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_DISABLED_STAGE = _DisabledStage()
+
+
+class _Stage(object):
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        for hook in _hooks:
+            try:
+                hook(self.name, self.start, seconds, self.size)
+            except Exception:
+                logger.exception("Profiling hook %r failed for stage %r", hook, self.name)
+        return False
+
+
+def stage(name, size=0):
+    """
+    A context manager that reports how long its body took to every registered hook, i.e.
+    `with stage("track", len(faces)): ...`. Costs next to nothing when no hooks are registered.
+
+    If the size is only known once the work is done, set it on the object returned by the with statement, i.e.
+    `with stage("decode") as timed: ...; timed.size = image.size`.
+
+    :param name: the name of the stage
+    :param size: how much input the stage processed (pixels, faces, ...), summed up per stage by Profiler
+    """
+    if not _hooks:
+        return _DISABLED_STAGE
+    return _Stage(name, size)
+
+
+class Profiler(object):
+    """
+    Records how many times each stage ran, how long it took in total and how much input it processed. Use it as a
+    context manager (or call start() and stop()) around the code to profile:
+
+        with face_recognition.Profiler() as profiler:
+            face_recognition.face_encodings(image)
+        print(profiler.stats())
+
+    The results can be exported as a dict, in the Prometheus text format or (with trace=True) as a Chrome trace that
+    can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, trace=False, current_thread_only=False, max_events=100000):
+        """
+        :param trace: whether to keep every single stage run (not just the totals) for chrome_trace()
+        :param current_thread_only: only record stages run by the thread that created the profiler, i.e. to profile
+                                    one camera thread out of many
+        :param max_events: the maximum number of stage runs to keep with trace=True. Later runs only count in the totals.
+        """
+        self.trace = trace
+        self.max_events = max_events
+        self._thread = threading.get_ident() if current_thread_only else None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets everything recorded so far.
+        """
+        with self._lock:
+            self._totals = {}
+            self._events = []
+            self._dropped_events = 0
+
+    def __call__(self, stage, start, seconds, size):
+        thread = threading.get_ident()
+        if self._thread is not None and thread != self._thread:
+            return
+
+        with self._lock:
+            totals = self._totals.get(stage)
+            if totals is None:
+                totals = self._totals[stage] = [0, 0.0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += size
+            totals[3] = max(totals[3], seconds)
+
+            if self.trace:
+                if len(self._events) < self.max_events:
+                    self._events.append((stage, start, seconds, size, thread))
+                else:
+                    self._dropped_events += 1
+
+    def start(self):
+        """
+        Starts recording.
+
+        :return: the profiler itself
+        """
+        add_hook(self)
+        return self
+
+    def stop(self):
+        """
+        Stops recording. What was recorded so far is kept.
+        """
+        remove_hook(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def stats(self):
+        """
+        Returns the totals of every stage that ran.
+
+        :return: a dict of stage name to a dict with the number of "calls", total "seconds", "mean_seconds",
+                 "max_seconds" and total "size" of the stage
+        """
+        with self._lock:
+            totals = dict((stage, list(values)) for stage, values in self._totals.items())
+
+        return dict((stage, {
+            "calls": calls,
+            "seconds": seconds,
+            "mean_seconds": seconds / calls,
+            "max_seconds": max_seconds,
+            "size": size,
+        }) for stage, (calls, seconds, size, max_seconds) in totals.items())
+
+    def to_prometheus(self, prefix="face_recognition", labels=None):
+        """
+        Returns the totals of every stage in the Prometheus text exposition format, i.e. to serve from a /metrics
+        endpoint. See prometheus_text() to export several profilers at once.
+
+        :param prefix: the prefix of the metric names
+        :param labels: Optional - a dict of extra labels to add to every sample, i.e. {"camera": "front_door"}
+        :return: a string
+        """
+        return prometheus_text([(labels, self)], prefix)
+
+    def chrome_trace(self):
+        """
+        Returns every recorded stage run in the Chrome trace event format. Needs trace=True.
+
+        :return: a dict that can be saved as JSON (see write_chrome_trace())
+        """
+        with self._lock:
+            events = list(self._events)
+            dropped_events = self._dropped_events
+
+        process = os.getpid()
+        return {
+            "traceEvents": [{
+                "name": stage,
+                "cat": "face_recognition",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": seconds * 1e6,
+                "pid": process,
+                "tid": thread,
+                "args": {"size": size},
+            } for stage, start, seconds, size, thread in events],
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": dropped_events},
+        }
+
+    def write_chrome_trace(self, file):
+        """
+        Saves every recorded stage run as a Chrome trace JSON file. Needs trace=True.
+
+        :param file: a file name or a file object opened for writing text
+        """
+        if hasattr(file, "write"):
+            json.dump(self.chrome_trace(), file)
+        else:
+            with open(file, "w") as f:
+                json.dump(self.chrome_trace(), f)
+
+
+_PROMETHEUS_METRICS = [
+    ("stage_calls_total", "calls", "Number of times each stage ran."),
+    ("stage_seconds_total", "seconds", "Wall time spent in each stage, in seconds."),
+    ("stage_size_total", "size", "Input processed by each stage (pixels, faces or distances)."),
+]
+
+
+def prometheus_text(profilers, prefix="face_recognition"):
+    """
+    Returns the totals of several profilers in the Prometheus text exposition format, i.e. one profiler per camera.
+
+    :param profilers: a list of (labels, profiler) tuples, where labels is a dict of labels that tell the samples of
+                      that profiler apart, i.e. {"camera": "front_door"}, or None
+    :param prefix: the prefix of the metric names
+    :return: a string
+    """
+    profilers = [(_format_labels(labels), profiler.stats()) for labels, profiler in profilers]
+
+    lines = []
+    for suffix, key, description in _PROMETHEUS_METRICS:
+        name = "{}_{}".format(prefix, suffix)
+        lines.append("# HELP {} {}".format(name, description))
+        lines.append("# TYPE {} counter".format(name))
+        for labels, stats in profilers:
+            for stage_name in sorted(stats):
+                lines.append('{}{{stage="{}"{}}} {}'.format(name, _escape_label(stage_name), labels, repr(stats[stage_name][key])))
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    return "".join(',{}="{}"'.format(name, _escape_label(value)) for name, value in sorted((labels or {}).items()))
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
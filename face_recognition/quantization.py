@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from .ann_index import _merge_candidates
+from .api import _top_k
+
+
+class QuantizedEncodings(object):
+    """
+    A compact, read-only gallery of face encodings stored as float16 (2x smaller than float32, 4x smaller than the
+    float64 arrays returned by face_encodings()) or as int8 with a per-dimension offset and scale (4x / 8x smaller).
+
+    Distances are computed directly from the compact codes, a block of rows at a time, so the full precision gallery
+    never has to be in memory. If the full precision encodings are available (i.e. as a memory mapped .npy file),
+    search() can re-rank its best candidates with their exact distance.
+    """
+
+    def __init__(self, codes, offset=None, scale=None, exact_encodings=None, block_size=8192):
+        """
+        Use QuantizedEncodings.from_encodings() to build one from existing encodings.
+
+        :param codes: float16 numpy array of shape (N, D), or int8 numpy array of shape (N, D) together with offset and scale
+        :param offset: for int8 codes, the float32 value of a 0 code in each dimension
+        :param scale: for int8 codes, the float32 value of one code step in each dimension
+        :param exact_encodings: Optional - the full precision encodings, in the same order, used to re-rank search results
+        :param block_size: how many rows to decode at a time when computing distances
+        """
+        codes = np.asarray(codes)
+        if codes.dtype == np.int8:
+            if offset is None or scale is None:
+                raise ValueError("int8 codes need an offset and a scale.")
+            offset = np.asarray(offset, dtype=np.float32)
+            scale = np.asarray(scale, dtype=np.float32)
+        elif codes.dtype != np.float16:
+            raise ValueError("Unsupported code type {}. Supported types are float16 and int8.".format(codes.dtype))
+
+        self.codes = codes
+        self.offset = offset
+        self.scale = scale
+        self.exact_encodings = exact_encodings
+        self.block_size = block_size
+
+        # Squared norm of every decoded row, so distances only need one matrix product per block
+        self._norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), block_size):
+            block = self._decode_block(start, start + block_size)
+            self._norms[start:start + block_size] = np.einsum("ij,ij->i", block, block)
+
+    @classmethod
+    def from_encodings(cls, encodings, dtype="int8", keep_exact=False, **kwargs):
+        """
+        Converts existing face encodings to their compact form.
+
+        :param encodings: a list or numpy array of face encodings
+        :param dtype: "int8" or "float16"
+        :param keep_exact: whether to keep a float32 copy of the encodings to re-rank search results with
+        :return: a QuantizedEncodings
+        """
+        encodings = np.asarray(encodings, dtype=np.float32)
+        encodings = encodings.reshape(-1, encodings.shape[-1])
+        exact_encodings = encodings if keep_exact else None
+
+        if dtype == "float16":
+            return cls(encodings.astype(np.float16), exact_encodings=exact_encodings, **kwargs)
+        elif dtype == "int8":
+            # Map the range of each dimension onto [-127, 127]
+            if len(encodings):
+                low, high = encodings.min(axis=0), encodings.max(axis=0)
+            else:
+                low = high = np.zeros(encodings.shape[1], dtype=np.float32)
+            offset = (high + low) / 2
+            scale = np.maximum((high - low) / 254, np.finfo(np.float32).tiny)
+            codes = np.clip(np.rint((encodings - offset) / scale), -127, 127).astype(np.int8)
+            return cls(codes, offset, scale, exact_encodings=exact_encodings, **kwargs)
+        else:
+            raise ValueError("Unsupported dtype {}. Supported types are 'int8' and 'float16'.".format(dtype))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def dimensions(self):
+        return self.codes.shape[1]
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes used by the codes and the decoding parameters (not counting exact_encodings)
+        """
+        return sum(array.nbytes for array in (self.codes, self.offset, self.scale, self._norms) if array is not None)
+
+    def _decode_block(self, start, end):
+        block = self.codes[start:end].astype(np.float32)
+        if self.scale is not None:
+            block *= self.scale
+            block += self.offset
+        return block
+
+    def decode(self):
+        """
+        Converts the compact codes back to face encodings.
+
+        :return: a float32 numpy array of shape (N, D)
+        """
+        return self._decode_block(0, len(self.codes))
+
+    def _squared_distance_blocks(self, queries):
+        for start in range(0, len(self.codes), self.block_size):
+            block = self._decode_block(start, start + self.block_size)
+            distances = np.einsum("ij,ij->i", queries, queries)[:, np.newaxis] + self._norms[np.newaxis, start:start + self.block_size]
+            distances -= 2 * np.dot(queries, block.T)
+            yield start, np.maximum(distances, 0, out=distances)
+
+    def distances(self, face_encodings_to_check):
+        """
+        Returns the approximate distance between each face encoding and every encoding in the gallery.
+
+        :param face_encodings_to_check: List of N face encodings
+        :return: A float32 numpy ndarray of shape (N, len(gallery))
+        """
+        queries = np.asarray(face_encodings_to_check, dtype=np.float32).reshape(len(face_encodings_to_check), -1)
+        distances = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start, block in self._squared_distance_blocks(queries):
+            distances[:, start:start + block.shape[1]] = block
+        return np.sqrt(distances, out=distances)
+
+    def search(self, face_encodings_to_check, k=1, rerank=None):
+        """
+        Finds the k closest encodings in the gallery to each of a list of face encodings.
+
+        :param face_encodings_to_check: List of N face encodings
+        :param k: how many of the closest encodings to return for each face, closest first
+        :param rerank: Optional - how many of the best approximate candidates of each face to re-rank with their exact
+                       distance. Needs exact_encodings. None returns the approximate distances.
+        :return: A tuple of (rows, distances), each a numpy ndarray of shape (N, min(k, len(gallery)))
+        """
+        if rerank and self.exact_encodings is None:
+            raise ValueError("Re-ranking needs the exact encodings. Pass exact_encodings or keep_exact=True.")
+
+        queries = np.asarray(face_encodings_to_check, dtype=np.float32).reshape(len(face_encodings_to_check), -1)
+        keep = min(max(k, rerank or 0), len(self.codes))
+        best_rows = np.full((len(queries), keep), -1, dtype=np.intp)
+        best_distances = np.full((len(queries), keep), np.inf, dtype=np.float32)
+
+        if keep:
+            everyone = np.arange(len(queries))
+            for start, block in self._squared_distance_blocks(queries):
+                _merge_candidates(best_rows, best_distances, everyone, np.arange(start, start + block.shape[1]), block)
+
+        if rerank:
+            # Only the candidates are read from the exact encodings, which may be memory mapped
+            unique_rows, inverse = np.unique(best_rows, return_inverse=True)
+            candidates = np.asarray(self.exact_encodings[unique_rows], dtype=np.float32)[inverse.reshape(best_rows.shape)]
+            best_distances = np.sum((candidates - queries[:, np.newaxis, :]) ** 2, axis=2)
+
+        columns, best_distances = _top_k(best_distances, min(k, keep))
+        return np.take_along_axis(best_rows, columns, axis=1), np.sqrt(best_distances)
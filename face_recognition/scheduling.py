@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import math
+import os
+import threading
+import time
+
+# (detection width, YOLO imgsz) pairs from best quality to cheapest. YOLO image sizes are multiples of 32.
+DEFAULT_LEVELS = ((960, 640), (800, 512), (640, 416), (480, 320), (320, 256))
+
+# Stages whose cost grows with the square of the detection width or of the YOLO image size. Other stages measured
+# with DetectionScheduler.measure() are assumed to cost the same at every level.
+_SCALED_STAGES = {"detect": 0, "yolo": 1}
+
+
+class DetectionScheduler(object):
+    """
+    Decides, frame by frame, whether a camera should run detection on the frame and at which resolution, so the
+    video keeps playing at target_fps and what is drawn on it is never more than max_staleness seconds old.
+
+    It measures how long a frame takes without detection and how long each detection stage takes (see measure()),
+    and from that picks the highest quality level (detection width and YOLO image size) whose detections can be
+    spread over few enough frames (the stride) to keep both promises. When even the cheapest level can't, it runs
+    the cheapest level as often as max_staleness demands and reports itself as overloaded.
+
+        scheduler = face_recognition.DetectionScheduler(target_fps=25)
+        while True:
+            frame = read_frame()
+            plan = scheduler.begin_frame()
+            if plan["detect"]:
+                with scheduler.measure("detect"):
+                    detect_and_encode(frame, detect_max_width=plan["detect_width"], ...)
+            show(frame)
+            scheduler.end_frame()
+
+    A scheduler belongs to one camera thread. decision() can be read and set_share() called from any thread.
+    """
+
+    def __init__(self, target_fps=15.0, max_staleness=1.0, levels=DEFAULT_LEVELS, initial_level=None, smoothing=0.2,
+                 headroom=1.25, clock=time.perf_counter):
+        """
+        :param target_fps: how many frames per second the camera should show
+        :param max_staleness: the maximum number of seconds between two detections
+        :param levels: a list of (detection width, YOLO imgsz) tuples, from best quality to cheapest. Either value can
+                       be None if the application doesn't use it, i.e. [(None, None)] to only adjust the stride.
+        :param initial_level: the index of the level to start at, until the first detection has been measured.
+                              Defaults to the middle level.
+        :param smoothing: how much each new measurement counts in the running averages (0-1)
+        :param headroom: how much cheaper than needed a better level has to look before switching up to it, so the
+                         scheduler doesn't flip between two levels
+        :param clock: the function used to measure time, in seconds
+        """
+        if not levels:
+            raise ValueError("At least one level is needed.")
+
+        self.target_fps = float(target_fps)
+        self.max_staleness = float(max_staleness)
+        self.levels = [tuple(level) for level in levels]
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self.clock = clock
+        self.share = 1.0
+        self._pending_share = None
+        self._share_lock = threading.Lock()
+
+        self._level = len(self.levels) // 2 if initial_level is None else initial_level
+        self._stride = 1
+        self._overloaded = False
+        self._display_seconds = None
+        self._stage_costs = {}
+        self._frames_since_detection = None
+        self._last_detection = None
+        self._frame_start = None
+        self._frame_detects = False
+        self._frame_stages = {}
+        self._decision = self._make_decision(False)
+
+    def begin_frame(self):
+        """
+        Starts timing a frame and decides whether to run detection on it. Call it right after reading the frame.
+
+        :return: a dict with the decision for this frame (see decision()), with "detect" telling whether to run
+                 detection on it
+        """
+        self._apply_pending_share()
+        now = self.clock()
+        detect = (self._frames_since_detection is None or self._frames_since_detection + 1 >= self._stride or
+                  now - self._last_detection >= self.max_staleness)
+
+        self._frame_start = now
+        self._frame_detects = detect
+        self._frame_stages = {}
+        if detect:
+            self._frames_since_detection = 0
+            self._last_detection = now
+        else:
+            self._frames_since_detection += 1
+
+        self._decision = self._make_decision(detect)
+        return self._decision
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """
+        A context manager that times one detection stage of the current frame, i.e. `with scheduler.measure("yolo"):`.
+        The cost of the "detect" stage is assumed to grow with the square of the detection width and the cost of the
+        "yolo" stage with the square of the YOLO image size. Any other stage counts the same at every level.
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._frame_stages[stage] = self._frame_stages.get(stage, 0.0) + self.clock() - start
+
+    def end_frame(self):
+        """
+        Stops timing the current frame, i.e. after it was shown or sent, and plans the next frames.
+        """
+        self._apply_pending_share()
+        if self._frame_start is None:
+            return
+
+        frame_seconds = self.clock() - self._frame_start
+        stage_seconds = sum(self._frame_stages.values())
+        self._display_seconds = self._average(self._display_seconds, max(0.0, frame_seconds - stage_seconds))
+
+        if self._frame_detects:
+            level = self.levels[self._level]
+            for stage, seconds in self._frame_stages.items():
+                self._stage_costs[stage] = self._average(self._stage_costs.get(stage), seconds / _stage_size(stage, level))
+
+        self._frame_start = None
+        self._plan()
+
+    def decision(self):
+        """
+        Returns the scheduler's current decision and what it is based on, i.e. to show it in a dashboard.
+
+        :return: a dict with "detect" (whether the last frame ran detection), "stride" (run detection on one of every
+                 this many frames), "detect_width", "yolo_imgsz", "level" (the index in levels), "overloaded" (whether
+                 the targets can't be met even at the cheapest level), "expected_fps", "staleness" (the expected
+                 number of seconds between detections), "share" (the share of the CPU the camera expects to get),
+                 "display_seconds" and "stage_seconds" (the average seconds per frame and per detection stage)
+        """
+        return self._decision
+
+    def set_share(self, share):
+        """
+        Tells the scheduler what share of the CPU its camera will get from now on, i.e. 0.5 when two cameras share
+        one core. The measured times are scaled by how much the share changed, so the scheduler backs off (or speeds
+        up) right away instead of waiting for the next measurements to show the new load.
+
+        This can be called from any thread. The new share is applied by the camera thread itself, at its next
+        begin_frame() or end_frame().
+        """
+        with self._share_lock:
+            self._pending_share = float(share)
+
+    def _apply_pending_share(self):
+        with self._share_lock:
+            share, self._pending_share = self._pending_share, None
+        if share is None:
+            return
+
+        factor = self.share / share
+        self.share = share
+        if self._display_seconds is not None:
+            self._display_seconds *= factor
+        for stage in self._stage_costs:
+            self._stage_costs[stage] *= factor
+        self._plan()
+
+    def _average(self, average, value):
+        return value if average is None else average + self.smoothing * (value - average)
+
+    def _detection_cost(self, level):
+        return sum(stage_cost * _stage_size(stage, level) for stage, stage_cost in self._stage_costs.items())
+
+    def _plan(self):
+        if self._display_seconds is None or not self._stage_costs:
+            self._decision = self._make_decision(self._decision["detect"])
+            return
+
+        spare_seconds = 1.0 / self.target_fps - self._display_seconds
+        max_stride = max(1, int(self.max_staleness * self.target_fps))
+
+        for index, level in enumerate(self.levels):
+            cost = self._detection_cost(level)
+            if index < self._level:
+                cost *= self.headroom
+            stride = int(math.ceil(cost / spare_seconds)) if spare_seconds > 0 else None
+            if stride is not None and stride <= max_stride:
+                self._level, self._stride, self._overloaded = index, max(1, stride), False
+                break
+        else:
+            self._level, self._stride, self._overloaded = len(self.levels) - 1, max_stride, True
+
+        self._decision = self._make_decision(self._decision["detect"])
+
+    def _make_decision(self, detect):
+        detect_width, yolo_imgsz = self.levels[self._level]
+        seconds_per_frame = None
+        if self._display_seconds is not None:
+            seconds_per_frame = self._display_seconds + self._detection_cost(self.levels[self._level]) / self._stride
+        expected_fps = min(self.target_fps, 1.0 / seconds_per_frame) if seconds_per_frame else self.target_fps
+
+        return {
+            "detect": detect,
+            "stride": self._stride,
+            "detect_width": detect_width,
+            "yolo_imgsz": yolo_imgsz,
+            "level": self._level,
+            "overloaded": self._overloaded,
+            "expected_fps": expected_fps,
+            "staleness": self._stride / expected_fps,
+            "share": self.share,
+            "display_seconds": self._display_seconds,
+            "stage_seconds": dict((stage, cost * _stage_size(stage, self.levels[self._level]))
+                                  for stage, cost in self._stage_costs.items()),
+        }
+
+
+def _stage_size(stage, level):
+    # The number of pixels a stage works on at a level, or 1 for stages that cost the same at every level
+    index = _SCALED_STAGES.get(stage)
+    if index is None or level[index] is None:
+        return 1
+    return level[index] ** 2
+
+
+class SchedulerGroup(object):
+    """
+    The DetectionSchedulers of every camera that shares this machine. Every camera expects an equal share of the CPU
+    cores, so adding a camera makes every scheduler back off from its next frame on and removing one lets them speed
+    up again.
+    """
+
+    def __init__(self, cores=None, **defaults):
+        """
+        :param cores: how many CPU cores the cameras share. Defaults to the number of cores of the machine.
+        :param defaults: the default DetectionScheduler arguments of the cameras, i.e. target_fps=25
+        """
+        self.cores = cores or os.cpu_count() or 1
+        self.defaults = defaults
+        self._schedulers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._schedulers)
+
+    def __contains__(self, name):
+        return name in self._schedulers
+
+    def add(self, name, **options):
+        """
+        Creates the scheduler of a camera, replacing any previous one with the same name.
+
+        :param name: the name of the camera
+        :param options: DetectionScheduler arguments that override the defaults of the group
+        :return: the DetectionScheduler
+        """
+        arguments = dict(self.defaults)
+        arguments.update(options)
+        scheduler = DetectionScheduler(**arguments)
+
+        with self._lock:
+            self._schedulers[name] = scheduler
+            self._rebalance()
+        return scheduler
+
+    def remove(self, name):
+        """
+        Removes the scheduler of a camera. Does nothing if there isn't one.
+        """
+        with self._lock:
+            if self._schedulers.pop(name, None) is not None:
+                self._rebalance()
+
+    def get(self, name):
+        """
+        Returns the scheduler of a camera, or None.
+        """
+        return self._schedulers.get(name)
+
+    def decisions(self):
+        """
+        Returns the current decision of every camera (see DetectionScheduler.decision()).
+
+        :return: a dict of camera name to decision dict
+        """
+        with self._lock:
+            schedulers = dict(self._schedulers)
+        return dict((name, scheduler.decision()) for name, scheduler in schedulers.items())
+
+    def _rebalance(self):
+        share = min(1.0, float(self.cores) / max(1, len(self._schedulers)))
+        for scheduler in self._schedulers.values():
+            scheduler.set_share(share)
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from .api import face_encodings, _trim_css_to_bounds
+from .profiling import stage
+
+
+class Track(object):
+    """
+    A face followed from frame to frame by a FaceTracker.
+
+    id identifies the track for as long as it lives and is never reused by the same tracker. location is the last
+    known (top, right, bottom, left) box of the face and encoding its last face encoding (None until it is encoded).
+
+    identity is free for the application to cache what the encoding was recognized as, i.e. a (name, distance) tuple.
+    It is kept when the face is encoded again, until the application replaces it.
+
+    hits counts the detections matched to the track, missed the updates in a row without one and
+    updates_since_encoding the updates since the face was last encoded.
+    """
+
+    def __init__(self, track_id, location):
+        self.id = track_id
+        self.location = location
+        self.encoding = None
+        self.identity = None
+        self.hits = 1
+        self.missed = 0
+        self.updates_since_encoding = 0
+        self._thumbnail = None
+        self._follower = None
+
+    def __repr__(self):
+        return "Track(id={}, location={}, identity={})".format(self.id, self.location, self.identity)
+
+
+class FaceTracker(object):
+    """
+    Follows faces across the frames of a video so each person only has to be encoded (and recognized) once, instead
+    of on every frame the face is detected in.
+
+    Call update() with the faces detected in a frame to match them to the tracks of the previous frames: first by how
+    much their boxes overlap (IoU), then by how far their centers moved. encode() then computes the encodings of just
+    the faces that are new, haven't been encoded for reencode_every updates or look different than when they were
+    encoded. Everything else about a person (i.e. who they were recognized as) can be cached in Track.identity.
+
+    Between detections, follow() can move the tracks along with the faces using sparse optical flow or an OpenCV
+    tracker, so boxes drawn on the frames in between don't lag behind.
+
+        tracker = face_recognition.FaceTracker()
+        for frame in frames:
+            tracks = tracker.update(frame, face_recognition.face_locations(frame))
+            for track in tracker.encode(frame, tracks):
+                track.identity = recognize(track.encoding)
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_shift=0.5, max_missed=5, reencode_every=30,
+                 appearance_threshold=25.0, follow=None):
+        """
+        :param iou_threshold: how much (intersection over union, 0-1) a detection has to overlap a track to belong to it
+        :param max_center_shift: how far the center of a face may move between updates, as a fraction of the width of
+                                 its track, and still be matched to the track when the boxes don't overlap enough
+        :param max_missed: how many updates in a row a track is kept without a detection before it is dropped
+        :param reencode_every: Optional - encode every face again after this many updates, to catch a wrong identity
+                               early. None to only encode faces again when their appearance changes.
+        :param appearance_threshold: Optional - encode a face again when a 16x16 grayscale thumbnail of it differs this
+                                     much (mean absolute difference, 0-255) from when it was encoded, i.e. it turned
+                                     to the camera. None to never compare appearances.
+        :param follow: Optional - how follow() moves the tracks between detections. "flow" for sparse optical flow or
+                       the name of an OpenCV tracker, i.e. "kcf", "csrt" or "mil". Needs OpenCV (KCF and CSRT need
+                       `pip install opencv-contrib-python`). None (default) to leave the tracks where they were
+                       last detected.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_center_shift = max_center_shift
+        self.max_missed = max_missed
+        self.reencode_every = reencode_every
+        self.appearance_threshold = appearance_threshold
+        self.follow_method = follow
+        self._tracker_factory = None
+        if follow is not None and follow != "flow":
+            self._tracker_factory = _opencv_tracker_factory(follow)
+        elif follow == "flow":
+            _import_cv2()
+        self._next_id = 1
+        self.reset()
+
+    def reset(self):
+        """
+        Drops every track, i.e. when the video cuts to a different scene. Track ids keep counting up.
+        """
+        self.tracks = []
+        self._previous_gray = None
+
+    def update(self, image, face_locations):
+        """
+        Matches the faces detected in a frame to the existing tracks, starts a track for every new face and drops the
+        tracks that have been missing for more than max_missed updates.
+
+        :param image: the frame the faces were detected in (as a numpy array). With follow, use the same channel order
+                      for update() and follow().
+        :param face_locations: the faces detected in the frame, in css (top, right, bottom, left) order
+        :return: the track of every face, in the same order as face_locations
+        """
+        with stage("track", len(face_locations)):
+            face_locations = [tuple(int(value) for value in location) for location in face_locations]
+            pairs = _associate([track.location for track in self.tracks], face_locations, self.iou_threshold,
+                               self.max_center_shift)
+
+            matched = [None] * len(face_locations)
+            for track_index, location_index in pairs:
+                track = self.tracks[track_index]
+                track.location = face_locations[location_index]
+                track.hits += 1
+                track.missed = 0
+                matched[location_index] = track
+
+            matched_tracks = set(id(track) for track in matched if track is not None)
+            survivors = []
+            for track in self.tracks:
+                track.updates_since_encoding += 1
+                if id(track) not in matched_tracks:
+                    track.missed += 1
+                    if track.missed > self.max_missed:
+                        continue
+                survivors.append(track)
+
+            for location_index, location in enumerate(face_locations):
+                if matched[location_index] is None:
+                    track = matched[location_index] = Track(self._next_id, location)
+                    self._next_id += 1
+                    survivors.append(track)
+            self.tracks = survivors
+
+            if self._tracker_factory is not None:
+                for track in matched:
+                    track._follower = self._start_follower(image, track.location)
+            elif self.follow_method == "flow":
+                self._previous_gray = _gray(image)
+
+        return matched
+
+    def needs_encoding(self, track, image):
+        """
+        Returns whether a track's face should be encoded (again): it was never encoded, it was last encoded
+        reencode_every updates ago or it looks different than when it was encoded.
+
+        :param track: a Track of this tracker
+        :param image: the current frame, in the channel order passed to encode()
+        """
+        if track.encoding is None:
+            return True
+        if self.reencode_every and track.updates_since_encoding >= self.reencode_every:
+            return True
+        if self.appearance_threshold is not None and track._thumbnail is not None:
+            difference = np.abs(_thumbnail(image, track.location) - track._thumbnail).mean()
+            return difference > self.appearance_threshold
+        return False
+
+    def encode(self, image, tracks=None, num_jitters=1, model="small"):
+        """
+        Computes the encodings of the tracks that need one (see needs_encoding()), all in one face_encodings() call.
+
+        :param image: the current frame as an RGB numpy array
+        :param tracks: Optional - the tracks to consider, i.e. the ones returned by the last update(). Defaults to
+                       the tracks that were matched to a detection in the last update().
+        :param num_jitters: How many times to re-sample the face when calculating encoding. Higher is more accurate, but slower.
+        :param model: Which landmarks model to use. "large" or "small" (default).
+        :return: the tracks that were encoded. Their encodings are new, so recognize them again and update their identity.
+        """
+        if tracks is None:
+            tracks = [track for track in self.tracks if track.missed == 0]
+
+        pending = [track for track in tracks if self.needs_encoding(track, image)]
+        if not pending:
+            return []
+
+        encodings = face_encodings(image, [track.location for track in pending], num_jitters, model)
+        for track, encoding in zip(pending, encodings):
+            track.encoding = encoding
+            track.updates_since_encoding = 0
+            track._thumbnail = _thumbnail(image, track.location) if self.appearance_threshold is not None else None
+        return pending
+
+    def follow(self, image):
+        """
+        Moves every track along with its face in a frame that faces weren't detected in. Does nothing without follow.
+
+        :param image: the frame (as a numpy array), in the same channel order as the ones passed to update()
+        :return: every live track
+        """
+        if self.follow_method is None or not self.tracks:
+            return list(self.tracks)
+
+        with stage("follow", len(self.tracks)):
+            if self._tracker_factory is not None:
+                for track in self.tracks:
+                    if track._follower is None:
+                        continue
+                    found, (x, y, width, height) = track._follower.update(image)
+                    if found:
+                        track.location = _trim_css_to_bounds((int(y), int(x + width), int(y + height), int(x)), image.shape)
+            else:
+                gray = _gray(image)
+                if self._previous_gray is not None and self._previous_gray.shape == gray.shape:
+                    for track in self.tracks:
+                        track.location = _flow_location(self._previous_gray, gray, track.location)
+                self._previous_gray = gray
+
+        return list(self.tracks)
+
+    def _start_follower(self, image, location):
+        top, right, bottom, left = location
+        follower = self._tracker_factory()
+        follower.init(image, (int(left), int(top), int(right - left), int(bottom - top)))
+        return follower
+
+
+def _import_cv2():
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError("Following faces between detections needs OpenCV. Install it with `pip install opencv-python`.")
+    return cv2
+
+
+def _opencv_tracker_factory(name):
+    """
+    Returns the function that creates an OpenCV tracker by name, i.e. cv2.TrackerKCF_create for "kcf".
+    """
+    cv2 = _import_cv2()
+    factory_name = "Tracker{}_create".format(name.upper())
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        factory = getattr(module, factory_name, None)
+        if factory is not None:
+            return factory
+    raise ValueError("This OpenCV build has no {} tracker. KCF and CSRT need `pip install opencv-contrib-python`.".format(name))
+
+
+def _gray(image):
+    if image.ndim == 3:
+        image = image.mean(axis=2)
+    return image.astype(np.uint8)
+
+
+def _flow_location(previous_gray, gray, location):
+    """
+    Moves a face box by the median optical flow of the corners found inside it.
+    """
+    cv2 = _import_cv2()
+    top, right, bottom, left = location
+    if bottom - top < 4 or right - left < 4:
+        return location
+
+    corners = cv2.goodFeaturesToTrack(previous_gray[top:bottom, left:right], maxCorners=30, qualityLevel=0.01, minDistance=3)
+    if corners is None:
+        return location
+
+    corners = (corners.reshape(-1, 2) + (left, top)).astype(np.float32)
+    moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, corners.reshape(-1, 1, 2), None)
+    found = status.ravel() == 1
+    if not found.any():
+        return location
+
+    dx, dy = np.median(moved.reshape(-1, 2)[found] - corners[found], axis=0)
+    dx, dy = int(round(dx)), int(round(dy))
+    return _trim_css_to_bounds((top + dy, right + dx, bottom + dy, left + dx), gray.shape)
+
+
+def _thumbnail(image, location, size=16):
+    """
+    Returns a size x size float32 grayscale sample of a face, to tell whether it changed since it was encoded.
+    """
+    top, right, bottom, left = _trim_css_to_bounds(location, image.shape)
+    rows = np.linspace(top, max(top, bottom - 1), size).astype(np.intp)
+    columns = np.linspace(left, max(left, right - 1), size).astype(np.intp)
+    sample = image[np.ix_(rows, columns)].astype(np.float32)
+    if sample.ndim == 3:
+        sample = sample.mean(axis=2)
+    return sample
+
+
+def _iou_matrix(boxes, others):
+    """
+    Returns the intersection over union of every pair of (top, right, bottom, left) boxes as a len(boxes) x
+    len(others) matrix.
+    """
+    a = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(others, dtype=np.float64).reshape(-1, 4)
+
+    height = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    width = np.minimum(a[:, None, 1], b[None, :, 1]) - np.maximum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(height, 0, None) * np.clip(width, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return intersection / np.maximum(union, 1e-9)
+
+
+def _greedy_pairs(scores, minimum):
+    """
+    Pairs up rows and columns of a score matrix, best score first, skipping scores below minimum.
+
+    :return: a list of (row, column) tuples
+    """
+    pairs = []
+    used_rows, used_columns = set(), set()
+    for flat_index in np.argsort(-scores, axis=None, kind="stable"):
+        row, column = divmod(int(flat_index), scores.shape[1])
+        if scores[row, column] < minimum:
+            break
+        if row in used_rows or column in used_columns:
+            continue
+        pairs.append((row, column))
+        used_rows.add(row)
+        used_columns.add(column)
+    return pairs
+
+
+def _associate(track_locations, face_locations, iou_threshold, max_center_shift):
+    """
+    Matches face locations to track locations by overlap, then the leftovers by how far their centers are apart.
+
+    :return: a list of (track index, face location index) tuples
+    """
+    if not track_locations or not face_locations:
+        return []
+
+    pairs = _greedy_pairs(_iou_matrix(track_locations, face_locations), max(iou_threshold, 1e-9))
+
+    matched_tracks = set(row for row, _ in pairs)
+    matched_faces = set(column for _, column in pairs)
+    unmatched_tracks = [index for index in range(len(track_locations)) if index not in matched_tracks]
+    unmatched_faces = [index for index in range(len(face_locations)) if index not in matched_faces]
+    if unmatched_tracks and unmatched_faces and max_center_shift:
+        tracks = np.asarray([track_locations[index] for index in unmatched_tracks], dtype=np.float64)
+        faces = np.asarray([face_locations[index] for index in unmatched_faces], dtype=np.float64)
+
+        track_centers = np.stack([(tracks[:, 0] + tracks[:, 2]) / 2, (tracks[:, 1] + tracks[:, 3]) / 2], axis=1)
+        face_centers = np.stack([(faces[:, 0] + faces[:, 2]) / 2, (faces[:, 1] + faces[:, 3]) / 2], axis=1)
+        distances = np.linalg.norm(track_centers[:, None, :] - face_centers[None, :, :], axis=2)
+        shifts = distances / np.maximum(tracks[:, 1] - tracks[:, 3], 1.0)[:, None]
+
+        for row, column in _greedy_pairs(-shifts, -max_center_shift):
+            pairs.append((unmatched_tracks[row], unmatched_faces[column]))
+
+    return pairs
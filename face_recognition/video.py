@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import math
+import re
+
+VIDEO_FILE_PATTERN = r'.*\.(mp4|m4v|mov|avi|mkv|webm|mpg|mpeg|wmv|flv|3gp)$'
+VIDEO_STREAM_PATTERN = r'^(rtsp|rtmp|http|https|udp|tcp)://'
+
+
+def is_video_source(source):
+    """
+    Returns whether a command line argument names a video file or a video stream url.
+    """
+    return bool(re.match(VIDEO_STREAM_PATTERN, source, flags=re.I) or re.match(VIDEO_FILE_PATTERN, source, flags=re.I))
+
+
+def iter_video_frames(source, every_nth_frame=1, fps=None):
+    """
+    Reads frames from a video file or stream, only decoding the frames that are sampled. Frames that are skipped are
+    only grabbed from the stream, which is a lot cheaper than decoding them.
+
+    Reading video needs OpenCV (`pip install opencv-python`).
+
+    :param source: a video file name or stream url
+    :param every_nth_frame: sample one out of every this many frames
+    :param fps: Optional - sample this many frames per second of video instead of using every_nth_frame
+    :return: A generator of (frame index, timestamp in seconds, frame) tuples, with each frame an RGB numpy array
+    """
+    if every_nth_frame < 1:
+        raise ValueError("every_nth_frame must be at least 1, got {}.".format(every_nth_frame))
+    if fps is not None and fps <= 0:
+        raise ValueError("fps must be greater than 0, got {}.".format(fps))
+
+    return _iter_video_frames(source, every_nth_frame, fps)
+
+
+def _iter_video_frames(source, every_nth_frame, fps):
+    try:
+        import cv2
+    except ImportError:
+        raise ImportError("Reading video needs OpenCV. Install it with `pip install opencv-python`.")
+
+    video = cv2.VideoCapture(source)
+    if not video.isOpened():
+        raise IOError("Could not open video {}".format(source))
+
+    video_fps = video.get(cv2.CAP_PROP_FPS) or 0.0
+    next_sample_time = 0.0
+    frame_index = 0
+
+    try:
+        while video.grab():
+            # Streams often don't report a position, so fall back to counting frames if the video has a frame rate
+            if video_fps > 0:
+                timestamp = frame_index / video_fps
+            else:
+                timestamp = video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+            if fps:
+                sampled = timestamp >= next_sample_time
+                if sampled:
+                    # Stay on a fixed grid of sample times so the sampling rate doesn't drift
+                    next_sample_time = (math.floor(timestamp * fps) + 1) / fps
+            else:
+                sampled = frame_index % every_nth_frame == 0
+
+            if sampled:
+                retrieved, frame = video.retrieve()
+                if retrieved:
+                    # Convert from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
+                    yield frame_index, timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            frame_index += 1
+    finally:
+        video.release()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ann_index
+----------------------------------
+
+Tests for `face_recognition.ann_index` module.
+"""
+
+
+import unittest
+import numpy as np
+
+from face_recognition.ann_index import IVFIndex
+
+
+class Test_ann_index(unittest.TestCase):
+
+    def setUp(self):
+        # Clustered data, like encodings of the same people under different conditions
+        random = np.random.RandomState(0)
+        centers = random.rand(50, 128)
+        self.encodings = (centers[random.randint(0, 50, 2000)] + random.normal(0, 0.05, (2000, 128))).astype(np.float32)
+        self.queries = self.encodings[random.choice(2000, 20, replace=False)] + random.normal(0, 0.01, (20, 128))
+
+    def brute_force(self, k):
+        distances = np.linalg.norm(self.encodings[np.newaxis] - self.queries[:, np.newaxis], axis=2)
+        return np.argsort(distances, axis=1)[:, :k], np.sort(distances, axis=1)[:, :k]
+
+    def test_search_with_all_lists_is_exact(self):
+        index = IVFIndex(n_lists=16)
+        index.train(self.encodings)
+        index.add(self.encodings)
+
+        ids, distances = index.search(self.queries, k=5, nprobe=16)
+        expected_ids, expected_distances = self.brute_force(5)
+
+        self.assertEqual(ids.shape, (20, 5))
+        self.assertEqual(ids.tolist(), expected_ids.tolist())
+        self.assertTrue(np.allclose(distances, expected_distances, atol=1e-3))
+
+    def test_search_recall(self):
+        index = IVFIndex(n_lists=16, nprobe=4)
+        index.train(self.encodings)
+        index.add(self.encodings)
+
+        ids, _ = index.search(self.queries, k=5)
+        expected_ids, _ = self.brute_force(5)
+
+        found = sum(len(np.intersect1d(expected, actual)) for expected, actual in zip(expected_ids, ids))
+        self.assertGreaterEqual(found / float(expected_ids.size), 0.9)
+
+    def test_search_with_product_quantization(self):
+        index = IVFIndex(n_lists=16, nprobe=16, pq_subvectors=16, rerank=32)
+        index.train(self.encodings, iterations=5)
+        index.add(self.encodings)
+
+        ids, distances = index.search(self.queries, k=1)
+        expected_ids, expected_distances = self.brute_force(1)
+
+        # The closest candidates are re-ranked with their exact distance
+        self.assertEqual(ids.tolist(), expected_ids.tolist())
+        self.assertTrue(np.allclose(distances, expected_distances, atol=1e-3))
+
+    def test_add_with_ids_and_incrementally(self):
+        index = IVFIndex(n_lists=16)
+        index.train(self.encodings)
+        index.add(self.encodings[:1000], ids=np.arange(1000) + 5000)
+        index.search(self.queries, k=1)
+        new_ids = index.add(self.encodings[1000:])
+
+        self.assertEqual(len(index), 2000)
+        self.assertEqual(new_ids.tolist(), list(range(1000, 2000)))
+
+        ids, distances = index.search(self.encodings[[10, 1500]], k=1, nprobe=16)
+        self.assertEqual(ids[:, 0].tolist(), [5010, 1500])
+        self.assertTrue(np.allclose(distances, 0, atol=1e-2))
+
+    def test_small_adds_are_merged_in_place(self):
+        index = IVFIndex(n_lists=16, pq_subvectors=16)
+        index.train(self.encodings)
+        index.add(self.encodings[:1000])
+        index.search(self.queries, k=1)
+        vectors = index._vectors
+
+        for start in range(1000, 1100, 10):
+            index.add(self.encodings[start:start + 10])
+            ids, _ = index.search(self.encodings[[5, start + 9]], k=1, nprobe=16)
+            self.assertEqual(ids[:, 0].tolist(), [5, start + 9])
+
+        # The lists had room for the new encodings, so they were written into the existing arrays
+        self.assertIs(index._vectors, vectors)
+        self.assertEqual(len(index), 1100)
+
+        index.add(self.encodings[1100:])
+        ids, _ = index.search(self.encodings[[5, 1999]], k=1, nprobe=16)
+        self.assertEqual(ids[:, 0].tolist(), [5, 1999])
+
+    def test_search_pads_missing_results(self):
+        index = IVFIndex(n_lists=16)
+        index.train(self.encodings)
+        index.add(self.encodings[:3])
+
+        ids, distances = index.search(self.queries[:2], k=5, nprobe=16)
+
+        self.assertEqual(ids.shape, (2, 5))
+        self.assertEqual(ids[:, 3:].tolist(), [[-1, -1], [-1, -1]])
+        self.assertTrue(np.all(np.isinf(distances[:, 3:])))
+
+    def test_search_empty_index(self):
+        index = IVFIndex(n_lists=16)
+        index.train(self.encodings)
+
+        ids, distances = index.search(self.queries[:2], k=3)
+
+        self.assertEqual(ids.tolist(), [[-1] * 3] * 2)
+        self.assertTrue(np.all(np.isinf(distances)))
+
+    def test_untrained_index(self):
+        index = IVFIndex(n_lists=16)
+
+        with self.assertRaises(ValueError):
+            index.add(self.encodings)
+
+        with self.assertRaises(ValueError):
+            index.train(self.encodings[:10])
+
+    def test_evaluate(self):
+        index = IVFIndex(n_lists=16)
+        index.train(self.encodings)
+        index.add(self.encodings)
+
+        report = index.evaluate(self.queries, k=5, nprobe_values=(1, 16))
+
+        self.assertGreater(report["brute_force_ms"], 0)
+        self.assertEqual([run["nprobe"] for run in report["runs"]], [1, 16])
+        self.assertEqual(report["runs"][1]["recall"], 1.0)
+        self.assertTrue(all(run["ms_per_query"] > 0 for run in report["runs"]))
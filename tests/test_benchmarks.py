@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmarks
+----------------------------------
+
+Tests for the `benchmarks` harness.
+"""
+
+
+import unittest
+
+from benchmarks import harness
+
+
+def _run(medians, stdev=0.0, **environment):
+    return {
+        "environment": environment,
+        "results": [{"name": name, "median": median, "stdev": stdev} for name, median in medians.items()],
+    }
+
+
+class Test_benchmarks(unittest.TestCase):
+
+    def test_measure(self):
+        calls = []
+
+        timing = harness.measure(lambda: calls.append(1), repeat=3, min_time=0.001)
+
+        self.assertEqual(timing["repeat"], 3)
+        self.assertEqual(len(calls), 1 + 3 * timing["number"])
+        self.assertLessEqual(timing["best"], timing["median"])
+
+    def test_result(self):
+        timing = {"median": 0.5, "best": 0.4, "mean": 0.5, "stdev": 0.1, "repeat": 3, "number": 1}
+
+        record = harness.result("detection", "hog/480p", timing, items=2, unit="image", faces=1)
+
+        self.assertEqual(record["name"], "detection/hog/480p")
+        self.assertEqual(record["per_second"], 4.0)
+        self.assertEqual(record["extra"], {"faces": 1})
+
+    def test_compare(self):
+        baseline = _run({"a": 1.0, "b": 1.0, "c": 1.0, "d": 1.0})
+        current = _run({"a": 1.5, "b": 0.5, "c": 1.05, "e": 1.0})
+
+        statuses = dict((row["name"], row["status"]) for row in harness.compare(baseline, current, threshold=0.1))
+
+        self.assertEqual(statuses, {"a": "regression", "b": "improvement", "c": "unchanged", "d": "missing", "e": "new"})
+
+    def test_compare_ignores_noise(self):
+        baseline = _run({"a": 1.0}, stdev=0.3)
+        current = _run({"a": 1.5}, stdev=0.3)
+
+        self.assertEqual(harness.compare(baseline, current, threshold=0.1)[0]["status"], "unchanged")
+
+    def test_environment_differences(self):
+        baseline = _run({}, python="3.8", dlib="19.22", date="yesterday")
+        current = _run({}, python="3.11", dlib="19.22", date="today")
+
+        self.assertEqual(harness.environment_differences(baseline, current), ["python"])
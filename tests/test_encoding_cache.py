@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_encoding_cache
+----------------------------------
+
+Tests for `face_recognition.encoding_cache` module.
+"""
+
+
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from click.testing import CliRunner
+
+from face_recognition import api
+from face_recognition import face_recognition_cli
+from face_recognition.encoding_cache import EncodingCache, image_digest, file_digest
+
+
+class Test_encoding_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_put_and_get(self):
+        cache = EncodingCache(self.cache_dir)
+        key = cache.key("abc", "encodings", model="hog")
+        encodings = np.random.RandomState(0).rand(2, 128)
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, [(1, 2, 3, 4), (5, 6, 7, 8)], encodings)
+        locations, cached_encodings = cache.get(key)
+
+        self.assertEqual(locations, [(1, 2, 3, 4), (5, 6, 7, 8)])
+        self.assertEqual(cached_encodings.dtype, np.float32)
+        np.testing.assert_allclose(cached_encodings, encodings, atol=1e-6)
+        self.assertEqual(len(cache), 1)
+
+    def test_key_depends_on_settings(self):
+        self.assertNotEqual(EncodingCache.key("abc", "encodings", num_jitters=1),
+                            EncodingCache.key("abc", "encodings", num_jitters=2))
+        self.assertEqual(EncodingCache.key("abc", "encodings", num_jitters=1, model="small"),
+                         EncodingCache.key("abc", "encodings", model="small", num_jitters=1))
+
+    def test_lru_eviction(self):
+        cache = EncodingCache(self.cache_dir)
+        cache.put("first", [(1, 2, 3, 4)], np.zeros((1, 128)))
+        entry_size = os.path.getsize(os.path.join(self.cache_dir, "first.npz"))
+
+        cache = EncodingCache(self.cache_dir, max_bytes=entry_size * 2)
+        os.utime(os.path.join(self.cache_dir, "first.npz"), (1, 1))
+        cache.put("second", [(1, 2, 3, 4)], np.zeros((1, 128)))
+        cache.put("third", [(1, 2, 3, 4)], np.zeros((1, 128)))
+
+        self.assertIsNone(cache.get("first"))
+        self.assertIsNotNone(cache.get("second"))
+        self.assertIsNotNone(cache.get("third"))
+
+    def test_pickle(self):
+        cache = pickle.loads(pickle.dumps(EncodingCache(self.cache_dir, max_bytes=1234)))
+
+        self.assertEqual(cache.directory, self.cache_dir)
+        self.assertEqual(cache.max_bytes, 1234)
+
+    def test_digests(self):
+        image_file = os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg')
+        img = api.load_image_file(image_file)
+
+        self.assertEqual(image_digest(img), image_digest(img.copy()))
+        self.assertNotEqual(image_digest(img), image_digest(img[:, :-1]))
+        self.assertEqual(len(file_digest(image_file)), 40)
+
+    def test_face_encodings_with_cache(self):
+        cache = EncodingCache(self.cache_dir)
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        encodings = api.face_encodings(img, cache=cache)
+        cached_encodings = api.face_encodings(img, cache=cache)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(len(cached_encodings), 1)
+        np.testing.assert_allclose(cached_encodings[0], encodings[0], atol=1e-6)
+        np.testing.assert_allclose(cached_encodings[0], api.face_encodings(img)[0], atol=1e-6)
+
+    def test_face_encodings_with_cache_of_face_at_the_edge(self):
+        cache = EncodingCache(self.cache_dir)
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama_partial_face.jpg'))
+
+        # The face is cut off by the left edge of the image
+        self.assertLess(api._raw_face_locations(img)[0].left(), 0)
+        cached_encodings = api.face_encodings(img, cache=cache)
+
+        self.assertEqual(len(cached_encodings), 1)
+        np.testing.assert_allclose(cached_encodings[0], api.face_encodings(img)[0], atol=1e-6)
+
+    def test_face_locations_with_cache(self):
+        cache = EncodingCache(self.cache_dir)
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        self.assertEqual(api.face_locations(img, cache=cache), [(142, 617, 409, 349)])
+        self.assertEqual(api.face_locations(img, cache=cache), [(142, 617, 409, 349)])
+        self.assertEqual(len(cache), 1)
+
+    def test_command_line_interface_cache_dir(self):
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+        image_file = os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg')
+        args = [image_folder, image_file, "--cache-dir", self.cache_dir]
+
+        result = runner.invoke(face_recognition_cli.main, args=args)
+        cached_result = runner.invoke(face_recognition_cli.main, args=args)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(cached_result.exit_code, 0)
+        self.assertTrue('obama.jpg,obama' in cached_result.output)
+        self.assertEqual(len(EncodingCache(self.cache_dir)), len(face_recognition_cli.image_files_in_folder(image_folder)) + 1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_encoding_store
+----------------------------------
+
+Tests for `face_recognition.encoding_store` module.
+"""
+
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from face_recognition.encoding_store import EncodingStore
+
+
+class Test_encoding_store(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = EncodingStore(os.path.join(self.directory, "store"))
+
+        random = np.random.RandomState(0)
+        self.alice = random.rand(2, 128)
+        self.bob = random.rand(1, 128)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_empty_store(self):
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.encodings.shape, (0, 128))
+        self.assertEqual(self.store.distances(self.alice).shape, (2, 0))
+        self.assertEqual(self.store.best_matches(self.alice), [(None, None), (None, None)])
+
+    def test_append(self):
+        self.store.append(["alice", "alice"], self.alice, metadata=[{"file": "a1.jpg"}, {"file": "a2.jpg"}])
+        self.store.append(["bob"], self.bob)
+
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(len(self.store.shard_encodings()), 2)
+        self.assertEqual(self.store.names, ["alice", "alice", "bob"])
+        self.assertEqual(self.store.metadata, [{"file": "a1.jpg"}, {"file": "a2.jpg"}, {}])
+        self.assertEqual(self.store.names_of([2, 0]), ["bob", "alice"])
+        self.assertEqual(self.store.encodings.dtype, np.float32)
+        self.assertTrue(np.allclose(self.store.encodings, np.concatenate([self.alice, self.bob])))
+
+        with self.assertRaises(ValueError):
+            self.store.append(["carol"], self.alice)
+
+    def test_float64_store(self):
+        store = EncodingStore(os.path.join(self.directory, "float64"), dtype=np.float64)
+        store.append(["alice", "alice"], self.alice)
+
+        # The type is kept in the manifest, so it doesn't have to be given again to open the store
+        reopened = EncodingStore(store.directory)
+        self.assertEqual(reopened.encodings.dtype, np.float64)
+        self.assertTrue(np.array_equal(reopened.encodings, self.alice))
+
+    def test_shards_are_memory_mapped(self):
+        self.store.append(["alice", "alice"], self.alice)
+
+        encodings = self.store.encodings
+        self.assertIsInstance(encodings, np.memmap)
+        self.assertFalse(encodings.flags.writeable)
+
+    def test_readers_see_appends(self):
+        reader = EncodingStore(self.store.directory)
+        self.store.append(["alice", "alice"], self.alice)
+
+        self.assertEqual(len(reader), 0)
+        reader.refresh()
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(reader.names, ["alice", "alice"])
+
+    def test_compact(self):
+        self.store.append(["alice", "alice"], self.alice)
+        self.store.append(["bob"], self.bob)
+        reader = EncodingStore(self.store.directory)
+        reader.shard_encodings()
+
+        self.assertEqual(self.store.compact(), 3)
+        self.assertEqual(len(self.store.shard_encodings()), 1)
+        self.assertEqual(self.store.names, ["alice", "alice", "bob"])
+
+        self.assertEqual(self.store.compact(drop_names=["alice"]), 1)
+        self.assertEqual(self.store.names, ["bob"])
+        self.assertTrue(np.allclose(self.store.encodings, self.bob))
+
+        # Only the shards of the last two generations are kept
+        self.assertEqual(sorted(f for f in os.listdir(self.store.directory) if f.endswith(".npy")),
+                         ["shard-000002.npy", "shard-000003.npy"])
+
+        # A reader that opened the store before it was compacted still works, and picks up the new shard on refresh
+        self.assertEqual(len(reader.encodings), 3)
+        reader.refresh()
+        self.assertEqual(reader.names, ["bob"])
+
+    def test_lazy_reader_survives_compaction(self):
+        self.store.append(["alice", "alice"], self.alice)
+        self.store.append(["bob"], self.bob)
+        reader = EncodingStore(self.store.directory)
+        idle_reader = EncodingStore(self.store.directory)
+
+        # The readers haven't mapped a shard or read a name yet when the store is compacted
+        self.store.compact()
+        distances = reader.distances(self.bob)
+        self.assertEqual(distances.shape, (1, 3))
+        self.assertEqual(reader.names_of([int(np.argmin(distances))]), ["bob"])
+
+        # After a second compaction the shards of the idle reader are gone and it reads the new ones instead
+        self.store.append(["carol"], self.bob)
+        self.store.compact(drop_names=["alice"])
+        distances = idle_reader.distances(self.bob)
+        self.assertEqual(distances.shape, (1, 2))
+        self.assertEqual(idle_reader.names_of(np.arange(2)), ["bob", "carol"])
+
+        # The reader that mapped the first compacted shard keeps working on it until it refreshes
+        self.assertEqual(reader.distances(self.bob).shape, (1, 3))
+        reader.refresh()
+        distances = reader.distances(self.bob)
+        self.assertEqual(distances.shape, (1, 2))
+        self.assertEqual(reader.names_of(np.arange(2)), ["bob", "carol"])
+
+    def test_matching(self):
+        self.store.append(["alice", "alice"], self.alice)
+        self.store.append(["bob"], self.bob)
+
+        distances = self.store.distances(self.bob)
+        self.assertEqual(distances.shape, (1, 3))
+        self.assertAlmostEqual(distances[0, 2], 0.0, places=3)
+
+        rows, _ = self.store.search(self.alice[1:], k=2)
+        self.assertEqual(rows[0, 0], 1)
+
+        matches = self.store.best_matches([self.alice[0], np.zeros(128)])
+        self.assertEqual(matches[0][0], "alice")
+        self.assertIsNone(matches[1][0])
+
+    def test_pickle(self):
+        self.store.append(["alice", "alice"], self.alice)
+        pickled = pickle.dumps(self.store)
+        restored = pickle.loads(pickled)
+
+        self.assertLess(len(pickled), self.alice.nbytes)
+        self.assertEqual(restored.names, ["alice", "alice"])
+        self.assertTrue(np.array_equal(restored.encodings, self.store.encodings))
+
+        # The store is opened once per process and refreshed when it is unpickled again
+        self.store.append(["bob"], self.bob)
+        self.assertIs(pickle.loads(pickled), restored)
+        self.assertEqual(restored.names, ["alice", "alice", "bob"])
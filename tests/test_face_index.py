@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_face_index
+----------------------------------
+
+Tests for `face_recognition.face_index` module.
+"""
+
+
+import unittest
+import io
+import numpy as np
+
+from face_recognition.face_index import FaceIndex
+
+
+class Test_face_index(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.alice = random.rand(3, 128)
+        self.bob = random.rand(2, 128)
+        self.carol = random.rand(1, 128)
+
+        self.index = FaceIndex(capacity=2)
+        self.index.add("alice", self.alice)
+        self.index.add("bob", self.bob)
+        self.index.add("carol", self.carol[0])
+
+    def test_add(self):
+        self.assertEqual(len(self.index), 6)
+        self.assertEqual(self.index.names, ["alice", "bob", "carol"])
+        self.assertEqual(self.index.count("alice"), 3)
+        self.assertEqual(self.index.encodings.dtype, np.float32)
+        self.assertEqual(self.index.labels.tolist(), [0, 0, 0, 1, 1, 2])
+
+        rows = self.index.add("bob", self.bob[0])
+        self.assertEqual(rows.tolist(), [6])
+        self.assertEqual(self.index.count("bob"), 3)
+
+    def test_float64(self):
+        index = FaceIndex(capacity=1, dtype=np.float64)
+        index.add("alice", self.alice)
+
+        self.assertEqual(index.encodings.dtype, np.float64)
+        self.assertTrue(np.array_equal(index.encodings, self.alice))
+
+    def test_remove(self):
+        self.assertEqual(self.index.remove("alice"), 3)
+        self.assertEqual(self.index.remove("alice"), 0)
+
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.names, ["bob", "carol"])
+        self.assertNotIn("alice", self.index)
+        self.assertEqual(sorted(self.index.names_of(range(3))), ["bob", "bob", "carol"])
+
+        rows, distances = self.index.search(self.bob, k=1)
+        self.assertEqual(self.index.names_of(rows[:, 0]), ["bob", "bob"])
+        np.testing.assert_allclose(distances[:, 0], 0, atol=1e-3)
+
+    def test_search(self):
+        rows, distances = self.index.search(np.vstack([self.alice[1], self.carol[0]]), k=2)
+
+        self.assertEqual(rows.shape, (2, 2))
+        self.assertEqual(rows[0, 0], 1)
+        self.assertEqual(rows[1, 0], 5)
+        self.assertTrue(np.all(distances[:, 0] <= distances[:, 1]))
+
+    def test_identity_distances(self):
+        queries = np.vstack([self.alice[2], self.bob[1]])
+        labels, distances = self.index.identity_distances(queries)
+
+        self.assertEqual([self.index.name_of(label) for label in labels], ["alice", "bob", "carol"])
+        self.assertEqual(distances.shape, (2, 3))
+        expected = [[np.linalg.norm(encodings - query, axis=1).min() for encodings in (self.alice, self.bob, self.carol)] for query in queries]
+        np.testing.assert_allclose(distances, expected, atol=1e-3)
+
+    def test_search_identities(self):
+        labels, distances = self.index.search_identities([self.bob[0]], k=5)
+
+        self.assertEqual(labels.shape, (1, 3))
+        self.assertEqual(self.index.name_of(labels[0, 0]), "bob")
+
+    def test_best_matches(self):
+        matches = self.index.best_matches([self.carol[0], np.full(128, 10.0)], tolerance=0.6)
+
+        self.assertEqual(matches[0][0], "carol")
+        self.assertAlmostEqual(matches[0][1], 0, delta=1e-3)
+        self.assertIsNone(matches[1][0])
+
+    def test_empty_index(self):
+        index = FaceIndex()
+
+        self.assertEqual(index.search(self.alice)[0].shape, (3, 0))
+        self.assertEqual(index.best_matches(self.alice[:1]), [(None, None)])
+        self.assertEqual(index.identity_distances(self.alice)[1].shape, (3, 0))
+
+    def test_save_and_load(self):
+        self.index.remove("bob")
+        f = io.BytesIO()
+        self.index.save(f)
+        f.seek(0)
+
+        loaded = FaceIndex.load(f)
+
+        self.assertEqual(loaded.names, ["alice", "carol"])
+        self.assertEqual(len(loaded), 4)
+        np.testing.assert_array_equal(loaded.encodings, self.index.encodings)
+        self.assertEqual(loaded.best_matches([self.carol[0]])[0][0], "carol")
+        loaded.add("dave", self.bob[0])
+        self.assertEqual(loaded.count("dave"), 1)
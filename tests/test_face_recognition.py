@@ -9,15 +9,25 @@ Tests for `face_recognition` module.
 """
 
 
+import concurrent.futures
 import unittest
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import numpy as np
+import PIL.Image
 from click.testing import CliRunner
 
 from face_recognition import api
 from face_recognition import face_recognition_cli
 from face_recognition import face_detection_cli
 
+from . import test_video
+
 
 class Test_face_recognition(unittest.TestCase):
 
@@ -29,6 +39,21 @@ class Test_face_recognition(unittest.TestCase):
         img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', '32bit.png'))
         self.assertEqual(img.shape, (1200, 626, 3))
 
+    def test_load_image_file_max_dimension(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), max_dimension=300)
+        self.assertEqual(max(img.shape[:2]), 300)
+        self.assertEqual(img.shape[2], 3)
+
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), max_dimension=5000)
+        self.assertEqual(img.shape, (1137, 910, 3))
+
+    def test_load_image_file_from_bytes(self):
+        with open(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), 'rb') as f:
+            data = f.read()
+
+        self.assertEqual(api.load_image_file(data).shape, (1137, 910, 3))
+        self.assertEqual(api.load_image_file(memoryview(data), mode='L').shape, (1137, 910))
+
     def test_raw_face_locations(self):
         img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
         detected_faces = api._raw_face_locations(img)
@@ -91,6 +116,78 @@ class Test_face_recognition(unittest.TestCase):
         self.assertEqual(len(detected_faces), 1)
         self.assertEqual(detected_faces[0], (142, 551, 409, 349))
 
+    def test_tiled_face_locations(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        # The face is inside both tiles, which overlap from x=273 to x=637
+        self.assertEqual(api._tile_spans(910, 2, 0.8), [(0, 637), (273, 910)])
+        detected_faces = api.face_locations(img, tiles=(1, 2), overlap=0.8)
+
+        self.assertEqual(len(detected_faces), 1)
+        for value, expected in zip(detected_faces[0], (142, 617, 409, 349)):
+            self.assertAlmostEqual(value, expected, delta=10)
+
+        with concurrent.futures.ThreadPoolExecutor(2) as pool:
+            self.assertEqual(api.face_locations(img, tiles=(1, 2), overlap=0.8, pool=pool), detected_faces)
+
+    def test_tiled_face_locations_invalid_tiles(self):
+        img = np.zeros((100, 100, 3), dtype=np.uint8)
+
+        with self.assertRaises(ValueError):
+            api.face_locations(img, tiles=(0, 2))
+
+    def test_face_locations_in_regions(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        detected_faces = api.face_locations(img, regions=[(100, 700, 450, 300), (120, 640, 430, 330)])
+
+        self.assertEqual(len(detected_faces), 1)
+        for value, expected in zip(detected_faces[0], (142, 617, 409, 349)):
+            self.assertAlmostEqual(value, expected, delta=10)
+
+        self.assertEqual(api.face_locations(img, regions=[(600, 900, 1100, 0)]), [])
+        self.assertEqual(api.face_locations(img, regions=[]), [])
+
+    def test_face_locations_in_small_regions_are_scaled_up(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), max_dimension=227)
+        frame = np.zeros((600, 800, 3), dtype=np.uint8)
+        frame[300:300 + img.shape[0], 400:400 + img.shape[1]] = img
+        expected_face = api.face_locations(api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg')))[0]
+        expected_face = tuple(int(round(v * img.shape[0] / 1137.0)) + offset for v, offset in zip(expected_face, (300, 400, 300, 400)))
+
+        # The face is too small to be found without upsampling the whole frame
+        self.assertEqual(api.face_locations(frame, number_of_times_to_upsample=0), [])
+
+        region = (300, 400 + img.shape[1], 300 + img.shape[0], 400)
+        detected_faces = api.face_locations(frame, number_of_times_to_upsample=0, regions=[region], min_region_size=400)
+
+        self.assertEqual(len(detected_faces), 1)
+        for value, expected in zip(detected_faces[0], expected_face):
+            self.assertAlmostEqual(value, expected, delta=8)
+
+    def test_face_locations_tiles_and_regions(self):
+        img = np.zeros((100, 100, 3), dtype=np.uint8)
+
+        with self.assertRaises(ValueError):
+            api.face_locations(img, tiles=(2, 2), regions=[(0, 50, 50, 0)])
+
+    def test_face_encodings_in_regions(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        encodings = api.face_encodings(img, regions=[(100, 700, 450, 300)])
+
+        self.assertEqual(len(encodings), 1)
+        self.assertLess(api.face_distance(encodings, api.face_encodings(img)[0])[0], 0.1)
+        self.assertEqual(api.face_encodings(img, regions=[(600, 900, 1100, 0)]), [])
+
+    def test_non_max_suppression(self):
+        locations = [(0, 50, 50, 0), (10, 40, 50, 0), (0, 150, 50, 100), (0, 55, 50, 5)]
+        scores = [1.0, 2.0, 0.5, 3.0]
+
+        # The second location lies inside the first and the fourth (which scores best) covers 90% of the first
+        self.assertEqual(api._non_max_suppression(locations, scores).tolist(), [3, 2])
+        self.assertEqual(api._non_max_suppression(locations, scores, threshold=0.95).tolist(), [3, 1, 2])
+
     def test_raw_face_locations_batched(self):
         img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
         images = [img, img, img]
@@ -111,6 +208,47 @@ class Test_face_recognition(unittest.TestCase):
             self.assertEqual(len(detected_faces), 1)
             self.assertEqual(detected_faces[0], (154, 611, 390, 375))
 
+    def test_batched_face_locations_mixed_sizes(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        small_img = img[:600, :700]
+        images = [img, small_img, img]
+
+        batched_detected_faces = api.batch_face_locations(images, number_of_times_to_upsample=0, batch_size=2)
+
+        self.assertEqual(len(batched_detected_faces), 3)
+        self.assertEqual(batched_detected_faces[0], [(154, 611, 390, 375)])
+        self.assertEqual(batched_detected_faces[2], [(154, 611, 390, 375)])
+        self.assertEqual(len(batched_detected_faces[1]), 1)
+        self.assertAlmostEqual(batched_detected_faces[1][0][0], 154, delta=25)
+        self.assertLessEqual(batched_detected_faces[1][0][1], 700)
+
+    def test_iter_batch_face_locations_buckets(self):
+        img = np.zeros((100, 100, 3), dtype=np.uint8)
+
+        self.assertEqual(api._bucket_shape((100, 130, 3), 64), (128, 192, 3))
+        self.assertEqual(api._pad_to_shape(img, (128, 128, 3)).shape, (128, 128, 3))
+        self.assertIs(api._pad_to_shape(img, (100, 100, 3)), img)
+
+    def test_iter_batch_face_locations_odd_first_image(self):
+        images = [np.zeros((64, 64, 3), dtype=np.uint8)] + [np.zeros((200, 200, 3), dtype=np.uint8)] * 8
+        read = []
+
+        def stream():
+            for image in images:
+                read.append(image)
+                yield image
+
+        # The first image is alone in its bucket, but its result doesn't wait for the end of the stream
+        results = api.iter_batch_face_locations(stream(), number_of_times_to_upsample=0, batch_size=2)
+        self.assertEqual(next(results), [])
+        self.assertLessEqual(len(read), 3)
+
+        held = []
+        for _ in results:
+            held.append(len(read))
+        self.assertEqual(len(held), 8)
+        self.assertTrue(all(count - done <= 3 for done, count in enumerate(held, 2)))
+
     def test_raw_face_landmarks(self):
         img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
         face_landmarks = api._raw_face_landmarks(img)
@@ -145,6 +283,30 @@ class Test_face_recognition(unittest.TestCase):
             set(['nose_tip', 'left_eye', 'right_eye']))
         self.assertEqual(face_landmarks[0]['nose_tip'], [(496, 295)])
 
+    def test_face_landmarks_array(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        points = api.face_landmarks_array(img)
+        face_landmarks = api.face_landmarks(img)
+
+        self.assertEqual(points.shape, (1, 68, 2))
+        self.assertEqual(points.dtype, np.int32)
+        for feature, indexes in api.FACE_LANDMARKS_68_POINT.items():
+            self.assertEqual([tuple(p) for p in points[0, indexes]], face_landmarks[0][feature])
+
+    def test_face_landmarks_array_small_model(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        points = api.face_landmarks_array(img, model="small")
+
+        self.assertEqual(points.shape, (1, 5, 2))
+        self.assertEqual(tuple(points[0, api.FACE_LANDMARKS_5_POINT['nose_tip'][0]]), (496, 295))
+
+    def test_face_landmarks_array_no_faces(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        self.assertEqual(api.face_landmarks_array(img, face_locations=[]).shape, (0, 68, 2))
+        with self.assertRaises(ValueError):
+            api.face_landmarks_array(img, model="medium")
+
     def test_face_encodings(self):
         img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
         encodings = api.face_encodings(img)
@@ -159,6 +321,51 @@ class Test_face_recognition(unittest.TestCase):
         self.assertEqual(len(encodings), 1)
         self.assertEqual(len(encodings[0]), 128)
 
+    def test_batch_face_encodings(self):
+        img_a = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        img_b = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'biden.jpg'))
+        images = [img_a, img_b, img_a]
+        locations = [api.face_locations(img) for img in images]
+
+        encodings, index = api.batch_face_encodings(images, locations, batch_size=2)
+
+        self.assertEqual(encodings.shape, (3, 128))
+        self.assertEqual(encodings.dtype, np.float32)
+        self.assertEqual(index.tolist(), [[0, 0], [1, 0], [2, 0]])
+        np.testing.assert_allclose(encodings[1], api.face_encodings(img_b, locations[1])[0], atol=1e-6)
+
+    def test_batch_face_encodings_no_faces(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        encodings, index = api.batch_face_encodings([img], [[]])
+
+        self.assertEqual(encodings.shape, (0, 128))
+        self.assertEqual(index.shape, (0, 2))
+
+    def test_detect_and_encode(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        locations, encodings, timings = api.detect_and_encode(img, detect_max_width=455)
+
+        self.assertEqual(len(locations), 1)
+        for actual, expected in zip(locations[0], (142, 617, 409, 349)):
+            self.assertAlmostEqual(actual, expected, delta=20)
+        self.assertEqual(len(encodings), 1)
+        self.assertLessEqual(api.face_distance([encodings[0]], api.face_encodings(img)[0])[0], 0.1)
+        self.assertEqual(set(timings.keys()), set(["resize", "detect", "encode"]))
+
+        locations, encodings, timings = api.detect_and_encode(img, detect_max_width=455, encode=False)
+        self.assertEqual((len(locations), encodings), (1, None))
+
+    def test_detect_and_encode_on_detection_image(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        locations, encodings, timings = api.detect_and_encode(img, detect_max_width=455, encode_on="detection")
+        self.assertEqual(len(encodings), 1)
+
+        with self.assertRaises(ValueError):
+            api.detect_and_encode(img, encode_on="somewhere")
+
     def test_face_distance(self):
         img_a1 = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
         img_a2 = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama2.jpg'))
@@ -203,6 +410,44 @@ class Test_face_recognition(unittest.TestCase):
         self.assertEqual(type(distance_results), np.ndarray)
         self.assertEqual(len(distance_results), 0)
 
+    def test_face_distance_matrix(self):
+        known = np.random.RandomState(0).rand(20, 128)
+        queries = np.random.RandomState(1).rand(4, 128)
+
+        distances = api.face_distance_matrix(queries, known)
+
+        self.assertEqual(distances.shape, (4, 20))
+        self.assertEqual(distances.dtype, np.float32)
+        for query, row in zip(queries, distances):
+            np.testing.assert_allclose(row, api.face_distance(known, query), atol=1e-4)
+
+    def test_face_distance_matrix_empty_lists(self):
+        known = np.random.RandomState(0).rand(3, 128)
+
+        self.assertEqual(api.face_distance_matrix([], known).shape, (0, 3))
+        self.assertEqual(api.face_distance_matrix(known, []).shape, (3, 0))
+        self.assertEqual(api.face_distance_matrix(known, np.array([])).shape, (3, 0))
+
+    def test_match_faces(self):
+        known = np.random.RandomState(0).rand(20, 128)
+        queries = np.vstack([known[7], known[3] + 0.001, np.full(128, 10.0)])
+
+        indices, distances, matches = api.match_faces(queries, known, tolerance=0.6, top_k=3)
+
+        self.assertEqual(indices.shape, (3, 3))
+        self.assertEqual(indices[0, 0], 7)
+        self.assertEqual(indices[1, 0], 3)
+        self.assertTrue(np.all(np.diff(distances, axis=1) >= 0))
+        self.assertEqual(matches[:, 0].tolist(), [True, True, False])
+
+    def test_match_faces_top_k_larger_than_known(self):
+        known = np.random.RandomState(0).rand(2, 128)
+
+        indices, distances, matches = api.match_faces(known, known, top_k=5)
+
+        self.assertEqual(indices.shape, (2, 2))
+        self.assertEqual(indices[:, 0].tolist(), [0, 1])
+
     def test_compare_faces(self):
         img_a1 = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
         img_a2 = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama2.jpg'))
@@ -245,6 +490,93 @@ class Test_face_recognition(unittest.TestCase):
         self.assertEqual(type(match_results), list)
         self.assertListEqual(match_results, [])
 
+    def test_models_are_not_loaded_on_import(self):
+        code = "import face_recognition.api as api; print(api.model_instance_counts())"
+        output = subprocess.check_output([sys.executable, "-c", code]).decode("utf-8")
+
+        self.assertEqual(output.strip(), "{}")
+
+    def test_preload(self):
+        load_times = api.preload(["face_detector", "pose_predictor_5_point"])
+
+        self.assertEqual(set(load_times.keys()), set(["face_detector", "pose_predictor_5_point"]))
+        self.assertTrue(all(t >= 0 for t in load_times.values()))
+        self.assertIn("face_detector", api.model_load_times())
+
+    def test_legacy_model_attributes(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+
+        self.assertEqual(len(api.face_detector(img, 1)), 1)
+        self.assertTrue(hasattr(api.face_encoder, "compute_face_descriptor"))
+        self.assertEqual(api.pose_predictor_68_point(img, api.face_detector(img, 1)[0]).num_parts, 68)
+
+    def test_model_pool_loads_one_instance_per_concurrent_caller(self):
+        pool = api._ModelPool("face_detector", max_instances=3)
+        barrier = threading.Barrier(3)
+
+        def use_model():
+            with pool.checkout():
+                barrier.wait()
+
+        threads = [threading.Thread(target=use_model) for _ in range(3)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        self.assertEqual(len(pool), 3)
+
+        # Calls that don't overlap reuse the instances that are already loaded
+        for _ in range(5):
+            with pool.checkout():
+                pass
+        self.assertEqual(len(pool), 3)
+
+    def test_model_pool_is_bounded(self):
+        pool = api._ModelPool("face_detector", max_instances=2)
+        lock = threading.Lock()
+        in_use = [0, 0]
+
+        def use_model():
+            with pool.checkout():
+                with lock:
+                    in_use[0] += 1
+                    in_use[1] = max(in_use)
+                time.sleep(0.02)
+                with lock:
+                    in_use[0] -= 1
+
+        # More threads than instances wait for one to be released instead of loading another
+        threads = [threading.Thread(target=use_model) for _ in range(6)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(in_use[1], 2)
+
+        pool.reserve(3)
+        self.assertEqual((len(pool), pool.max_instances), (3, 3))
+
+    def test_face_encodings_from_several_threads(self):
+        img = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        expected = api.face_encodings(img)[0]
+        results = []
+
+        def encode():
+            results.append(api.face_encodings(img)[0])
+
+        threads = [threading.Thread(target=encode) for _ in range(3)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(np.allclose(result, expected) for result in results))
+
+    def test_preload_instances(self):
+        api.preload(["pose_predictor_5_point"], instances=2)
+
+        self.assertGreaterEqual(api.model_instance_counts()["pose_predictor_5_point"], 2)
+
+    def test_preload_unknown_model(self):
+        with self.assertRaises(ValueError):
+            api.preload(["not_a_model"])
+
     def test_command_line_interface_options(self):
         target_string = 'Show this message and exit.'
         runner = CliRunner()
@@ -296,6 +628,105 @@ class Test_face_recognition(unittest.TestCase):
         self.assertEqual(result.exit_code, 0)
         self.assertTrue(target_string in result.output)
 
+    def test_command_line_interface_show_distance_format(self):
+        runner = CliRunner()
+        known_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, known_folder)
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), known_folder)
+        image_file = os.path.join(os.path.dirname(__file__), 'test_images', 'obama2.jpg')
+
+        result = runner.invoke(face_recognition_cli.main, args=[known_folder, image_file, "--show-distance", "1"])
+
+        self.assertEqual(result.exit_code, 0)
+        line = result.output.strip().splitlines()[-1]
+        self.assertRegex(line, r'^.*obama2\.jpg,obama,0\.\d+$')
+        expected = api.face_distance(api.face_encodings(api.load_image_file(os.path.join(known_folder, 'obama.jpg'))),
+                                     api.face_encodings(api.load_image_file(image_file, max_dimension=1600))[0])[0]
+        self.assertEqual(line.rsplit(',', 1)[1], str(expected))
+
+    def test_command_line_interface_cache_of_face_at_the_edge(self):
+        runner = CliRunner()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        known_folder = os.path.join(directory, 'known')
+        os.mkdir(known_folder)
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), known_folder)
+
+        # The face box of the cropped image sticks out of its top and left edges
+        image = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        image_file = os.path.join(directory, 'cropped.png')
+        PIL.Image.fromarray(image[160:, 370:]).save(image_file)
+
+        args = [known_folder, image_file, "--show-distance", "1"]
+        uncached = runner.invoke(face_recognition_cli.main, args=args)
+        self.assertEqual(uncached.exit_code, 0)
+        self.assertIn('cropped.png,obama,', uncached.output)
+
+        # Computed on a cache miss and read back on a cache hit
+        for _ in range(2):
+            cached = runner.invoke(face_recognition_cli.main, args=args + ["--cache-dir", os.path.join(directory, 'cache')])
+            self.assertEqual(cached.exit_code, 0)
+            self.assertEqual(cached.output, uncached.output)
+
+    def test_scan_known_people_with_known_cache(self):
+        known_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, known_folder)
+        for name in ['obama.jpg', 'biden.jpg']:
+            shutil.copy(os.path.join(os.path.dirname(__file__), 'test_images', name), known_folder)
+        known_cache = os.path.join(known_folder, 'known.npz')
+
+        encoded = []
+        original_encode = face_recognition_cli._encode_known_person
+
+        def counting_encode(args):
+            encoded.append(args[0])
+            return original_encode(args)
+
+        face_recognition_cli._encode_known_person = counting_encode
+        self.addCleanup(setattr, face_recognition_cli, '_encode_known_person', original_encode)
+
+        names, encodings = face_recognition_cli.scan_known_people(known_folder, known_cache=known_cache)
+        self.assertEqual(sorted(names), ['biden', 'obama'])
+        self.assertEqual(len(encoded), 2)
+        self.assertTrue(os.path.isfile(known_cache))
+
+        # Nothing changed, so nothing is encoded again
+        cached_names, cached_encodings = face_recognition_cli.scan_known_people(known_folder, known_cache=known_cache)
+        self.assertEqual(len(encoded), 2)
+        self.assertEqual(cached_names, names)
+        self.assertTrue(np.allclose(cached_encodings, encodings, atol=1e-6))
+
+        # Only the file that changed is encoded again
+        biden = os.path.join(known_folder, 'biden.jpg')
+        os.utime(biden, ns=(0, 0))
+        face_recognition_cli.scan_known_people(known_folder, known_cache=known_cache)
+        self.assertEqual(encoded[2:], [biden])
+
+    def test_command_line_interface_known_cache(self):
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+        image_file = os.path.join(image_folder, 'obama.jpg')
+        known_cache = os.path.join(tempfile.mkdtemp(), 'known.npz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(known_cache))
+
+        for _ in range(2):
+            result = runner.invoke(face_recognition_cli.main, args=[image_folder, image_file, "--known-cache", known_cache, "--cpus", "2"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertTrue('obama.jpg,obama' in result.output)
+
+        self.assertTrue(os.path.isfile(known_cache))
+
+    def test_command_line_interface_in_process_pool(self):
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+
+        result = runner.invoke(face_recognition_cli.main, args=[image_folder, image_folder, "--cpus", "2"])
+
+        self.assertEqual(result.exit_code, 0)
+        printed_files = [line.split(",")[0] for line in result.output.splitlines()]
+        self.assertEqual(sorted(set(printed_files), key=printed_files.index), face_recognition_cli.image_files_in_folder(image_folder))
+        self.assertTrue(os.path.join(image_folder, 'obama.jpg') + ',obama' in result.output)
+
     def test_fd_command_line_interface_options(self):
         target_string = 'Show this message and exit.'
         runner = CliRunner()
@@ -325,6 +756,103 @@ class Test_face_recognition(unittest.TestCase):
         self.assertTrue("obama3.jpg" in result.output)
         self.assertTrue("biden.jpg" in result.output)
 
+    def test_fd_command_line_interface_folder_in_process_pool(self):
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+
+        result = runner.invoke(face_detection_cli.main, args=[image_folder, "--cpus", "2"])
+        self.assertEqual(result.exit_code, 0)
+
+        # Results are printed in the order of the files in the folder
+        printed_files = [line.split(",")[0] for line in result.output.splitlines()]
+        expected_order = [f for f in face_detection_cli.image_files_in_folder(image_folder) if f in printed_files]
+        self.assertEqual(sorted(set(printed_files), key=printed_files.index), expected_order)
+        self.assertTrue(all(len(line.split(",")) == 5 for line in result.output.splitlines()))
+
+    def test_fd_command_line_interface_unordered(self):
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+
+        result = runner.invoke(face_detection_cli.main, args=[image_folder, "--cpus", "2", "--unordered"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue("obama.jpg" in result.output)
+        self.assertTrue("biden.jpg" in result.output)
+
+    def test_fd_command_line_interface_cnn_batches(self):
+        image_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_folder)
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), image_folder)
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'), os.path.join(image_folder, 'obama_copy.jpg'))
+        cache_dir = os.path.join(image_folder, 'cache')
+
+        runner = CliRunner()
+        for _ in range(2):
+            result = runner.invoke(face_detection_cli.main, args=[image_folder, "--model", "cnn", "--batch-size", "2", "--cache-dir", cache_dir])
+            self.assertEqual(result.exit_code, 0)
+
+            lines = result.output.splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertEqual([line.split(",")[1:] for line in lines], [["154", "611", "390", "375"]] * 2)
+
+    def test_fd_command_line_interface_batches_need_cnn(self):
+        runner = CliRunner()
+        image_file = os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg')
+
+        result = runner.invoke(face_detection_cli.main, args=[image_file, "--batch-size", "2"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertTrue("WARNING" in result.output)
+        self.assertTrue("obama.jpg" in result.output)
+
+    def make_test_video(self):
+        cv2 = test_video.cv2
+        if cv2 is None:
+            self.skipTest("OpenCV is needed to read video")
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        video = os.path.join(directory, 'obama.avi')
+        image = api.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        blank = np.zeros_like(image)
+        test_video.write_test_video(video, [image, blank, blank, image, image], fps=2)
+        return video
+
+    def test_fd_command_line_interface_video(self):
+        video = self.make_test_video()
+        runner = CliRunner()
+
+        result = runner.invoke(face_detection_cli.main, args=[video, "--every-nth-frame", "2"])
+        self.assertEqual(result.exit_code, 0)
+
+        # filename,frame_index,timestamp,top,right,bottom,left for every face in the sampled frames 0, 2 and 4
+        rows = [line.split(",") for line in result.output.splitlines()]
+        self.assertEqual([row[:3] for row in rows], [[video, "0", "0.000"], [video, "4", "2.000"]])
+        self.assertTrue(all(len(row) == 7 for row in rows))
+
+    def test_command_line_interface_video(self):
+        video = self.make_test_video()
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+
+        result = runner.invoke(face_recognition_cli.main, args=[image_folder, video, "--fps", "1", "--cpus", "2"])
+        self.assertEqual(result.exit_code, 0)
+
+        rows = [line.split(",") for line in result.output.splitlines()]
+        self.assertEqual([row[1] for row in rows if row[3] == "obama"], ["0", "4"])
+        self.assertEqual([row[1] for row in rows if row[3] == "no_persons_found"], ["2"])
+
+    def test_command_line_interface_invalid_video_sampling(self):
+        video = self.make_test_video()
+        runner = CliRunner()
+        image_folder = os.path.join(os.path.dirname(__file__), 'test_images')
+
+        for options in (["--every-nth-frame", "0"], ["--fps", "0"], ["--fps", "-2"]):
+            result = runner.invoke(face_detection_cli.main, args=[video] + options)
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn("Invalid value", result.output)
+
+            result = runner.invoke(face_recognition_cli.main, args=[image_folder, video] + options)
+            self.assertEqual(result.exit_code, 2)
+
     def test_fd_command_line_interface_hog_model(self):
         target_string = 'obama.jpg'
         runner = CliRunner()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_frame_ring
+----------------------------------
+
+Tests for `face_recognition.frame_ring` module.
+"""
+
+
+import multiprocessing
+import unittest
+import numpy as np
+
+from face_recognition.frame_ring import FrameRing
+
+
+def _invert_frames(frames, count):
+    for _ in range(count):
+        slot, sequence, frame = frames.receive(0, timeout=10)
+        np.subtract(255, frame, out=frame)
+        frames.submit(slot, sequence, 1)
+    frames.close()
+
+
+class Test_frame_ring(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = FrameRing((4, 6, 3), slots=3, stages=2)
+
+    def tearDown(self):
+        self.frames.close()
+        self.frames.unlink()
+
+    def test_acquire_submit_receive_release(self):
+        slot, view = self.frames.acquire()
+        self.assertEqual(view.shape, (4, 6, 3))
+        self.assertEqual(view.dtype, np.uint8)
+
+        view[:] = 7
+        self.frames.submit(slot, 42)
+
+        received_slot, sequence, received_view = self.frames.receive(timeout=1)
+        self.assertEqual((received_slot, sequence), (slot, 42))
+        self.assertTrue(np.all(received_view == 7))
+
+        self.frames.release(received_slot)
+
+    def test_acquire_without_free_slots(self):
+        slots = [self.frames.acquire(timeout=1)[0] for _ in range(3)]
+
+        self.assertIsNone(self.frames.acquire(timeout=0))
+        self.assertIsNone(self.frames.acquire(timeout=0.01))
+
+        self.frames.release(slots[1])
+        self.assertEqual(self.frames.acquire(timeout=1)[0], slots[1])
+
+    def test_receive_timeout(self):
+        self.assertIsNone(self.frames.receive(timeout=0.01))
+        self.assertIsNone(self.frames.receive(stage=1, timeout=0.01))
+
+    def test_frames_are_shared_with_other_processes(self):
+        worker = multiprocessing.Process(target=_invert_frames, args=(self.frames, 2))
+        worker.start()
+
+        for sequence in range(2):
+            slot, view = self.frames.acquire(timeout=1)
+            view[:] = sequence
+            self.frames.submit(slot, sequence)
+
+        results = {}
+        for _ in range(2):
+            slot, sequence, view = self.frames.receive(1, timeout=10)
+            results[sequence] = view.copy()
+            self.frames.release(slot)
+
+        worker.join(10)
+        self.assertEqual(worker.exitcode, 0)
+        self.assertTrue(np.all(results[0] == 255))
+        self.assertTrue(np.all(results[1] == 254))
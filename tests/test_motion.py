@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_motion
+----------------------------------
+
+Tests for `face_recognition.motion` module.
+"""
+
+
+import os
+import unittest
+
+import numpy as np
+
+import face_recognition
+from face_recognition import motion
+
+
+def _frame(square=None):
+    frame = np.full((480, 640, 3), 60, dtype=np.uint8)
+    if square is not None:
+        top, left = square
+        frame[top:top + 80, left:left + 80] = 220
+    return frame
+
+
+class Test_motion(unittest.TestCase):
+
+    def test_first_frame_is_a_single_region(self):
+        gate = face_recognition.MotionGate()
+
+        self.assertEqual(gate.update(_frame()), [(0, 640, 480, 0)])
+        self.assertEqual(gate.motion_ratio, 1.0)
+
+    def test_static_scene_has_no_regions(self):
+        gate = face_recognition.MotionGate()
+        gate.update(_frame())
+
+        for _ in range(3):
+            self.assertEqual(gate.update(_frame()), [])
+        self.assertEqual(gate.motion_ratio, 0.0)
+
+    def test_sensor_noise_is_ignored(self):
+        gate = face_recognition.MotionGate()
+        gate.update(_frame())
+
+        noisy = _frame().astype(np.int16) + np.random.RandomState(0).randint(-10, 10, (480, 640, 3))
+        self.assertEqual(gate.update(noisy.astype(np.uint8)), [])
+
+    def test_moving_square(self):
+        gate = face_recognition.MotionGate(margin=0)
+        gate.update(_frame())
+
+        regions = gate.update(_frame(square=(200, 320)))
+
+        self.assertEqual(len(regions), 1)
+        top, right, bottom, left = regions[0]
+        self.assertTrue(top <= 200 and left <= 320 and bottom >= 280 and right >= 400)
+        self.assertTrue(top >= 150 and left >= 270 and bottom <= 330 and right <= 450)
+        self.assertAlmostEqual(gate.motion_ratio, 80 * 80 / (480.0 * 640), places=2)
+
+    def test_separate_moving_squares(self):
+        gate = face_recognition.MotionGate()
+        gate.update(_frame())
+
+        frame = _frame(square=(0, 0))
+        frame[380:460, 540:620] = 220
+        regions = gate.update(frame)
+
+        self.assertEqual(len(regions), 2)
+        self.assertEqual(regions[0][0], 0)
+        self.assertGreaterEqual(regions[1][2], 460)
+
+    def test_refresh_every(self):
+        gate = face_recognition.MotionGate(refresh_every=3)
+        gate.update(_frame())
+
+        self.assertEqual(gate.update(_frame()), [])
+        self.assertEqual(gate.update(_frame()), [(0, 640, 480, 0)])
+        self.assertEqual(gate.update(_frame()), [])
+
+    def test_reset(self):
+        gate = face_recognition.MotionGate()
+        gate.update(_frame())
+        gate.reset()
+
+        self.assertEqual(gate.update(_frame()), [(0, 640, 480, 0)])
+
+    def test_grayscale_frames(self):
+        gate = face_recognition.MotionGate(margin=0)
+        gate.update(_frame()[:, :, 0])
+
+        regions = gate.update(_frame(square=(200, 320))[:, :, 0])
+
+        self.assertEqual(len(regions), 1)
+
+    def test_moving_cell_groups(self):
+        moving = np.zeros((32, 32), dtype=bool)
+        moving[0:4, 0:4] = True
+        moving[8:12, 8:12] = True
+        moving[30:32, 30:32] = True
+
+        # The first two cells touch diagonally, the last one is a single pixel cell out of 64
+        self.assertEqual(motion._moving_cell_groups(moving, 8, 0.1), [(0, 16, 16, 0)])
+        self.assertEqual(motion._moving_cell_groups(moving, 8, 0.05), [(0, 16, 16, 0), (24, 32, 32, 24)])
+
+    def test_detect_and_encode_in_motion_regions(self):
+        image = face_recognition.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        gate = face_recognition.MotionGate()
+        gate.update(np.zeros_like(image))
+
+        regions = gate.update(image)
+        locations, encodings, _ = face_recognition.detect_and_encode(image, regions=regions)
+        self.assertEqual(len(locations), 1)
+        self.assertEqual(len(encodings), 1)
+
+        locations, encodings, _ = face_recognition.detect_and_encode(image, regions=[])
+        self.assertEqual((locations, encodings), ([], []))
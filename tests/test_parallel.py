@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_parallel
+----------------------------------
+
+Tests for `face_recognition.parallel` module.
+"""
+
+
+import unittest
+
+from face_recognition.parallel import imap_in_process_pool
+
+
+class Test_parallel(unittest.TestCase):
+
+    def test_ordered_results(self):
+        results = list(imap_in_process_pool(abs, range(0, -50, -1), number_of_cpus=2, chunksize=2))
+
+        self.assertEqual(results, list(range(50)))
+
+    def test_unordered_results(self):
+        results = list(imap_in_process_pool(abs, range(0, -50, -1), number_of_cpus=2, ordered=False, chunksize=2))
+
+        self.assertEqual(sorted(results), list(range(50)))
+
+    def test_input_is_read_lazily(self):
+        read = []
+
+        def items():
+            for item in range(1000):
+                read.append(item)
+                yield item
+
+        results = imap_in_process_pool(abs, items(), number_of_cpus=2, chunksize=1, max_in_flight=10)
+        self.assertEqual([next(results) for _ in range(5)], list(range(5)))
+
+        # Only as much as max_in_flight ahead of the consumer has been read from the input
+        self.assertLessEqual(len(read), 5 + 10 + 1)
+
+        # Closing the generator early shuts the pool down
+        results.close()
+        self.assertLess(len(read), 1000)
+
+    def test_exceptions_are_raised_in_the_parent(self):
+        with self.assertRaises(TypeError):
+            list(imap_in_process_pool(abs, ["not a number"], number_of_cpus=2))
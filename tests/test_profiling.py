@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiling
+----------------------------------
+
+Tests for `face_recognition.profiling` module.
+"""
+
+
+import io
+import json
+import os
+import threading
+import unittest
+
+import face_recognition
+from face_recognition import profiling
+
+
+class Test_profiling(unittest.TestCase):
+
+    def test_stage_is_disabled_without_hooks(self):
+        self.assertIs(profiling.stage("detect", 10), profiling.stage("encode", 20))
+
+        with profiling.stage("decode") as timed:
+            timed.size = 5
+
+    def test_hooks(self):
+        calls = []
+
+        def hook(stage, start, seconds, size):
+            calls.append((stage, size))
+
+        profiling.add_hook(hook)
+        try:
+            with profiling.stage("track", 3):
+                pass
+            with profiling.stage("decode") as timed:
+                timed.size = 7
+        finally:
+            profiling.remove_hook(hook)
+
+        with profiling.stage("track", 3):
+            pass
+
+        self.assertEqual(calls, [("track", 3), ("decode", 7)])
+
+    def test_failing_hook_is_logged(self):
+        calls = []
+
+        def broken_hook(stage, start, seconds, size):
+            raise RuntimeError("broken")
+
+        def hook(stage, start, seconds, size):
+            calls.append(stage)
+
+        profiling.add_hook(broken_hook)
+        profiling.add_hook(hook)
+        try:
+            with self.assertLogs("face_recognition.profiling", level="ERROR") as logs:
+                with profiling.stage("track"):
+                    pass
+        finally:
+            profiling.remove_hook(broken_hook)
+            profiling.remove_hook(hook)
+
+        # The stage finished normally and the hooks after the broken one still ran
+        self.assertEqual(calls, ["track"])
+        self.assertIn("RuntimeError: broken", logs.output[0])
+
+    def test_profiler_records_library_stages(self):
+        image_file = os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg')
+
+        with face_recognition.Profiler() as profiler:
+            image = face_recognition.load_image_file(image_file)
+            encodings = face_recognition.face_encodings(image, num_jitters=2)
+            face_recognition.face_distance_matrix(encodings, [encodings[0]] * 3)
+
+        stats = profiler.stats()
+        self.assertEqual(sorted(stats), ["decode", "detect", "encode", "landmarks", "match"])
+        self.assertEqual(stats["decode"]["size"], image.shape[0] * image.shape[1])
+        self.assertEqual(stats["detect"]["size"], image.shape[0] * image.shape[1] * 4)
+        self.assertEqual(stats["landmarks"]["size"], 1)
+        self.assertEqual(stats["encode"]["size"], 2)
+        self.assertEqual(stats["match"]["size"], 3)
+        for stage_stats in stats.values():
+            self.assertEqual(stage_stats["calls"], 1)
+            self.assertGreater(stage_stats["seconds"], 0)
+
+        # Nothing is recorded once the profiler is stopped
+        face_recognition.face_distance([encodings[0]], encodings[0])
+        self.assertEqual(profiler.stats()["match"]["calls"], 1)
+
+    def test_current_thread_only(self):
+        with profiling.Profiler(current_thread_only=True) as profiler:
+            with profiling.stage("main"):
+                pass
+
+            def other_thread():
+                with profiling.stage("other"):
+                    pass
+
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(list(profiler.stats()), ["main"])
+
+    def test_to_prometheus(self):
+        profiler = profiling.Profiler()
+        profiler("detect", 0.0, 0.5, 100)
+        profiler("detect", 1.0, 0.25, 100)
+
+        text = profiler.to_prometheus(labels={"camera": 'front "door"'})
+
+        self.assertIn("# TYPE face_recognition_stage_seconds_total counter", text)
+        self.assertIn('face_recognition_stage_seconds_total{stage="detect",camera="front \\"door\\""} 0.75', text)
+        self.assertIn('face_recognition_stage_calls_total{stage="detect",camera="front \\"door\\""} 2', text)
+        self.assertIn('face_recognition_stage_size_total{stage="detect",camera="front \\"door\\""} 200', text)
+
+    def test_chrome_trace(self):
+        profiler = profiling.Profiler(trace=True, max_events=2)
+        for start in range(3):
+            profiler("encode", start, 0.001, 1)
+
+        output = io.StringIO()
+        profiler.write_chrome_trace(output)
+        trace = json.loads(output.getvalue())
+
+        self.assertEqual(len(trace["traceEvents"]), 2)
+        self.assertEqual(trace["otherData"]["dropped_events"], 1)
+        event = trace["traceEvents"][1]
+        self.assertEqual((event["name"], event["ph"], event["ts"], event["dur"]), ("encode", "X", 1e6, 1000.0))
+        self.assertEqual(profiler.stats()["encode"]["calls"], 3)
+
+    def test_prometheus_text_of_several_profilers(self):
+        front, back = profiling.Profiler(), profiling.Profiler()
+        front("detect", 0.0, 0.5, 100)
+        back("detect", 0.0, 0.25, 100)
+
+        lines = profiling.prometheus_text([({"camera": "front"}, front), ({"camera": "back"}, back)]).splitlines()
+
+        self.assertEqual(lines.count("# TYPE face_recognition_stage_seconds_total counter"), 1)
+        start = lines.index("# TYPE face_recognition_stage_seconds_total counter")
+        self.assertEqual(lines[start + 1:start + 3], [
+            'face_recognition_stage_seconds_total{stage="detect",camera="front"} 0.5',
+            'face_recognition_stage_seconds_total{stage="detect",camera="back"} 0.25',
+        ])
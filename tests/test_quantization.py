@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_quantization
+----------------------------------
+
+Tests for `face_recognition.quantization` module.
+"""
+
+
+import unittest
+import pickle
+import numpy as np
+
+from face_recognition.quantization import QuantizedEncodings
+
+
+class Test_quantization(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.encodings = random.normal(0, 0.1, (500, 128))
+        self.queries = self.encodings[:10] + random.normal(0, 0.02, (10, 128))
+        self.exact = np.linalg.norm(self.encodings[np.newaxis] - self.queries[:, np.newaxis], axis=2)
+
+    def test_from_encodings(self):
+        int8 = QuantizedEncodings.from_encodings(self.encodings, "int8")
+        float16 = QuantizedEncodings.from_encodings(self.encodings, "float16")
+
+        self.assertEqual(int8.codes.dtype, np.int8)
+        self.assertEqual(float16.codes.dtype, np.float16)
+        self.assertEqual(len(int8), 500)
+        self.assertEqual(int8.dimensions, 128)
+        self.assertLess(int8.nbytes, self.encodings.nbytes / 7)
+        self.assertLess(float16.nbytes, self.encodings.nbytes / 3.5)
+
+        self.assertTrue(np.allclose(int8.decode(), self.encodings, atol=0.01))
+        self.assertTrue(np.allclose(float16.decode(), self.encodings, atol=0.001))
+
+    def test_unsupported_dtype(self):
+        with self.assertRaises(ValueError):
+            QuantizedEncodings.from_encodings(self.encodings, "uint4")
+
+        with self.assertRaises(ValueError):
+            QuantizedEncodings(self.encodings)
+
+    def test_distances(self):
+        for dtype in ("int8", "float16"):
+            gallery = QuantizedEncodings.from_encodings(self.encodings, dtype, block_size=64)
+            distances = gallery.distances(self.queries)
+
+            self.assertEqual(distances.shape, (10, 500))
+            self.assertEqual(distances.dtype, np.float32)
+            self.assertTrue(np.allclose(distances, self.exact, atol=0.02))
+
+    def test_search(self):
+        gallery = QuantizedEncodings.from_encodings(self.encodings, "int8", block_size=64)
+        rows, distances = gallery.search(self.queries, k=3)
+
+        self.assertEqual(rows.shape, (10, 3))
+        self.assertEqual(rows[:, 0].tolist(), list(range(10)))
+        self.assertTrue(np.all(np.diff(distances, axis=1) >= 0))
+
+    def test_search_with_rerank(self):
+        gallery = QuantizedEncodings.from_encodings(self.encodings, "int8", keep_exact=True, block_size=64)
+        rows, distances = gallery.search(self.queries, k=5, rerank=20)
+
+        self.assertEqual(rows.tolist(), np.argsort(self.exact, axis=1)[:, :5].tolist())
+        self.assertTrue(np.allclose(distances, np.sort(self.exact, axis=1)[:, :5], atol=1e-5))
+
+    def test_search_with_rerank_needs_exact_encodings(self):
+        gallery = QuantizedEncodings.from_encodings(self.encodings, "float16")
+
+        with self.assertRaises(ValueError):
+            gallery.search(self.queries, rerank=10)
+
+    def test_search_small_gallery(self):
+        gallery = QuantizedEncodings.from_encodings(self.encodings[:2], "int8", keep_exact=True)
+        rows, distances = gallery.search(self.queries[:1], k=5, rerank=10)
+
+        self.assertEqual(rows.shape, (1, 2))
+
+        rows, distances = QuantizedEncodings.from_encodings(np.empty((0, 128))).search(self.queries, k=5)
+        self.assertEqual(rows.shape, (10, 0))
+
+    def test_pickle(self):
+        gallery = QuantizedEncodings.from_encodings(self.encodings, "int8")
+        restored = pickle.loads(pickle.dumps(gallery))
+
+        self.assertLess(len(pickle.dumps(gallery)), len(pickle.dumps(self.encodings)) / 6)
+        self.assertTrue(np.array_equal(restored.distances(self.queries), gallery.distances(self.queries)))
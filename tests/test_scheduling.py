@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scheduling
+----------------------------------
+
+Tests for `face_recognition.scheduling` module.
+"""
+
+
+import unittest
+
+import face_recognition
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _run(scheduler, clock, frames, display_seconds, detect_seconds_at_640):
+    # Runs frames whose detection cost grows with the square of the detection width
+    detections = 0
+    for _ in range(frames):
+        plan = scheduler.begin_frame()
+        if plan["detect"]:
+            detections += 1
+            with scheduler.measure("detect"):
+                clock.now += detect_seconds_at_640 * ((plan["detect_width"] or 640) / 640.0) ** 2
+        clock.now += display_seconds
+        scheduler.end_frame()
+    return detections
+
+
+class Test_scheduling(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_detects_every_frame_at_best_quality_when_cheap(self):
+        scheduler = face_recognition.DetectionScheduler(target_fps=10, clock=self.clock)
+
+        self.assertEqual(_run(scheduler, self.clock, 20, 0.01, 0.02), 20)
+
+        decision = scheduler.decision()
+        self.assertEqual((decision["level"], decision["stride"], decision["detect_width"], decision["yolo_imgsz"]),
+                         (0, 1, 960, 640))
+        self.assertFalse(decision["overloaded"])
+        self.assertAlmostEqual(decision["display_seconds"], 0.01)
+        self.assertAlmostEqual(decision["stage_seconds"]["detect"], 0.045)
+
+    def test_lowers_resolution_to_meet_staleness(self):
+        scheduler = face_recognition.DetectionScheduler(target_fps=10, max_staleness=0.3, clock=self.clock)
+
+        detections = _run(scheduler, self.clock, 20, 0.04, 0.1)
+
+        # 960 and 800 pixels wide would need a stride over 3 frames, 640 needs 2
+        decision = scheduler.decision()
+        self.assertEqual((decision["detect_width"], decision["stride"]), (640, 2))
+        self.assertEqual(detections, 10)
+        self.assertAlmostEqual(decision["expected_fps"], 10)
+
+    def test_overloaded(self):
+        scheduler = face_recognition.DetectionScheduler(target_fps=10, max_staleness=0.3, clock=self.clock)
+
+        _run(scheduler, self.clock, 10, 0.05, 8.0)
+
+        decision = scheduler.decision()
+        self.assertTrue(decision["overloaded"])
+        self.assertEqual((decision["detect_width"], decision["stride"]), (320, 3))
+        self.assertLess(decision["expected_fps"], 10)
+
+    def test_max_staleness_forces_detection(self):
+        scheduler = face_recognition.DetectionScheduler(target_fps=10, max_staleness=1.0, clock=self.clock)
+        _run(scheduler, self.clock, 20, 0.05, 0.4)
+        self.assertEqual(scheduler.decision()["stride"], 8)
+
+        while not scheduler.begin_frame()["detect"]:
+            scheduler.end_frame()
+        scheduler.end_frame()
+
+        self.assertFalse(scheduler.begin_frame()["detect"])
+        self.clock.now += 1.0
+        scheduler.end_frame()
+        self.assertTrue(scheduler.begin_frame()["detect"])
+
+    def test_stride_only(self):
+        scheduler = face_recognition.DetectionScheduler(target_fps=10, levels=[(None, None)], clock=self.clock)
+
+        self.assertEqual(_run(scheduler, self.clock, 20, 0.05, 0.2), 5)
+
+        decision = scheduler.decision()
+        self.assertEqual((decision["stride"], decision["detect_width"], decision["yolo_imgsz"]), (4, None, None))
+
+        with self.assertRaises(ValueError):
+            face_recognition.DetectionScheduler(levels=[])
+
+    def test_group_backs_off_when_cameras_are_added(self):
+        group = face_recognition.SchedulerGroup(cores=1, target_fps=10, clock=self.clock)
+        front = group.add("front")
+        _run(front, self.clock, 20, 0.02, 0.06)
+        alone = front.decision()
+
+        # The new share is only applied by the camera thread, when it starts its next frame
+        group.add("back")
+        self.assertEqual(front.decision()["share"], 1.0)
+        shared = front.begin_frame()
+        self.assertEqual((len(group), shared["share"]), (2, 0.5))
+        self.assertGreater(shared["stride"], alone["stride"])
+        self.assertEqual(sorted(group.decisions()), ["back", "front"])
+
+        group.remove("back")
+        self.assertEqual(front.decision()["share"], 0.5)
+        self.clock.now += 0.02
+        front.end_frame()
+        self.assertEqual(front.decision()["share"], 1.0)
+        self.assertEqual(front.decision()["stride"], alone["stride"])
+        self.assertNotIn("back", group)
+        self.assertIs(group.get("front"), front)
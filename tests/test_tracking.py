@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_tracking
+----------------------------------
+
+Tests for `face_recognition.tracking` module.
+"""
+
+
+import os
+import unittest
+
+import numpy as np
+
+import face_recognition
+from face_recognition import tracking
+
+
+def _textured_frame(top, left):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    frame[top:top + 60, left:left + 60] = np.random.RandomState(0).randint(0, 255, (60, 60, 1))
+    return frame
+
+
+class Test_tracking(unittest.TestCase):
+
+    def setUp(self):
+        self.blank = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def test_stable_track_ids(self):
+        tracker = face_recognition.FaceTracker()
+
+        first = tracker.update(self.blank, [(10, 110, 110, 10), (200, 400, 300, 300)])
+        second = tracker.update(self.blank, [(205, 410, 305, 310), (12, 115, 112, 15)])
+
+        self.assertEqual([track.id for track in first], [1, 2])
+        self.assertEqual([track.id for track in second], [2, 1])
+        self.assertEqual(second[1].location, (12, 115, 112, 15))
+        self.assertEqual(second[1].hits, 2)
+
+    def test_new_and_missing_faces(self):
+        tracker = face_recognition.FaceTracker(max_missed=2)
+        tracker.update(self.blank, [(10, 110, 110, 10)])
+
+        tracks = tracker.update(self.blank, [(300, 600, 400, 500)])
+        self.assertEqual([track.id for track in tracks], [2])
+        self.assertEqual(sorted(track.id for track in tracker.tracks), [1, 2])
+
+        tracker.update(self.blank, [(300, 600, 400, 500)])
+        tracker.update(self.blank, [(300, 600, 400, 500)])
+        self.assertEqual([track.id for track in tracker.tracks], [2])
+
+        # Ids are never reused, even after reset()
+        tracker.reset()
+        self.assertEqual(tracker.update(self.blank, [(10, 110, 110, 10)])[0].id, 3)
+
+    def test_fast_moving_face_is_matched_by_center(self):
+        tracker = face_recognition.FaceTracker(max_center_shift=0.5)
+        tracker.update(self.blank, [(100, 200, 200, 100)])
+
+        # No overlap at all, but the center only moved 0.4 face widths
+        self.assertEqual(tracker.update(self.blank, [(100, 240, 200, 140)])[0].id, 1)
+        self.assertEqual(tracker.update(self.blank, [(100, 400, 200, 300)])[0].id, 2)
+
+    def test_encode_once_per_track(self):
+        image = face_recognition.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        location = face_recognition.face_locations(image)[0]
+        tracker = face_recognition.FaceTracker(reencode_every=3)
+
+        tracks = tracker.update(image, [location])
+        self.assertEqual(tracker.encode(image, tracks), tracks)
+        self.assertTrue(np.allclose(tracks[0].encoding, face_recognition.face_encodings(image, [location])[0]))
+        tracks[0].identity = ("obama", 0.0)
+
+        for _ in range(2):
+            tracks = tracker.update(image, [location])
+            self.assertEqual(tracker.encode(image, tracks), [])
+
+        tracks = tracker.update(image, [location])
+        self.assertEqual(tracker.encode(image), tracks)
+        self.assertEqual(tracks[0].identity, ("obama", 0.0))
+
+    def test_encode_again_on_appearance_change(self):
+        image = face_recognition.load_image_file(os.path.join(os.path.dirname(__file__), 'test_images', 'obama.jpg'))
+        location = face_recognition.face_locations(image)[0]
+        tracker = face_recognition.FaceTracker(reencode_every=None)
+
+        tracks = tracker.update(image, [location])
+        tracker.encode(image, tracks)
+        self.assertFalse(tracker.needs_encoding(tracks[0], image))
+
+        changed = image.copy()
+        top, right, bottom, left = location
+        changed[top:bottom, left:right] = 255 - changed[top:bottom, left:right]
+        self.assertTrue(tracker.needs_encoding(tracks[0], changed))
+
+    def test_follow_with_optical_flow(self):
+        tracker = face_recognition.FaceTracker(follow="flow")
+        tracker.update(_textured_frame(80, 100), [(80, 160, 140, 100)])
+
+        tracks = tracker.follow(_textured_frame(84, 106))
+
+        self.assertEqual(tracks[0].location, (84, 166, 144, 106))
+
+    def test_follow_without_follow_method(self):
+        tracker = face_recognition.FaceTracker()
+        tracker.update(_textured_frame(80, 100), [(80, 160, 140, 100)])
+
+        self.assertEqual(tracker.follow(_textured_frame(84, 106))[0].location, (80, 160, 140, 100))
+
+    def test_follow_with_opencv_tracker(self):
+        import cv2
+        if not hasattr(cv2, "TrackerMIL_create"):
+            self.skipTest("OpenCV has no MIL tracker")
+
+        tracker = face_recognition.FaceTracker(follow="mil")
+        tracker.update(_textured_frame(80, 100), [(80, 160, 140, 100)])
+
+        top, right, bottom, left = tracker.follow(_textured_frame(84, 106))[0].location
+        self.assertTrue(abs(top - 84) <= 4 and abs(left - 106) <= 4)
+
+    def test_unknown_opencv_tracker(self):
+        with self.assertRaises(ValueError):
+            face_recognition.FaceTracker(follow="no_such_tracker")
+
+    def test_iou_matrix(self):
+        iou = tracking._iou_matrix([(0, 10, 10, 0), (0, 20, 10, 10)], [(0, 10, 10, 0), (0, 15, 10, 5), (50, 60, 60, 50)])
+
+        self.assertTrue(np.allclose(iou, [[1.0, 1.0 / 3, 0.0], [0.0, 1.0 / 3, 0.0]]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_video
+----------------------------------
+
+Tests for `face_recognition.video` module.
+"""
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from face_recognition.video import is_video_source, iter_video_frames
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def write_test_video(path, frames, fps=10):
+    """
+    Writes a list of RGB frames to a Motion JPEG .avi file
+    """
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for frame in frames:
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    writer.release()
+
+
+class Test_video(unittest.TestCase):
+
+    def test_is_video_source(self):
+        self.assertTrue(is_video_source("archive/clip.MP4"))
+        self.assertTrue(is_video_source("camera.avi"))
+        self.assertTrue(is_video_source("rtsp://10.0.0.2/stream"))
+        self.assertFalse(is_video_source("obama.jpg"))
+        self.assertFalse(is_video_source("known_people"))
+
+
+@unittest.skipIf(cv2 is None, "OpenCV is needed to read video")
+class Test_video_frames(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.video = os.path.join(self.directory, "clip.avi")
+
+        # Each frame's brightness is its frame index times 10, so frames can be told apart after compression
+        write_test_video(self.video, [np.full((48, 64, 3), index * 10, dtype=np.uint8) for index in range(20)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_every_nth_frame(self):
+        frames = list(iter_video_frames(self.video, every_nth_frame=5))
+
+        self.assertEqual([frame_index for frame_index, _, _ in frames], [0, 5, 10, 15])
+        self.assertEqual([timestamp for _, timestamp, _ in frames], [0.0, 0.5, 1.0, 1.5])
+        self.assertEqual(frames[0][2].shape, (48, 64, 3))
+        self.assertTrue(all(abs(int(frame.mean()) - frame_index * 10) <= 3 for frame_index, _, frame in frames))
+
+    def test_fps(self):
+        frames = list(iter_video_frames(self.video, fps=4))
+
+        # 10 fps video sampled at 4 fps: one frame every 0.25 seconds, rounded up to the next frame
+        self.assertEqual([frame_index for frame_index, _, _ in frames], [0, 3, 5, 8, 10, 13, 15, 18])
+
+    def test_invalid_sampling(self):
+        for options in ({"every_nth_frame": 0}, {"fps": 0}, {"fps": -1.0}):
+            with self.assertRaises(ValueError):
+                iter_video_frames(self.video, **options)
+
+    def test_missing_video(self):
+        with self.assertRaises(IOError):
+            list(iter_video_frames(os.path.join(self.directory, "missing.avi")))